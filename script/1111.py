@@ -1,482 +1,317 @@
 import os
+import io
+import sys
+import re
+import shutil
+import builtins
+import platform
 import sqlite3
 import json
+import pickle
 import csv
 import yaml
-import xml.etree.ElementTree as ET
 import hashlib
+import hmac
+import secrets
+import argparse
+import random
+import time
+import resource
+import math
+import heapq
+import bisect
+import threading
+import itertools
+import collections
+import contextlib
+import asyncio
+import concurrent.futures
+import urllib.parse
+import ipaddress
+import zipfile
+import multiprocessing
+from http import HTTPStatus
+from xml.sax.saxutils import XMLGenerator
 
+from cache import LRUCache
+from metrics import Metrics
+from storage import WRITE_BATCH_DELAY, WRITE_BATCH_SIZE, ConnectionPool, WriteBatcher, connect
 
-def hash_password(password, salt):
-    hash_obj = hashlib.sha256()
-    hash_obj.update(f"{password}{salt}".encode('utf-8'))
-    return hash_obj.hexdigest()
-
-
-def verify_password(password, stored_hash, salt):
-    hash_obj = hashlib.sha256()
-    hash_obj.update(f"{password}{salt}".encode('utf-8'))
-    return hash_obj.hexdigest() == stored_hash
-
-
-def login_user(conn, user_type):
-    cursor = conn.cursor()
-
-    print(f"\n=== Авторизация {user_type}а ===")
-
-    username = input("Введите ФИО: ")
-    password = input("Введите пароль: ")
-
-    try:
-        if user_type == "driver":
-            cursor.execute("""
-                SELECT d.Driver_id, d.Username, d.Rating, dc.PasswordHash, dc.Salt 
-                FROM Drivers d
-                JOIN DriverCredentials dc ON d.Driver_id = dc.Driver_id
-                WHERE d.Username = ?
-            """, (username,))
-
-            user_data = cursor.fetchone()
-
-            if user_data and verify_password(password, user_data[3], user_data[4]):
-                print(f"\n✓ Успешный вход! Добро пожаловать, {user_data[1]}!")
-                return {
-                    'id': user_data[0],
-                    'username': user_data[1],
-                    'rating': user_data[2],
-                    'type': 'driver'
-                }
-
-        elif user_type == "passenger":
-            cursor.execute("""
-                SELECT p.Passenger_id, p.Username, p.Rating, pc.PasswordHash, pc.Salt 
-                FROM Passengers p
-                JOIN PassengerCredentials pc ON p.Passenger_id = pc.Passenger_id
-                WHERE p.Username = ?
-            """, (username,))
-
-            user_data = cursor.fetchone()
-
-            if user_data and verify_password(password, user_data[3], user_data[4]):
-                print(f"\n✓ Успешный вход! Добро пожаловать, {user_data[1]}!")
-                return {
-                    'id': user_data[0],
-                    'username': user_data[1],
-                    'rating': user_data[2],
-                    'type': 'passenger'
-                }
-
-        print("\n✗ Ошибка: Неверное имя пользователя или пароль!")
-        return None
-
-    except sqlite3.Error as e:
-        print(f"\n✗ Ошибка при авторизации: {e}")
-        return None
-
-
-def show_user_menu(conn, user):
-    cursor = conn.cursor()
-
-    while True:
-        print(f"\n{'=' * 40}")
-        print(f"МЕНЮ: {user['username']} ({user['type']})")
-        print(f"{'=' * 40}")
-        print("1. 📋 Просмотреть мои заказы")
-        print("2. 🔔 Просмотреть уведомления")
-        print("3. 🗑️ Удалить заказ (физическое удаление)")
-        print("4. 🚪 Выйти из аккаунта")
-
-        if user['type'] == 'driver':
-            print("5. 📦 Просмотреть доступные заказы")
-            print("6. ✅ Принять заказ")
-        elif user['type'] == 'passenger':
-            print("2. 🔔 Просмотреть уведомления")
-            print("5. 🚕 Создать новый заказ")
-
-        choice = input("\nВыберите действие (1-6): ")
-
-        if choice == '1':
-            show_user_orders(cursor, user)
-        elif choice == '2':
-            show_notifications(cursor, user)
-        elif choice == '3':
-            delete_order(conn, cursor, user)
-        elif choice == '4':
-            print("\nВыход из аккаунта...")
-            break
-        elif choice == '5' and user['type'] == 'driver':
-            show_available_orders(cursor)
-        elif choice == '6' and user['type'] == 'driver':
-            accept_order(conn, cursor, user)
-        elif choice == '5' and user['type'] == 'passenger':
-            create_order(conn, cursor, user)
-        else:
-            print("\n✗ Неверный выбор! Попробуйте снова.")
-
-
-def show_user_orders(cursor, user):
-    if user['type'] == 'driver':
-        cursor.execute("""
-            SELECT o.Orders_id, p.Username, a.Delivery_address, a.Final_address, 
-                   a.Time_order, a.Price, a.Distance_km
-            FROM Orders o
-            JOIN Passengers p ON o.Passenger_id = p.Passenger_id
-            JOIN About_orders a ON o.About_orders_id = a.About_orders_id
-            WHERE o.Driver_id = ?
-        """, (user['id'],))
-    else:
-        cursor.execute("""
-            SELECT o.Orders_id, d.Username, a.Delivery_address, a.Final_address, 
-                   a.Time_order, a.Price, a.Distance_km
-            FROM Orders o
-            LEFT JOIN Drivers d ON o.Driver_id = d.Driver_id
-            JOIN About_orders a ON o.About_orders_id = a.About_orders_id
-            WHERE o.Passenger_id = ?
-        """, (user['id'],))
-
-    orders = cursor.fetchall()
-
-    if orders:
-        print(f"\n📋 Ваши заказы ({len(orders)}):")
-        print("-" * 90)
-        for order in orders:
-            print(f"   ID заказа: {order[0]}")
-            if user['type'] == 'driver':
-                print(f"   Пассажир: {order[1]}")
-            else:
-                print(f"   Водитель: {order[1] if order[1] else 'Ожидание водителя...'}")
-            print(f"   Откуда: {order[2]}")
-            print(f"   Куда: {order[3]}")
-            print(f"   Время: {order[4]}")
-            print(f"   Цена: {order[5]} руб.")
-            print(f"   Расстояние: {order[6]} км")
-            print("-" * 90)
-    else:
-        print("\n📭 У вас пока нет заказов.")
-
-
-def show_notifications(cursor, user):
-    if user['type'] == 'passenger':
-        cursor.execute("""
-            SELECT notification_id, message, CreatedAt 
-            FROM Notification 
-            WHERE Passenger_id = ? AND IsRead = 0
-            ORDER BY CreatedAt DESC
-        """, (user['id'],))
-    else:
-        print("\nℹ️ Уведомления доступны только для пассажиров.")
-        return
-
-    notifications = cursor.fetchall()
-
-    if notifications:
-        print(f"\n🔔 Ваши уведомления ({len(notifications)}):")
-        print("-" * 60)
-        for notification in notifications:
-            print(f"   ID: {notification[0]}")
-            print(f"   Сообщение: {notification[1]}")
-            print(f"   Время: {notification[2]}")
-            print("-" * 60)
-
-        cursor.execute("""
-            UPDATE Notification 
-            SET IsRead = 1 
-            WHERE Passenger_id = ? AND IsRead = 0
-        """, (user['id'],))
-    else:
-        print("\n📭 У вас нет новых уведомлений.")
-
-
-def delete_order(conn, cursor, user):
-    try:
-        print(f"\n{'=' * 60}")
-        print("🗑️  УДАЛЕНИЕ ЗАКАЗА ИЗ БАЗЫ ДАННЫХ")
-        print("=" * 60)
-        print("⚠️  ВНИМАНИЕ: Это действие НЕОБРАТИМО!")
-        print("   Заказ будет полностью удален из базы данных.")
-        print("-" * 60)
-
-        if user['type'] == 'driver':
-            cursor.execute("""
-                SELECT o.Orders_id, p.Username, a.Delivery_address, a.Final_address
-                FROM Orders o
-                JOIN Passengers p ON o.Passenger_id = p.Passenger_id
-                JOIN About_orders a ON o.About_orders_id = a.About_orders_id
-                WHERE o.Driver_id = ?
-            """, (user['id'],))
-        else:
-            cursor.execute("""
-                SELECT o.Orders_id, d.Username, a.Delivery_address, a.Final_address
-                FROM Orders o
-                LEFT JOIN Drivers d ON o.Driver_id = d.Driver_id
-                JOIN About_orders a ON o.About_orders_id = a.About_orders_id
-                WHERE o.Passenger_id = ?
-            """, (user['id'],))
-
-        orders = cursor.fetchall()
-
-        if not orders:
-            print("У вас нет заказов для удаления.")
-            return
-
-        print("\n📋 Ваши заказы:")
-        print("-" * 70)
-        for order in orders:
-            if user['type'] == 'driver':
-                print(f"   ID: {order[0]}, Пассажир: {order[1]}")
-                print(f"      Откуда: {order[2]}")
-                print(f"      Куда: {order[3]}")
-            else:
-                print(f"   ID: {order[0]}, Водитель: {order[1] if order[1] else 'Не назначен'}")
-                print(f"      Откуда: {order[2]}")
-                print(f"      Куда: {order[3]}")
-            print("-" * 70)
-
-        order_id = input("\nВведите ID заказа для удаления: ")
-
-        if not order_id.isdigit():
-            print("\n✗ Ошибка: ID заказа должен быть числом!")
-            return
-
-        if user['type'] == 'driver':
-            cursor.execute("""
-                SELECT o.Orders_id, o.Passenger_id, a.About_orders_id, p.Username
-                FROM Orders o
-                JOIN About_orders a ON o.About_orders_id = a.About_orders_id
-                JOIN Passengers p ON o.Passenger_id = p.Passenger_id
-                WHERE o.Orders_id = ? AND o.Driver_id = ?
-            """, (order_id, user['id']))
-        else:
-            cursor.execute("""
-                SELECT o.Orders_id, o.Passenger_id, a.About_orders_id, d.Username
-                FROM Orders o
-                JOIN About_orders a ON o.About_orders_id = a.About_orders_id
-                LEFT JOIN Drivers d ON o.Driver_id = d.Driver_id
-                WHERE o.Orders_id = ? AND o.Passenger_id = ?
-            """, (order_id, user['id']))
-
-        order_data = cursor.fetchone()
-
-        if not order_data:
-            print(f"\n✗ Ошибка: Заказ с ID {order_id} не найден или не принадлежит вам!")
-            return
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-        print(f"\n📄 Информация о заказе #{order_id}:")
-        print("-" * 50)
-        if user['type'] == 'driver':
-            print(f"   Пассажир: {order_data[3]}")
-        else:
-            print(f"   Водитель: {order_data[3] if order_data[3] else 'Не назначен'}")
-
-        print(f"\n{'!' * 60}")
-        print("⚠️  ВНИМАНИЕ! ⚠️")
-        print(f"Вы собираетесь ФИЗИЧЕСКИ удалить заказ #{order_id}!")
-        print(f"Это действие НЕЛЬЗЯ отменить!")
-        print(f"{'!' * 60}")
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
-        confirm1 = input(f"\nДля подтверждения введите 'УДАЛИТЬ': ")
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
 
-        if confirm1 != 'УДАЛИТЬ':
-            print("❌ Удаление отменено.")
-            return
+ARCHIVE_TABLES = {
+    "Orders": "ArchivedOrders",
+    "About_orders": "ArchivedAbout_orders",
+    "Notification": "ArchivedNotification",
+}
 
-        confirm2 = input(f"\nПоследнее подтверждение. Введите 'ДА, УДАЛИТЬ': ")
 
-        if confirm2 != 'ДА, УДАЛИТЬ':
-            print("❌ Удаление отменено.")
-            return
+def live_tables(query):
+    return query.format(**{table.lower(): table for table in ARCHIVE_TABLES})
 
-        passenger_id = order_data[1]
-        about_order_id = order_data[2]
 
-        cursor.execute("DELETE FROM Orders WHERE Orders_id = ?", (order_id,))
-        print(f"✓ Запись Orders #{order_id} удалена")
+def with_archive(query, tail=""):
+    archived = query.format(**{table.lower(): archive for table, archive in ARCHIVE_TABLES.items()})
+    return f"{live_tables(query)}    UNION ALL{archived}{tail}"
 
-        cursor.execute("""
-            SELECT COUNT(*) FROM Orders WHERE About_orders_id = ?
-        """, (about_order_id,))
 
-        other_orders_count = cursor.fetchone()[0]
+ANALYTICS_CONTRIBUTION = """
+        INSERT INTO DriverStats (Driver_id, Trips, Revenue, DistanceKm)
+        SELECT {row}.Driver_id, {sign}, {sign} * {price}, {sign} * {distance}
+        FROM {source} AND {row}.Driver_id IS NOT NULL
+        ON CONFLICT (Driver_id) DO UPDATE SET Trips = Trips + excluded.Trips,
+            Revenue = Revenue + excluded.Revenue, DistanceKm = DistanceKm + excluded.DistanceKm;
+        INSERT INTO PassengerStats (Passenger_id, Orders, Trips, Spent, DistanceKm)
+        SELECT {row}.Passenger_id, {sign}, {sign} * ({row}.Driver_id IS NOT NULL),
+               {sign} * ({row}.Driver_id IS NOT NULL) * {price}, {sign} * ({row}.Driver_id IS NOT NULL) * {distance}
+        FROM {source}
+        ON CONFLICT (Passenger_id) DO UPDATE SET Orders = Orders + excluded.Orders, Trips = Trips + excluded.Trips,
+            Spent = Spent + excluded.Spent, DistanceKm = DistanceKm + excluded.DistanceKm;
+        INSERT INTO HourlyStats (Hour, Orders, Trips, Revenue, DistanceKm)
+        SELECT strftime('%Y-%m-%d %H:00', {row}.CreatedAt), {sign}, {sign} * ({row}.Driver_id IS NOT NULL),
+               {sign} * ({row}.Driver_id IS NOT NULL) * {price}, {sign} * ({row}.Driver_id IS NOT NULL) * {distance}
+        FROM {source}
+        ON CONFLICT (Hour) DO UPDATE SET Orders = Orders + excluded.Orders, Trips = Trips + excluded.Trips,
+            Revenue = Revenue + excluded.Revenue, DistanceKm = DistanceKm + excluded.DistanceKm;
+"""
 
-        if other_orders_count == 0:
-            cursor.execute("DELETE FROM About_orders WHERE About_orders_id = ?", (about_order_id,))
-            print(f"✓ Детали заказа About_orders #{about_order_id} удалены")
+ANALYTICS_ORDER_SOURCE = "About_orders a WHERE a.About_orders_id = {row}.About_orders_id"
+ANALYTICS_ARCHIVED_SOURCE = "ArchivedAbout_orders a WHERE a.About_orders_id = {row}.About_orders_id"
+ANALYTICS_ABOUT_SOURCE = "Orders o WHERE o.About_orders_id = NEW.About_orders_id"
 
-        if user['type'] == 'driver':
-            cursor.execute("""
-                INSERT INTO Notification (Passenger_id, message)
-                VALUES (?, ?)
-            """, (passenger_id, f"Водитель {user['username']} удалил заказ #{order_id} из системы."))
-            print(f"✓ Пассажир #{passenger_id} уведомлен об удалении")
-        else:
-            cursor.execute("""
-                INSERT INTO Notification (Passenger_id, message)
-                VALUES (?, ?)
-            """, (user['id'], f"Вы удалили свой заказ #{order_id} из системы."))
-            print(f"✓ Вы уведомлены об удалении заказа")
 
-        conn.commit()
-        print(f"\n✅ Заказ #{order_id} успешно УДАЛЕН из базы данных!")
-        print("⚠️  Восстановление данных НЕВОЗМОЖНО!")
+def analytics_contribution(row, sign, price="a.Price", distance="a.Distance_km", source=ANALYTICS_ORDER_SOURCE):
+    return ANALYTICS_CONTRIBUTION.format(row=row, sign=sign, price=price, distance=distance,
+                                         source=source.format(row=row))
 
-    except sqlite3.Error as e:
-        print(f"\n✗ Ошибка при удалении заказа: {e}")
-        conn.rollback()
-        print("❌ Удаление отменено из-за ошибки.")
 
+ANALYTICS_TRIGGERS = f"""
+    CREATE TRIGGER IF NOT EXISTS trg_orders_stats_insert
+    AFTER INSERT ON Orders
+    BEGIN
+        {analytics_contribution("NEW", 1)}
+    END;
 
-def show_available_orders(cursor):
-    cursor.execute("""
-        SELECT a.About_orders_id, p.Username, a.Delivery_address, a.Final_address, 
-               a.Time_order, a.Price, a.Distance_km, o.Orders_id
-        FROM About_orders a
-        LEFT JOIN Orders o ON a.About_orders_id = o.About_orders_id
-        LEFT JOIN Passengers p ON o.Passenger_id = p.Passenger_id
-        WHERE o.Driver_id IS NULL
-        ORDER BY a.Time_order
-    """)
+    CREATE TRIGGER IF NOT EXISTS trg_orders_stats_delete
+    AFTER DELETE ON Orders
+    BEGIN
+        {analytics_contribution("OLD", -1)}
+    END;
 
-    orders = cursor.fetchall()
+    CREATE TRIGGER IF NOT EXISTS trg_orders_stats_update
+    AFTER UPDATE OF Driver_id, Passenger_id, About_orders_id, CreatedAt ON Orders
+    WHEN OLD.Driver_id IS NOT NEW.Driver_id OR OLD.Passenger_id IS NOT NEW.Passenger_id
+        OR OLD.About_orders_id IS NOT NEW.About_orders_id OR OLD.CreatedAt IS NOT NEW.CreatedAt
+    BEGIN
+        {analytics_contribution("OLD", -1)}
+        {analytics_contribution("NEW", 1)}
+    END;
 
-    if orders:
-        print(f"\n📦 Доступные заказы ({len(orders)}):")
-        print("-" * 100)
-        for order in orders:
-            print(f"   ID заказа: {order[7] if order[7] else 'Новый'}")
-            print(f"   ID деталей: {order[0]}")
-            print(f"   Пассажир: {order[1]}")
-            print(f"   Откуда: {order[2]}")
-            print(f"   Куда: {order[3]}")
-            print(f"   Время: {order[4]}")
-            print(f"   Цена: {order[5]} руб.")
-            print(f"   Расстояние: {order[6]} км")
-            print("-" * 100)
-    else:
-        print("\n📭 Нет доступных заказов в данный момент.")
+    CREATE TRIGGER IF NOT EXISTS trg_about_orders_stats
+    AFTER UPDATE OF Price, Distance_km ON About_orders
+    WHEN OLD.Price IS NOT NEW.Price OR OLD.Distance_km IS NOT NEW.Distance_km
+    BEGIN
+        {analytics_contribution("o", -1, "OLD.Price", "OLD.Distance_km", ANALYTICS_ABOUT_SOURCE)}
+        {analytics_contribution("o", 1, "NEW.Price", "NEW.Distance_km", ANALYTICS_ABOUT_SOURCE)}
+    END;
+"""
 
+ANALYTICS_FACTS = """
+        SELECT o.Driver_id, o.Passenger_id, o.CreatedAt, a.Price, a.Distance_km
+        FROM {orders} o
+        JOIN {about_orders} a ON a.About_orders_id = o.About_orders_id
+    """
 
-def accept_order(conn, cursor, driver):
-    try:
-        order_id = input("Введите ID заказа для принятия: ")
+ANALYTICS_REFRESH = """
+    DELETE FROM DriverStats;
+    DELETE FROM PassengerStats;
+    DELETE FROM HourlyStats;
 
-        if not order_id.isdigit():
-            print("\n✗ Ошибка: ID заказа должен быть числом!")
-            return
+    INSERT INTO DriverStats (Driver_id, Trips, Revenue, DistanceKm)
+    SELECT o.Driver_id, COUNT(*), TOTAL(o.Price), TOTAL(o.Distance_km)
+    FROM ({facts}) o
+    WHERE o.Driver_id IS NOT NULL
+    GROUP BY o.Driver_id;
 
-        cursor.execute("""
-            SELECT o.Orders_id, o.Driver_id, o.Passenger_id
-            FROM Orders o
-            WHERE o.Orders_id = ?
-        """, (order_id,))
+    INSERT INTO PassengerStats (Passenger_id, Orders, Trips, Spent, DistanceKm)
+    SELECT o.Passenger_id, COUNT(*), COUNT(o.Driver_id),
+           TOTAL((o.Driver_id IS NOT NULL) * o.Price), TOTAL((o.Driver_id IS NOT NULL) * o.Distance_km)
+    FROM ({facts}) o
+    GROUP BY o.Passenger_id;
 
-        order_data = cursor.fetchone()
+    INSERT INTO HourlyStats (Hour, Orders, Trips, Revenue, DistanceKm)
+    SELECT strftime('%Y-%m-%d %H:00', o.CreatedAt), COUNT(*), COUNT(o.Driver_id),
+           TOTAL((o.Driver_id IS NOT NULL) * o.Price), TOTAL((o.Driver_id IS NOT NULL) * o.Distance_km)
+    FROM ({facts}) o
+    GROUP BY 1;
+"""
 
-        if not order_data:
-            print(f"\n✗ Ошибка: Заказ с ID {order_id} не найден!")
-            return
+ADDRESS_PASSENGER_MATCHES = """
+        SELECT ad.Address_id
+        FROM {about_orders} a
+        JOIN Addresses ad ON ad.Address IN (a.Delivery_address, a.Final_address)
+        WHERE a.About_orders_id = {row}.About_orders_id
+"""
 
-        if order_data[1]:
-            print(f"\n✗ Ошибка: Этот заказ уже принят другим водителем!")
-            return
+ADDRESS_TRIGGERS = f"""
+    CREATE TRIGGER IF NOT EXISTS trg_addresses_search_insert
+    AFTER INSERT ON Addresses
+    BEGIN
+        INSERT INTO AddressSearch (rowid, Address) VALUES (NEW.Address_id, NEW.Address);
+    END;
 
-        cursor.execute("""
-            UPDATE Orders 
-            SET Driver_id = ?
-            WHERE Orders_id = ?
-        """, (driver['id'], order_id))
+    CREATE TRIGGER IF NOT EXISTS trg_addresses_search_delete
+    AFTER DELETE ON Addresses
+    BEGIN
+        INSERT INTO AddressSearch (AddressSearch, rowid, Address) VALUES ('delete', OLD.Address_id, OLD.Address);
+    END;
 
-        passenger_id = order_data[2]
+    CREATE TRIGGER IF NOT EXISTS trg_about_orders_addresses_insert
+    AFTER INSERT ON About_orders
+    BEGIN
+        INSERT INTO Addresses (Address, Uses) VALUES (NEW.Delivery_address, 1), (NEW.Final_address, 1)
+        ON CONFLICT (Address) DO UPDATE SET Uses = Uses + 1;
+    END;
 
-        cursor.execute("""
-            INSERT INTO Notification (Passenger_id, message)
-            VALUES (?, ?)
-        """, (passenger_id, f"Ваш заказ #{order_id} принят водителем {driver['username']}!"))
+    CREATE TRIGGER IF NOT EXISTS trg_about_orders_addresses_delete
+    AFTER DELETE ON About_orders
+    WHEN NOT EXISTS (SELECT 1 FROM ArchivedAbout_orders WHERE About_orders_id = OLD.About_orders_id)
+    BEGIN
+        UPDATE Addresses SET Uses = Uses - 1 WHERE Address = OLD.Delivery_address;
+        UPDATE Addresses SET Uses = Uses - 1 WHERE Address = OLD.Final_address;
+    END;
 
-        conn.commit()
-        print(f"\n✓ Успех! Вы приняли заказ #{order_id}!")
+    CREATE TRIGGER IF NOT EXISTS trg_orders_addresses_insert
+    AFTER INSERT ON Orders
+    BEGIN
+        INSERT INTO PassengerAddresses (Passenger_id, Address_id, Uses)
+        SELECT NEW.Passenger_id, Address_id, 1 FROM ({ADDRESS_PASSENGER_MATCHES.format(row="NEW", about_orders="About_orders")}) WHERE true
+        ON CONFLICT (Passenger_id, Address_id) DO UPDATE SET Uses = Uses + 1;
+    END;
 
-    except sqlite3.Error as e:
-        print(f"\n✗ Ошибка при принятии заказа: {e}")
-        conn.rollback()
+    CREATE TRIGGER IF NOT EXISTS trg_orders_addresses_delete
+    AFTER DELETE ON Orders
+    WHEN NOT EXISTS (SELECT 1 FROM ArchivedOrders WHERE Orders_id = OLD.Orders_id)
+    BEGIN
+        UPDATE PassengerAddresses SET Uses = Uses - 1
+        WHERE Passenger_id = OLD.Passenger_id AND Address_id IN ({ADDRESS_PASSENGER_MATCHES.format(row="OLD", about_orders="About_orders")});
+    END;
 
+    CREATE TRIGGER IF NOT EXISTS trg_archived_orders_addresses_delete
+    AFTER DELETE ON ArchivedOrders
+    BEGIN
+        UPDATE PassengerAddresses SET Uses = Uses - 1
+        WHERE Passenger_id = OLD.Passenger_id
+          AND Address_id IN ({ADDRESS_PASSENGER_MATCHES.format(row="OLD", about_orders="ArchivedAbout_orders")});
+    END;
 
-def create_order(conn, cursor, passenger):
-    try:
-        print("\n📝 Создание нового заказа")
-        print("-" * 40)
+    CREATE TRIGGER IF NOT EXISTS trg_archived_about_orders_addresses_delete
+    AFTER DELETE ON ArchivedAbout_orders
+    BEGIN
+        UPDATE Addresses SET Uses = Uses - 1 WHERE Address = OLD.Delivery_address;
+        UPDATE Addresses SET Uses = Uses - 1 WHERE Address = OLD.Final_address;
+    END;
+"""
 
-        delivery_address = input("Откуда (адрес подачи): ")
-        final_address = input("Куда (адрес назначения): ")
-        time_order = input("Время заказа (например, 15:30): ")
+ADDRESS_USES = """
+        SELECT Delivery_address AS Address FROM {about_orders}
+        UNION ALL
+        SELECT Final_address FROM {about_orders}
+    """
 
-        try:
-            price = float(input("Стоимость поездки (руб.): "))
-            distance = float(input("Расстояние (км): "))
-        except ValueError:
-            print("\n✗ Ошибка: Стоимость и расстояние должны быть числами!")
-            return
+ADDRESS_PASSENGER_FACTS = """
+        SELECT o.Passenger_id, a.Delivery_address, a.Final_address
+        FROM {orders} o
+        JOIN {about_orders} a ON a.About_orders_id = o.About_orders_id
+    """
 
-        cursor.execute("""
-            INSERT INTO About_orders (Delivery_address, Time_order, Price, Final_address, Distance_km)
-            VALUES (?, ?, ?, ?, ?)
-        """, (delivery_address, time_order, price, final_address, distance))
+ADDRESS_REFRESH = f"""
+    DELETE FROM PassengerAddresses;
+    UPDATE Addresses SET Uses = 0;
 
-        about_order_id = cursor.lastrowid
+    INSERT INTO Addresses (Address, Uses)
+    SELECT Address, COUNT(*)
+    FROM ({with_archive(ADDRESS_USES)})
+    GROUP BY Address
+    ON CONFLICT (Address) DO UPDATE SET Uses = excluded.Uses;
 
-        cursor.execute("""
-            INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id)
-            VALUES (NULL, ?, ?)
-        """, (passenger['id'], about_order_id))
+    INSERT INTO PassengerAddresses (Passenger_id, Address_id, Uses)
+    SELECT p.Passenger_id, ad.Address_id, COUNT(*)
+    FROM ({with_archive(ADDRESS_PASSENGER_FACTS)}) p
+    JOIN Addresses ad ON ad.Address IN (p.Delivery_address, p.Final_address)
+    GROUP BY p.Passenger_id, ad.Address_id;
+"""
 
-        order_id = cursor.lastrowid
+ROUTE_FACTS = """
+        SELECT a.Delivery_address, a.Final_address, a.Price, a.Distance_km, a.Pickup_lat, a.Pickup_lon
+        FROM {about_orders} a
+    """
 
-        cursor.execute("""
-            INSERT INTO Notification (Passenger_id, message)
-            VALUES (?, ?)
-        """, (passenger['id'], f"Ваш заказ #{order_id} создан! Ожидайте водителя."))
+ROUTE_REFRESH = f"""
+    CREATE TEMP TABLE RouteKeys (Address TEXT PRIMARY KEY, Address_key TEXT NOT NULL) WITHOUT ROWID;
+    INSERT INTO RouteKeys SELECT Address, route_key(Address) FROM Addresses;
 
-        conn.commit()
-        print(f"\n✓ Успех! Заказ #{order_id} создан!")
-        print(f"   Откуда: {delivery_address}")
-        print(f"   Куда: {final_address}")
-        print(f"   Время: {time_order}")
-        print(f"   Стоимость: {price} руб.")
-        print(f"   Расстояние: {distance} км")
+    DELETE FROM RouteEstimates;
+    DELETE FROM AddressPoints;
 
-    except sqlite3.Error as e:
-        print(f"\n✗ Ошибка при создании заказа: {e}")
-        conn.rollback()
+    INSERT INTO RouteEstimates (Delivery_key, Final_key, Distance_km, Price, Trips)
+    SELECT d.Address_key, f.Address_key, SUM(r.Distance_km) / SUM(r.Trips), SUM(r.Price) / SUM(r.Trips),
+           SUM(r.Trips)
+    FROM (
+        SELECT Delivery_address, Final_address, SUM(Distance_km) AS Distance_km, SUM(Price) AS Price,
+               COUNT(*) AS Trips
+        FROM ({with_archive(ROUTE_FACTS)})
+        WHERE Price IS NOT NULL AND Distance_km IS NOT NULL
+        GROUP BY Delivery_address, Final_address
+    ) r
+    JOIN RouteKeys d ON d.Address = r.Delivery_address
+    JOIN RouteKeys f ON f.Address = r.Final_address
+    GROUP BY 1, 2;
 
+    INSERT INTO AddressPoints (Address_key, Lat, Lon, Trips)
+    SELECT k.Address_key, SUM(p.Lat) / SUM(p.Trips), SUM(p.Lon) / SUM(p.Trips), SUM(p.Trips)
+    FROM (
+        SELECT Delivery_address, SUM(Pickup_lat) AS Lat, SUM(Pickup_lon) AS Lon, COUNT(*) AS Trips
+        FROM ({with_archive(ROUTE_FACTS)})
+        WHERE Pickup_lat IS NOT NULL AND Pickup_lon IS NOT NULL
+        GROUP BY Delivery_address
+    ) p
+    JOIN RouteKeys k ON k.Address = p.Delivery_address
+    GROUP BY 1;
 
-def main():
-    DB_NAME = "DuberBuber.db"
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    DROP TABLE temp.RouteKeys;
+"""
 
-    cursor.executescript("""
-    DROP TABLE IF EXISTS Notification;
-    DROP TABLE IF EXISTS Orders;
-    DROP TABLE IF EXISTS About_orders;
-    DROP TABLE IF EXISTS DriverCredentials;
-    DROP TABLE IF EXISTS PassengerCredentials;
-    DROP TABLE IF EXISTS Drivers;
-    DROP TABLE IF EXISTS Passengers;
+RATING_PRIOR_WEIGHT = 1.0
 
-    CREATE TABLE Drivers (
+MIGRATIONS = [
+    (1, """
+    CREATE TABLE IF NOT EXISTS Drivers (
         Driver_id INTEGER PRIMARY KEY AUTOINCREMENT,
         Username TEXT NOT NULL,
         Rating REAL,
         CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP
     );
 
-    CREATE TABLE Passengers (
+    CREATE TABLE IF NOT EXISTS Passengers (
         Passenger_id INTEGER PRIMARY KEY AUTOINCREMENT,
         Username TEXT NOT NULL,
         Rating REAL,
         CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP
     );
 
-    CREATE TABLE DriverCredentials (
+    CREATE TABLE IF NOT EXISTS DriverCredentials (
         Credential_id INTEGER PRIMARY KEY AUTOINCREMENT,
         Driver_id INTEGER NOT NULL,
         PasswordHash TEXT NOT NULL,
@@ -485,7 +320,7 @@ def main():
         UNIQUE(Driver_id)
     );
 
-    CREATE TABLE PassengerCredentials (
+    CREATE TABLE IF NOT EXISTS PassengerCredentials (
         Credential_id INTEGER PRIMARY KEY AUTOINCREMENT,
         Passenger_id INTEGER NOT NULL,
         PasswordHash TEXT NOT NULL,
@@ -494,7 +329,7 @@ def main():
         UNIQUE(Passenger_id)
     );
 
-    CREATE TABLE About_orders (
+    CREATE TABLE IF NOT EXISTS About_orders (
         About_orders_id INTEGER PRIMARY KEY AUTOINCREMENT,
         Delivery_address TEXT NOT NULL,
         Time_order TEXT NOT NULL,
@@ -504,7 +339,7 @@ def main():
         CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP
     );
 
-    CREATE TABLE Orders (
+    CREATE TABLE IF NOT EXISTS Orders (
         Orders_id INTEGER PRIMARY KEY AUTOINCREMENT,
         Driver_id INTEGER,
         Passenger_id INTEGER NOT NULL,
@@ -515,7 +350,7 @@ def main():
         FOREIGN KEY(About_orders_id) REFERENCES About_orders(About_orders_id)
     );
 
-    CREATE TABLE Notification (
+    CREATE TABLE IF NOT EXISTS Notification (
         notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
         Passenger_id INTEGER NOT NULL,
         message TEXT NOT NULL,
@@ -523,225 +358,4819 @@ def main():
         CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY(Passenger_id) REFERENCES Passengers(Passenger_id)
     );
-    """)
+    """),
+    (2, """
+    CREATE INDEX IF NOT EXISTS idx_drivers_username ON Drivers(Username, Rating);
+    CREATE INDEX IF NOT EXISTS idx_passengers_username ON Passengers(Username, Rating);
+    CREATE INDEX IF NOT EXISTS idx_orders_driver ON Orders(Driver_id, Passenger_id, About_orders_id);
+    CREATE INDEX IF NOT EXISTS idx_orders_passenger ON Orders(Passenger_id, Driver_id, About_orders_id);
+    CREATE INDEX IF NOT EXISTS idx_orders_about ON Orders(About_orders_id, Driver_id);
+    CREATE INDEX IF NOT EXISTS idx_notification_unread ON Notification(Passenger_id, IsRead, CreatedAt);
+    """),
+    (3, """
+    ALTER TABLE Orders ADD COLUMN UpdatedAt DATETIME;
+    CREATE INDEX IF NOT EXISTS idx_orders_updated ON Orders(UpdatedAt);
 
-    test_drivers = [
-        ("Славка Андрей Владиславович", 2.3, "driver123"),
-        ("Капитанов Иван Александрович", 4.7, "driver456"),
-        ("Хороших Егор Эдуардович", 3.6, "driver789")
-    ]
+    CREATE TRIGGER IF NOT EXISTS trg_orders_touch
+    AFTER UPDATE OF Driver_id, Passenger_id, About_orders_id ON Orders
+    BEGIN
+        UPDATE Orders SET UpdatedAt = strftime('%Y-%m-%d %H:%M:%f', 'now')
+        WHERE Orders_id = NEW.Orders_id;
+    END;
 
-    test_passengers = [
-        ("Раева Кира Сергеевна", 4.3, "pass123"),
-        ("Галкин Илья Алексеевич", 5.0, "pass456"),
-        ("Боярсков Павел Владиславович", 2.8, "pass789")
-    ]
+    CREATE TRIGGER IF NOT EXISTS trg_about_orders_touch
+    AFTER UPDATE ON About_orders
+    BEGIN
+        UPDATE Orders SET UpdatedAt = strftime('%Y-%m-%d %H:%M:%f', 'now')
+        WHERE About_orders_id = NEW.About_orders_id;
+    END;
+    """),
+    (4, """
+    ALTER TABLE About_orders ADD COLUMN Pickup_lat REAL;
+    ALTER TABLE About_orders ADD COLUMN Pickup_lon REAL;
+    """),
+    (5, """
+    ALTER TABLE Drivers ADD COLUMN Current_lat REAL;
+    ALTER TABLE Drivers ADD COLUMN Current_lon REAL;
+    ALTER TABLE Drivers ADD COLUMN IsAvailable BOOLEAN DEFAULT 1;
+    """),
+    (6, """
+    CREATE TABLE IF NOT EXISTS Sessions (
+        TokenHash TEXT PRIMARY KEY,
+        User_type TEXT NOT NULL,
+        User_id INTEGER NOT NULL,
+        CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP,
+        ExpiresAt REAL NOT NULL
+    ) WITHOUT ROWID;
 
-    print("\n" + "=" * 50)
-    print("СОЗДАНИЕ ТЕСТОВЫХ ДАННЫХ")
-    print("=" * 50)
+    CREATE INDEX IF NOT EXISTS idx_sessions_user ON Sessions(User_type, User_id);
+    CREATE INDEX IF NOT EXISTS idx_sessions_expires ON Sessions(ExpiresAt);
+    """),
+    (7, """
+    DROP INDEX IF EXISTS idx_orders_driver;
+    DROP INDEX IF EXISTS idx_orders_passenger;
+    CREATE INDEX IF NOT EXISTS idx_orders_driver_history
+        ON Orders(Driver_id, CreatedAt, Orders_id, Passenger_id, About_orders_id);
+    CREATE INDEX IF NOT EXISTS idx_orders_passenger_history
+        ON Orders(Passenger_id, CreatedAt, Orders_id, Driver_id, About_orders_id);
+    """),
+    (8, f"""
+    CREATE TABLE IF NOT EXISTS Ratings (
+        Rating_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Orders_id INTEGER NOT NULL,
+        Rater_type TEXT NOT NULL,
+        Rater_id INTEGER NOT NULL,
+        Ratee_type TEXT NOT NULL,
+        Ratee_id INTEGER NOT NULL,
+        Score INTEGER NOT NULL CHECK (Score BETWEEN 1 AND 5),
+        CreatedAt DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(Orders_id, Rater_type)
+    );
 
-    print("\nСоздаю тестовых водителей...")
-    for username, rating, password in test_drivers:
-        cursor.execute("INSERT INTO Drivers (Username, Rating) VALUES (?, ?)",
-                       (username, rating))
-        driver_id = cursor.lastrowid
-        salt = f"salt_driver_{driver_id}"
-        password_hash = hash_password(password, salt)
-        cursor.execute("INSERT INTO DriverCredentials (Driver_id, PasswordHash, Salt) VALUES (?, ?, ?)",
-                       (driver_id, password_hash, salt))
-        print(f"  ✓ Водитель: {username} (пароль: {password})")
+    CREATE INDEX IF NOT EXISTS idx_ratings_ratee ON Ratings(Ratee_type, Ratee_id, CreatedAt, Score);
 
-    print("\nСоздаю тестовых пассажиров...")
-    for username, rating, password in test_passengers:
-        cursor.execute("INSERT INTO Passengers (Username, Rating) VALUES (?, ?)",
-                       (username, rating))
-        passenger_id = cursor.lastrowid
-        salt = f"salt_passenger_{passenger_id}"
-        password_hash = hash_password(password, salt)
-        cursor.execute("INSERT INTO PassengerCredentials (Passenger_id, PasswordHash, Salt) VALUES (?, ?, ?)",
-                       (passenger_id, password_hash, salt))
-        print(f"  ✓ Пассажир: {username} (пароль: {password})")
+    CREATE TABLE IF NOT EXISTS RatingAggregates (
+        User_type TEXT NOT NULL,
+        User_id INTEGER NOT NULL,
+        RatingCount INTEGER NOT NULL,
+        RatingSum INTEGER NOT NULL,
+        DecayedSum REAL NOT NULL,
+        DecayedWeight REAL NOT NULL,
+        DecayedAt INTEGER NOT NULL,
+        PRIMARY KEY (User_type, User_id)
+    ) WITHOUT ROWID;
 
-    print("\nСоздаю тестовые заказы...")
-    About_orders = [
-        ("Ул. Красная Поляна, д. 2, подъезд 1", "15:06", 654, "Ул. Бурнаковская, д. 75", 1.9),
-        ("Ул. Осипенко, д. 82", "19:59", 427, "Ул. Нижневолжсая, д. 19", 5.0),
-        ("Ул. Минина, д. 24", "6:44", 987, "Ул. Рожденственская, д 10", 2.8)
-    ]
+    CREATE TABLE IF NOT EXISTS RatingPriors (
+        User_type TEXT NOT NULL,
+        User_id INTEGER NOT NULL,
+        Rating REAL NOT NULL,
+        SeededAt INTEGER NOT NULL,
+        PRIMARY KEY (User_type, User_id)
+    ) WITHOUT ROWID;
 
-    for order in About_orders:
-        cursor.execute(
-            "INSERT INTO About_orders (Delivery_address, Time_order, Price, Final_address, Distance_km) VALUES (?, ?, ?, ?, ?)",
-            order)
-        print(f"  ✓ Заказ из {order[0]} в {order[3]}")
+    INSERT OR IGNORE INTO RatingPriors (User_type, User_id, Rating, SeededAt)
+    SELECT 'driver', Driver_id, Rating, CAST(strftime('%s', 'now') AS INTEGER)
+    FROM Drivers
+    WHERE Rating IS NOT NULL
+    UNION ALL
+    SELECT 'passenger', Passenger_id, Rating, CAST(strftime('%s', 'now') AS INTEGER)
+    FROM Passengers
+    WHERE Rating IS NOT NULL;
 
-    print("\nНазначаю заказы...")
-    cursor.execute("INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id) VALUES (2, 3, 2)")
-    cursor.execute("INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id) VALUES (1, 1, 1)")
-    cursor.execute("INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id) VALUES (3, 2, 3)")
-    cursor.execute("INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id) VALUES (NULL, 1, 1)")
-    print("  ✓ Назначено 4 заказа (3 с водителями, 1 ожидающий)")
+    INSERT OR IGNORE INTO RatingAggregates
+    SELECT User_type, User_id, 0, 0, Rating * {RATING_PRIOR_WEIGHT}, {RATING_PRIOR_WEIGHT}, SeededAt
+    FROM RatingPriors;
+    """),
+    (9, f"""
+    CREATE TABLE IF NOT EXISTS DriverStats (
+        Driver_id INTEGER PRIMARY KEY,
+        Trips INTEGER NOT NULL,
+        Revenue REAL NOT NULL,
+        DistanceKm REAL NOT NULL
+    );
 
-    notifications = [
-        (1, "Ваш водитель уже в пути!"),
-        (2, "Ваш водитель подъезжает!"),
-        (3, "Ожидайте водителя в течение 5 минут")
-    ]
+    CREATE TABLE IF NOT EXISTS PassengerStats (
+        Passenger_id INTEGER PRIMARY KEY,
+        Orders INTEGER NOT NULL,
+        Trips INTEGER NOT NULL,
+        Spent REAL NOT NULL,
+        DistanceKm REAL NOT NULL
+    );
 
-    for passenger_id, message in notifications:
-        cursor.execute("INSERT INTO Notification (Passenger_id, message) VALUES (?, ?)", (passenger_id, message))
+    CREATE TABLE IF NOT EXISTS HourlyStats (
+        Hour TEXT PRIMARY KEY,
+        Orders INTEGER NOT NULL,
+        Trips INTEGER NOT NULL,
+        Revenue REAL NOT NULL,
+        DistanceKm REAL NOT NULL
+    ) WITHOUT ROWID;
 
-    conn.commit()
-    print("\n" + "=" * 50)
-    print("СИСТЕМА ГОТОВА К РАБОТЕ")
-    print("=" * 50)
+    CREATE INDEX IF NOT EXISTS idx_driver_stats_revenue ON DriverStats(Revenue);
+    CREATE INDEX IF NOT EXISTS idx_passenger_stats_spent ON PassengerStats(Spent);
+    {ANALYTICS_TRIGGERS}
+    {ANALYTICS_REFRESH.format(facts=live_tables(ANALYTICS_FACTS))}
+    """),
+    (10, f"""
+    CREATE TABLE IF NOT EXISTS ArchivedOrders (
+        Orders_id INTEGER PRIMARY KEY,
+        Driver_id INTEGER,
+        Passenger_id INTEGER NOT NULL,
+        About_orders_id INTEGER NOT NULL,
+        CreatedAt DATETIME,
+        UpdatedAt DATETIME
+    );
 
-    while True:
-        print("\n" + "=" * 50)
-        print("DUBER BUBER - СИСТЕМА ЗАКАЗА ТАКСИ")
-        print("=" * 50)
-        print("1. 🚗 Войти как водитель")
+    CREATE TABLE IF NOT EXISTS ArchivedAbout_orders (
+        About_orders_id INTEGER PRIMARY KEY,
+        Delivery_address TEXT NOT NULL,
+        Time_order TEXT NOT NULL,
+        Price REAL NOT NULL,
+        Final_address TEXT NOT NULL,
+        Distance_km REAL NOT NULL,
+        CreatedAt DATETIME,
+        Pickup_lat REAL,
+        Pickup_lon REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS ArchivedNotification (
+        notification_id INTEGER PRIMARY KEY,
+        Passenger_id INTEGER NOT NULL,
+        message TEXT NOT NULL,
+        IsRead BOOLEAN,
+        CreatedAt DATETIME
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_archived_orders_driver_history
+        ON ArchivedOrders(Driver_id, CreatedAt, Orders_id, Passenger_id, About_orders_id);
+    CREATE INDEX IF NOT EXISTS idx_archived_orders_passenger_history
+        ON ArchivedOrders(Passenger_id, CreatedAt, Orders_id, Driver_id, About_orders_id);
+    CREATE INDEX IF NOT EXISTS idx_archived_orders_updated ON ArchivedOrders(UpdatedAt);
+
+    CREATE VIEW IF NOT EXISTS AllOrders AS
+    SELECT Orders_id, Driver_id, Passenger_id, About_orders_id, CreatedAt, UpdatedAt FROM Orders
+    UNION ALL
+    SELECT Orders_id, Driver_id, Passenger_id, About_orders_id, CreatedAt, UpdatedAt FROM ArchivedOrders;
+
+    CREATE VIEW IF NOT EXISTS AllAbout_orders AS
+    SELECT About_orders_id, Delivery_address, Time_order, Price, Final_address, Distance_km, CreatedAt,
+           Pickup_lat, Pickup_lon
+    FROM About_orders
+    UNION ALL
+    SELECT About_orders_id, Delivery_address, Time_order, Price, Final_address, Distance_km, CreatedAt,
+           Pickup_lat, Pickup_lon
+    FROM ArchivedAbout_orders;
+
+    CREATE VIEW IF NOT EXISTS AllNotification AS
+    SELECT notification_id, Passenger_id, message, IsRead, CreatedAt FROM Notification
+    UNION ALL
+    SELECT notification_id, Passenger_id, message, IsRead, CreatedAt FROM ArchivedNotification;
+
+    DROP TRIGGER IF EXISTS trg_orders_stats_delete;
+    CREATE TRIGGER IF NOT EXISTS trg_orders_stats_delete
+    AFTER DELETE ON Orders
+    WHEN NOT EXISTS (SELECT 1 FROM ArchivedOrders WHERE Orders_id = OLD.Orders_id)
+    BEGIN
+        {analytics_contribution("OLD", -1)}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_archived_orders_stats_delete
+    AFTER DELETE ON ArchivedOrders
+    BEGIN
+        {analytics_contribution("OLD", -1, source=ANALYTICS_ARCHIVED_SOURCE)}
+    END;
+    """),
+    (11, f"""
+    CREATE TABLE IF NOT EXISTS Addresses (
+        Address_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        Address TEXT NOT NULL UNIQUE,
+        Uses INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS PassengerAddresses (
+        Passenger_id INTEGER NOT NULL,
+        Address_id INTEGER NOT NULL,
+        Uses INTEGER NOT NULL,
+        PRIMARY KEY (Passenger_id, Address_id)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_addresses_uses ON Addresses(Uses);
+    CREATE INDEX IF NOT EXISTS idx_passenger_addresses_uses ON PassengerAddresses(Passenger_id, Uses);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS AddressSearch USING fts5(
+        Address,
+        content='Addresses',
+        content_rowid='Address_id',
+        tokenize='unicode61 remove_diacritics 0',
+        prefix='1 2 3'
+    );
+    {ADDRESS_TRIGGERS}
+    {ADDRESS_REFRESH}
+    """),
+    (12, """
+    CREATE TABLE IF NOT EXISTS RouteEstimates (
+        Delivery_key TEXT NOT NULL,
+        Final_key TEXT NOT NULL,
+        Distance_km REAL NOT NULL,
+        Price REAL NOT NULL,
+        Trips INTEGER NOT NULL,
+        UpdatedAt DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (Delivery_key, Final_key)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS AddressPoints (
+        Address_key TEXT PRIMARY KEY,
+        Lat REAL NOT NULL,
+        Lon REAL NOT NULL,
+        Trips INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    """),
+]
+
+DRIVER_LOGIN_QUERY = """
+                SELECT d.Driver_id, d.Username, d.Rating, dc.PasswordHash, dc.Salt
+                FROM Drivers d
+                JOIN DriverCredentials dc ON d.Driver_id = dc.Driver_id
+                WHERE d.Username = ?
+            """
+
+PASSENGER_LOGIN_QUERY = """
+                SELECT p.Passenger_id, p.Username, p.Rating, pc.PasswordHash, pc.Salt
+                FROM Passengers p
+                JOIN PassengerCredentials pc ON p.Passenger_id = pc.Passenger_id
+                WHERE p.Username = ?
+            """
+
+DRIVER_ORDER_KEYS_QUERY = with_archive("""
+            SELECT Orders_id, Passenger_id, About_orders_id, CreatedAt
+            FROM {orders}
+            WHERE Driver_id = ?1 AND (CreatedAt, Orders_id) < (?2, ?3)
+        """, """
+            ORDER BY CreatedAt DESC, Orders_id DESC
+            LIMIT ?4
+        """)
+
+PASSENGER_ORDER_KEYS_QUERY = with_archive("""
+            SELECT Orders_id, Driver_id, About_orders_id, CreatedAt
+            FROM {orders}
+            WHERE Passenger_id = ?1 AND (CreatedAt, Orders_id) < (?2, ?3)
+        """, """
+            ORDER BY CreatedAt DESC, Orders_id DESC
+            LIMIT ?4
+        """)
+
+PROFILE_QUERIES = {
+    "driver": "SELECT Driver_id, Username, Rating FROM Drivers WHERE Driver_id IN ({})",
+    "passenger": "SELECT Passenger_id, Username, Rating FROM Passengers WHERE Passenger_id IN ({})",
+    "about": """
+        SELECT About_orders_id, Delivery_address, Final_address, Time_order, Price, Distance_km
+        FROM AllAbout_orders
+        WHERE About_orders_id IN ({})
+    """,
+}
+
+UNREAD_NOTIFICATIONS_QUERY = """
+            SELECT notification_id, message, CreatedAt
+            FROM Notification
+            WHERE Passenger_id = ? AND IsRead = 0 AND (CreatedAt, notification_id) < (?, ?)
+            ORDER BY CreatedAt DESC, notification_id DESC
+            LIMIT ?
+        """
+
+DRIVER_OWNED_ORDER_QUERY = with_archive("""
+            SELECT Orders_id, Passenger_id, About_orders_id, Driver_id, '{orders}'
+            FROM {orders}
+            WHERE Orders_id = ?1 AND Driver_id = ?2
+        """)
+
+PASSENGER_OWNED_ORDER_QUERY = with_archive("""
+            SELECT Orders_id, Passenger_id, About_orders_id, Driver_id, '{orders}'
+            FROM {orders}
+            WHERE Orders_id = ?1 AND Passenger_id = ?2
+        """)
+
+ORDER_USAGE_QUERY = """
+            SELECT COUNT(*) FROM Orders WHERE About_orders_id = ?
+        """
+
+OPEN_ORDERS_QUERY = """
+        SELECT a.About_orders_id, p.Username, a.Delivery_address, a.Final_address,
+               a.Time_order, a.Price, a.Distance_km, o.Orders_id, a.Pickup_lat, a.Pickup_lon
+        FROM About_orders a
+        LEFT JOIN Orders o ON a.About_orders_id = o.About_orders_id
+        LEFT JOIN Passengers p ON o.Passenger_id = p.Passenger_id
+        WHERE o.Driver_id IS NULL
+        ORDER BY a.Time_order
+    """
+
+PASSENGER_ADDRESSES_QUERY = """
+        SELECT a.Address, pa.Uses
+        FROM PassengerAddresses pa
+        JOIN Addresses a ON a.Address_id = pa.Address_id
+        WHERE pa.Passenger_id = ? AND pa.Uses > 0
+        ORDER BY pa.Uses DESC
+        LIMIT ?
+    """
+
+POPULAR_ADDRESSES_QUERY = """
+        SELECT Address, Uses
+        FROM Addresses
+        WHERE Uses > 0
+        ORDER BY Uses DESC
+        LIMIT ?
+    """
+
+ADDRESS_SEARCH_QUERY = """
+        SELECT a.Address, a.Uses
+        FROM AddressSearch
+        JOIN Addresses a ON a.Address_id = AddressSearch.rowid
+        WHERE AddressSearch MATCH ? AND a.Uses > 0
+        ORDER BY a.Uses DESC
+        LIMIT ?
+    """
+
+ROUTE_ESTIMATES_QUERY = """
+        SELECT r.Delivery_key, r.Final_key, r.Distance_km, r.Price, r.Trips
+        FROM (VALUES {}) k
+        JOIN RouteEstimates r ON r.Delivery_key = k.column1 AND r.Final_key = k.column2
+    """
+
+ADDRESS_POINTS_QUERY = "SELECT Address_key, Lat, Lon FROM AddressPoints WHERE Address_key IN ({})"
+
+ROUTE_STORE = """
+        INSERT OR IGNORE INTO RouteEstimates (Delivery_key, Final_key, Distance_km, Price, Trips)
+        VALUES (?, ?, ?, ?, 0)
+    """
+
+ROUTE_OBSERVE = """
+        INSERT INTO RouteEstimates (Delivery_key, Final_key, Distance_km, Price, Trips)
+        VALUES (?1, ?2, ?3, ?4, 1)
+        ON CONFLICT (Delivery_key, Final_key) DO UPDATE SET
+            Distance_km = (Distance_km * Trips + excluded.Distance_km) / (Trips + 1),
+            Price = (Price * Trips + excluded.Price) / (Trips + 1),
+            Trips = Trips + 1,
+            UpdatedAt = CURRENT_TIMESTAMP
+        RETURNING Distance_km, Price, Trips
+    """
+
+POINT_OBSERVE = """
+        INSERT INTO AddressPoints (Address_key, Lat, Lon, Trips)
+        VALUES (?1, ?2, ?3, 1)
+        ON CONFLICT (Address_key) DO UPDATE SET
+            Lat = (Lat * Trips + excluded.Lat) / (Trips + 1),
+            Lon = (Lon * Trips + excluded.Lon) / (Trips + 1),
+            Trips = Trips + 1
+    """
+
+ORDER_BOOK_PAGE_SIZE = 20
+ORDER_BOOK_PAGE_SIZE_MAX = 200
+HISTORY_PAGE_SIZE = 20
+HISTORY_PAGE_SIZE_MAX = 200
+HISTORY_START = ("9999-12-31 23:59:59", 2 ** 63 - 1)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+GEO_CELL_DEGREES = 0.01
+NEAREST_DEFAULT_K = 5
+NEAREST_DEFAULT_RADIUS_KM = 5.0
+
+DISPATCH_MAX_PICKUP_KM = 10.0
+DISPATCH_RATING_WEIGHT = 0.5
+DISPATCH_WAIT_WEIGHT = 0.05
+
+DISPATCH_ORDERS_QUERY = """
+    SELECT o.Orders_id, o.Passenger_id, a.Pickup_lat, a.Pickup_lon,
+           (julianday('now') - julianday(o.CreatedAt)) * 1440
+    FROM Orders o
+    JOIN About_orders a ON o.About_orders_id = a.About_orders_id
+    WHERE o.Driver_id IS NULL AND a.Pickup_lat IS NOT NULL AND a.Pickup_lon IS NOT NULL
+"""
+
+DISPATCH_DRIVERS_QUERY = """
+    SELECT Driver_id, Username, COALESCE(Rating, 0), Current_lat, Current_lon
+    FROM Drivers
+    WHERE IsAvailable = 1 AND Current_lat IS NOT NULL AND Current_lon IS NOT NULL
+"""
+
+ACCEPT_OK = "accepted"
+ACCEPT_TAKEN = "taken"
+ACCEPT_MISSING = "missing"
+ACCEPT_RETRIES = 8
+ACCEPT_BACKOFF = 0.005
+
+RATING_MIN = 1
+RATING_MAX = 5
+RATING_HALF_LIFE = 180 * 86400
+RATING_RECOMPUTE_BATCH = 50000
+
+PASSWORD_KDF = "scrypt"
+PASSWORD_COSTS = {
+    "pbkdf2_sha256": "600000",
+    "scrypt": "16384:8:1",
+}
+PASSWORD_SALT_BYTES = 16
+PASSWORD_WORKERS = os.cpu_count() or 1
+PASSWORD_MAX_PENDING = 64
+PASSWORD_QUEUE_TIMEOUT = 5.0
+
+SESSION_TTL = 12 * 3600
+SESSION_CACHE_SIZE = 100000
+SESSION_PURGE_INTERVAL = 3600
+
+PROFILE_CACHE_SIZE = 100000
+ORDER_DETAILS_CACHE_SIZE = 200000
+CACHE_QUERY_CHUNK = 500
+
+NOTIFY_CHANNEL_BUFFER = 100
+NOTIFY_SUBSCRIPTION_TTL = 60.0
+NOTIFY_POLL_TIMEOUT = 25.0
+NOTIFY_POLL_TIMEOUT_MAX = 55.0
+NOTIFY_READ_BATCH = 256
+NOTIFY_FLUSH_INTERVAL = 1.0
+
+ADDRESS_SUGGEST_LIMIT = 10
+ADDRESS_SUGGEST_LIMIT_MAX = 20
+ADDRESS_PERSONAL_SCAN = 200
+ADDRESS_TRIE_SIZE = 20000
+ADDRESS_TRIE_NODE_TOP = 40
+ADDRESS_TRIE_DEPTH = 8
+ADDRESS_TRIE_TTL = 600
+ADDRESS_TOKEN = re.compile(r"[^\W_]+")
+
+ROUTE_CACHE_SIZE = 100000
+ROUTE_BATCH_MAX = 500
+ROUTE_DETOUR = 1.3
+FARE_BASE = 115
+FARE_PER_KM = 32
+
+ANALYTICS_BY = ["driver", "passenger", "hour", "hour-of-day"]
+ANALYTICS_TOP = 20
+ANALYTICS_RANGE = ("0000-01-01 00:00", "9999-12-31 23:59")
+
+ANALYTICS_QUERIES = {
+    "driver": """
+        SELECT Driver_id, Trips, Trips, Revenue, DistanceKm
+        FROM DriverStats
+        ORDER BY Revenue DESC
+        LIMIT ?
+    """,
+    "passenger": """
+        SELECT Passenger_id, Orders, Trips, Spent, DistanceKm
+        FROM PassengerStats
+        ORDER BY Spent DESC
+        LIMIT ?
+    """,
+    "hour": """
+        SELECT Hour, Orders, Trips, Revenue, DistanceKm
+        FROM HourlyStats
+        WHERE Hour >= ? AND Hour < ?
+        ORDER BY Hour DESC
+        LIMIT ?
+    """,
+    "hour-of-day": """
+        SELECT CAST(substr(Hour, 12, 2) AS INTEGER), SUM(Orders), SUM(Trips), TOTAL(Revenue), TOTAL(DistanceKm)
+        FROM HourlyStats
+        WHERE Hour >= ? AND Hour < ?
+        GROUP BY 1
+        ORDER BY 1
+        LIMIT ?
+    """,
+}
+
+ARCHIVE_ORDER_AGE_DAYS = 90
+ARCHIVE_NOTIFICATION_AGE_DAYS = 7
+ARCHIVE_BATCH_SIZE = 2000
+ARCHIVE_PAUSE = 0.1
+ARCHIVE_INTERVAL = 3600
+
+METRICS_SAMPLE_RATE = 0.1
+METRICS_TOP_QUERIES = 15
+METRICS = Metrics(METRICS_SAMPLE_RATE)
+
+HOT_QUERIES = [
+    ("login_user (водитель)", DRIVER_LOGIN_QUERY, ("",)),
+    ("login_user (пассажир)", PASSENGER_LOGIN_QUERY, ("",)),
+    ("show_user_orders (водитель)", DRIVER_ORDER_KEYS_QUERY, (0, *HISTORY_START, HISTORY_PAGE_SIZE)),
+    ("show_user_orders (пассажир)", PASSENGER_ORDER_KEYS_QUERY, (0, *HISTORY_START, HISTORY_PAGE_SIZE)),
+    ("show_user_orders (Drivers)", PROFILE_QUERIES["driver"].format("?, ?"), (0, 0)),
+    ("show_user_orders (Passengers)", PROFILE_QUERIES["passenger"].format("?, ?"), (0, 0)),
+    ("show_user_orders (About_orders)", PROFILE_QUERIES["about"].format("?, ?"), (0, 0)),
+    ("show_notifications", UNREAD_NOTIFICATIONS_QUERY, (0, *HISTORY_START, HISTORY_PAGE_SIZE)),
+    ("delete_order (водитель)", DRIVER_OWNED_ORDER_QUERY, (0, 0)),
+    ("delete_order (пассажир)", PASSENGER_OWNED_ORDER_QUERY, (0, 0)),
+    ("delete_order (About_orders)", ORDER_USAGE_QUERY, (0,)),
+    ("suggest_addresses (пассажир)", PASSENGER_ADDRESSES_QUERY, (0, ADDRESS_PERSONAL_SCAN)),
+    ("suggest_addresses (популярные)", POPULAR_ADDRESSES_QUERY, (ADDRESS_TRIE_SIZE,)),
+    ("estimate_routes (AddressPoints)", ADDRESS_POINTS_QUERY.format("?, ?"), ("", "")),
+    ("analytics_report (водители)", ANALYTICS_QUERIES["driver"], (ANALYTICS_TOP,)),
+    ("analytics_report (пассажиры)", ANALYTICS_QUERIES["passenger"], (ANALYTICS_TOP,)),
+    ("analytics_report (по часам)", ANALYTICS_QUERIES["hour"], (*ANALYTICS_RANGE, ANALYTICS_TOP)),
+]
+
+
+def migrate(conn):
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    applied = []
+
+    for version, script in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+        applied.append(version)
+
+    restore_deferred_schema(conn)
+    return applied
+
+
+def check_query_plans(conn):
+    results = []
+
+    for name, query, params in HOT_QUERIES:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+        full_scans = [step for step in plan
+                      if step.startswith("SCAN ") and " USING " not in step or step.startswith("USE TEMP B-TREE")]
+        results.append((name, plan, not full_scans))
+
+    return results
+
+
+def print_query_plans(conn):
+    results = check_query_plans(conn)
+
+    print("\n" + "=" * 50)
+    print("ПРОВЕРКА ПЛАНОВ ЗАПРОСОВ")
+    print("=" * 50)
+    for name, plan, uses_index in results:
+        print(f"\n{'✓' if uses_index else '✗'} {name}")
+        for step in plan:
+            print(f"     {step}")
+
+    return all(uses_index for _, _, uses_index in results)
+
+
+def legacy_password_hash(password, salt):
+    hash_obj = hashlib.sha256()
+    hash_obj.update(f"{password}{salt}".encode('utf-8'))
+    return hash_obj.hexdigest()
+
+
+def pbkdf2_sha256(password, salt, cost):
+    return hashlib.pbkdf2_hmac("sha256", password.encode('utf-8'), salt.encode('utf-8'), int(cost)).hex()
+
+
+def scrypt(password, salt, cost):
+    n, r, p = map(int, cost.split(":"))
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt.encode('utf-8'), n=n, r=r, p=p,
+                          maxmem=256 * r * (n + p + 2)).hex()
+
+
+PASSWORD_KDFS = {
+    "pbkdf2_sha256": pbkdf2_sha256,
+    "scrypt": scrypt,
+}
+
+
+def hash_password(password, salt, kdf=PASSWORD_KDF, cost=None):
+    cost = cost or PASSWORD_COSTS[kdf]
+    return f"{kdf}${cost}${salt}${PASSWORD_KDFS[kdf](password, salt, cost)}"
+
+
+def new_credentials(password, kdf=PASSWORD_KDF, cost=None):
+    salt = secrets.token_hex(PASSWORD_SALT_BYTES)
+    return hash_password(password, salt, kdf, cost), salt
+
+
+def verify_password(password, stored_hash, salt):
+    if "$" not in stored_hash:
+        return hmac.compare_digest(legacy_password_hash(password, salt), stored_hash)
+
+    kdf, cost, salt, expected = stored_hash.split("$")
+    if kdf not in PASSWORD_KDFS:
+        return False
+    return hmac.compare_digest(PASSWORD_KDFS[kdf](password, salt, cost), expected)
+
+
+def needs_rehash(stored_hash, kdf=PASSWORD_KDF, cost=None):
+    return not stored_hash.startswith(f"{kdf}${cost or PASSWORD_COSTS[kdf]}$")
+
+
+def credential_table(user_type):
+    if user_type == "driver":
+        return "DriverCredentials", "Driver_id"
+    if user_type == "passenger":
+        return "PassengerCredentials", "Passenger_id"
+    raise ValueError(f"неизвестный тип пользователя: {user_type}")
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class SessionStore:
+    def __init__(self, pool=None, ttl=SESSION_TTL, max_size=SESSION_CACHE_SIZE):
+        self.pool = pool
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.by_user = {}
+        self.cache = LRUCache(max_size, ttl, on_evict=self.forget)
+        self.purged_at = time.monotonic()
+        self.revocations = 0
+
+    def __len__(self):
+        return len(self.cache)
+
+    def remember(self, token, user, ttl=None):
+        self.cache.put(token, user, ttl)
+        with self.lock:
+            self.by_user.setdefault((user['type'], user['id']), set()).add(token)
+
+    def forget(self, token, user):
+        with self.lock:
+            tokens = self.by_user.get((user['type'], user['id']))
+            if tokens:
+                tokens.discard(token)
+                if not tokens:
+                    del self.by_user[(user['type'], user['id'])]
+
+    def open(self, user):
+        token = secrets.token_urlsafe(32)
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                conn.execute("INSERT INTO Sessions (TokenHash, User_type, User_id, ExpiresAt) VALUES (?, ?, ?, ?)",
+                             (token_hash(token), user['type'], user['id'], time.time() + self.ttl))
+                if time.monotonic() - self.purged_at > SESSION_PURGE_INTERVAL:
+                    conn.execute("DELETE FROM Sessions WHERE ExpiresAt <= ?", (time.time(),))
+                    self.purged_at = time.monotonic()
+                conn.commit()
+        self.remember(token, user)
+        return token
+
+    def get(self, token, load=True):
+        user = self.cache.get(token)
+        if user is not None or not load or self.pool is None:
+            return user
+
+        with self.lock:
+            revocations = self.revocations
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT User_type, User_id, ExpiresAt FROM Sessions WHERE TokenHash = ? AND ExpiresAt > ?",
+                               (token_hash(token), time.time())).fetchone()
+            if not row:
+                return None
+            user_type, user_id, expires_at = row
+            table, column = ("Drivers", "Driver_id") if user_type == "driver" else ("Passengers", "Passenger_id")
+            user_data = conn.execute(f"SELECT {column}, Username, Rating FROM {table} WHERE {column} = ?",
+                                     (user_id,)).fetchone()
+
+        if not user_data:
+            return None
+        user = {'id': user_data[0], 'username': user_data[1], 'rating': user_data[2], 'type': user_type}
+        self.remember(token, user, max(expires_at - time.time(), 1))
+
+        with self.lock:
+            revoked = self.revocations != revocations
+        if revoked and not self.stored(token):
+            self.cache.pop(token)
+            self.forget(token, user)
+            return None
+        return user
+
+    def stored(self, token):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT 1 FROM Sessions WHERE TokenHash = ? AND ExpiresAt > ?",
+                                (token_hash(token), time.time())).fetchone() is not None
+
+    def close(self, token):
+        deleted = 0
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                deleted = conn.execute("DELETE FROM Sessions WHERE TokenHash = ?", (token_hash(token),)).rowcount
+                conn.commit()
+
+        with self.lock:
+            self.revocations += 1
+        user = self.cache.pop(token)
+        if user is not None:
+            self.forget(token, user)
+        return user is not None or deleted > 0
+
+    def invalidate_user(self, user_type, user_id):
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                conn.execute("DELETE FROM Sessions WHERE User_type = ? AND User_id = ?", (user_type, user_id))
+                conn.commit()
+
+        with self.lock:
+            self.revocations += 1
+            tokens = self.by_user.pop((user_type, user_id), set())
+        for token in tokens:
+            self.cache.pop(token)
+        return len(tokens)
+
+    def update_user(self, user_type, user_id, **fields):
+        with self.lock:
+            tokens = list(self.by_user.get((user_type, user_id), ()))
+        for token in tokens:
+            user = self.cache.get(token)
+            if user is not None:
+                user.update(fields)
+
+
+class ProfileCache:
+    def __init__(self, profile_size=PROFILE_CACHE_SIZE, details_size=ORDER_DETAILS_CACHE_SIZE):
+        self.caches = {
+            "driver": LRUCache(profile_size),
+            "passenger": LRUCache(profile_size),
+            "about": LRUCache(details_size),
+        }
+        self.lock = threading.Lock()
+        self.generations = dict.fromkeys(self.caches, 0)
+
+    def cached(self, kind, ids):
+        return self.caches[kind].get_many(ids)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.generations)
+
+    def fill(self, snapshot, kind, items):
+        with self.lock:
+            if self.generations[kind] == snapshot[kind]:
+                self.caches[kind].put_many(items)
+
+    def get_many(self, conn, kind, ids, defer=None):
+        wanted = set(ids)
+        wanted.discard(None)
+        found = self.cached(kind, wanted)
+        missing = [item_id for item_id in wanted if item_id not in found]
+
+        for start in range(0, len(missing), CACHE_QUERY_CHUNK):
+            chunk = missing[start:start + CACHE_QUERY_CHUNK]
+            snapshot = self.snapshot()
+            rows = conn.execute(PROFILE_QUERIES[kind].format(", ".join("?" * len(chunk))), chunk).fetchall()
+            items = [(row[0], row[1:]) for row in rows]
+            found.update(items)
+            if defer is None:
+                self.fill(snapshot, kind, items)
+            else:
+                defer(self.fill, snapshot, kind, items)
+        return found
+
+    def get(self, conn, kind, item_id, defer=None):
+        return self.get_many(conn, kind, (item_id,), defer).get(item_id)
+
+    def invalidate(self, kind, item_id):
+        with self.lock:
+            self.generations[kind] += 1
+            self.caches[kind].pop(item_id)
+
+    def clear(self):
+        with self.lock:
+            for kind, cache in self.caches.items():
+                self.generations[kind] += 1
+                cache.clear()
+
+    def stats(self):
+        return {kind: cache.stats() for kind, cache in self.caches.items()}
+
+
+class DuberService:
+    def __init__(self, pool, book=None, kdf=PASSWORD_KDF, password_cost=None, password_workers=PASSWORD_WORKERS,
+                 persist_sessions=False, write_batch_size=WRITE_BATCH_SIZE, write_batch_delay=WRITE_BATCH_DELAY):
+        self.pool = pool
+        self.writes = WriteBatcher(pool, write_batch_size, write_batch_delay)
+        self.book = book if book is not None else OpenOrderBook()
+        self.kdf = kdf
+        self.password_cost = password_cost or PASSWORD_COSTS[kdf]
+        self.hasher = concurrent.futures.ThreadPoolExecutor(max_workers=password_workers,
+                                                            thread_name_prefix="password")
+        self.hash_slots = threading.BoundedSemaphore(PASSWORD_MAX_PENDING)
+        self.dummy_hash = None
+        self.bus = NotificationBus()
+        self.sessions = SessionStore(pool if persist_sessions else None)
+        self.profiles = ProfileCache()
+        self.addresses = AddressTrie()
+        self.routes = RouteEstimator(writes=self.writes)
+        self.read_marks = []
+        self.read_marks_lock = threading.Lock()
+
+    def load(self):
+        with self.pool.connection() as conn:
+            self.book.load(conn)
+            self.addresses.load(conn)
+
+    def close(self):
+        self.hasher.shutdown(wait=True)
+        self.writes.close()
+        self.pool.close()
+
+    @METRICS.timed("find_credentials")
+    def find_credentials(self, user_type, username):
+        if user_type == "driver":
+            query = DRIVER_LOGIN_QUERY
+        elif user_type == "passenger":
+            query = PASSENGER_LOGIN_QUERY
+        else:
+            raise ValueError(f"неизвестный тип пользователя: {user_type}")
+
+        with self.pool.connection() as conn:
+            user_data = conn.execute(query, (username,)).fetchone()
+
+        if not user_data:
+            return None, None, None
+        user = {
+            'id': user_data[0],
+            'username': user_data[1],
+            'rating': user_data[2],
+            'type': user_type
+        }
+        return user, user_data[3], user_data[4]
+
+    def check_credentials(self, password, stored_hash, salt):
+        if stored_hash is None:
+            self.dummy_hash = self.dummy_hash or hash_password("", "", self.kdf, self.password_cost)
+            verify_password(password, self.dummy_hash, "")
+            return False, None
+
+        if not verify_password(password, stored_hash, salt):
+            return False, None
+        if needs_rehash(stored_hash, self.kdf, self.password_cost):
+            return True, new_credentials(password, self.kdf, self.password_cost)
+        return True, None
+
+    def submit_password_job(self, fn, *args, timeout=PASSWORD_QUEUE_TIMEOUT):
+        if not self.hash_slots.acquire(timeout=timeout):
+            raise TimeoutError("слишком много одновременных входов, повторите позже")
+        try:
+            future = self.hasher.submit(fn, *args)
+        except RuntimeError:
+            self.hash_slots.release()
+            raise
+        future.add_done_callback(lambda _: self.hash_slots.release())
+        return future
+
+    def submit_password_check(self, password, stored_hash, salt, timeout=PASSWORD_QUEUE_TIMEOUT):
+        return self.submit_password_job(self.check_credentials, password, stored_hash, salt, timeout=timeout)
+
+    def store_password_hash(self, user, old_hash, credentials):
+        table, column = credential_table(user['type'])
+
+        with self.pool.connection() as conn:
+            conn.execute(f"UPDATE {table} SET PasswordHash = ?, Salt = ? WHERE {column} = ? AND PasswordHash = ?",
+                         (credentials[0], credentials[1], user['id'], old_hash))
+            conn.commit()
+
+    @METRICS.timed("login_user")
+    def login(self, user_type, username, password):
+        user, stored_hash, salt = self.find_credentials(user_type, username)
+        ok, rehashed = self.submit_password_check(password, stored_hash, salt).result()
+        if not ok:
+            return None
+        if rehashed:
+            self.store_password_hash(user, stored_hash, rehashed)
+        return user
+
+    @METRICS.timed("change_password")
+    def change_password(self, user, old_password, new_password):
+        if not new_password:
+            raise ValueError("новый пароль не может быть пустым")
+        table, column = credential_table(user['type'])
+
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT PasswordHash, Salt FROM {table} WHERE {column} = ?", (user['id'],)).fetchone()
+        ok, _ = self.submit_password_check(old_password, *(row or (None, None))).result()
+        if not ok:
+            raise PermissionError("неверный текущий пароль")
+
+        password_hash, salt = self.submit_password_job(new_credentials, new_password, self.kdf,
+                                                       self.password_cost).result()
+        with self.pool.connection() as conn:
+            conn.execute(f"UPDATE {table} SET PasswordHash = ?, Salt = ? WHERE {column} = ?",
+                         (password_hash, salt, user['id']))
+            conn.commit()
+        return self.sessions.invalidate_user(user['type'], user['id'])
+
+    def open_session(self, user):
+        return self.sessions.open(user)
+
+    def session(self, token):
+        return self.sessions.get(token)
+
+    def close_session(self, token):
+        return self.sessions.close(token)
+
+    def order_listing(self, conn, user, after=None, limit=HISTORY_PAGE_SIZE):
+        driver = user['type'] == 'driver'
+        kind = 'passenger' if driver else 'driver'
+        created_at, row_id, limit = history_page(after, limit)
+        keys, after = split_page(conn.execute(DRIVER_ORDER_KEYS_QUERY if driver else PASSENGER_ORDER_KEYS_QUERY,
+                                              (user['id'], created_at, row_id, limit + 1)).fetchall(), limit, 3)
+        details = self.profiles.get_many(conn, 'about', [key[2] for key in keys])
+        people = self.profiles.get_many(conn, kind, [key[1] for key in keys])
+        return [(order_id, people[person_id][0] if person_id in people else None)
+                + details[about_order_id] + (created,)
+                for order_id, person_id, about_order_id, created in keys
+                if about_order_id in details and (person_id in people or not driver)], after
+
+    @METRICS.timed("show_user_orders")
+    def user_orders(self, user, after=None, limit=HISTORY_PAGE_SIZE):
+        with self.pool.connection() as conn:
+            rows, after = self.order_listing(conn, user, after, limit)
+
+        counterpart = 'passenger' if user['type'] == 'driver' else 'driver'
+        return [{
+            'order_id': row[0],
+            counterpart: row[1],
+            'delivery_address': row[2],
+            'final_address': row[3],
+            'time_order': row[4],
+            'price': row[5],
+            'distance_km': row[6],
+            'created_at': row[7],
+        } for row in rows], after
+
+    @METRICS.timed("show_notifications")
+    def notifications(self, user, mark_read=True, after=None, limit=HISTORY_PAGE_SIZE):
+        if user['type'] != 'passenger':
+            raise PermissionError("уведомления доступны только для пассажиров")
+        created_at, row_id, limit = history_page(after, limit)
+
+        with self.pool.connection() as conn:
+            rows, after = split_page(conn.execute(UNREAD_NOTIFICATIONS_QUERY,
+                                                  (user['id'], created_at, row_id, limit + 1)).fetchall(), limit, 2)
+            if rows and mark_read:
+                conn.executemany("UPDATE Notification SET IsRead = 1 WHERE notification_id = ?",
+                                 [(row[0],) for row in rows])
+                conn.commit()
+
+        if rows and mark_read:
+            self.bus.discard(user['id'], {row[0] for row in rows})
+        return [{'id': row[0], 'passenger_id': user['id'], 'message': row[1], 'created_at': row[2]}
+                for row in rows], after
+
+    def mark_read(self, notification_ids):
+        with self.read_marks_lock:
+            self.read_marks.extend(notification_ids)
+            full = len(self.read_marks) >= NOTIFY_READ_BATCH
+        if full:
+            self.flush_read_marks()
+
+    @METRICS.timed("flush_read_marks")
+    def flush_read_marks(self):
+        with self.read_marks_lock:
+            notification_ids, self.read_marks = self.read_marks, []
+        if not notification_ids:
+            return 0
+
+        try:
+            with self.pool.connection() as conn:
+                conn.executemany("UPDATE Notification SET IsRead = 1 WHERE notification_id = ?",
+                                 [(notification_id,) for notification_id in notification_ids])
+                conn.commit()
+        except sqlite3.Error:
+            with self.read_marks_lock:
+                self.read_marks.extend(notification_ids)
+            raise
+        return len(notification_ids)
+
+    @METRICS.timed("deletable_orders")
+    def deletable_orders(self, user, after=None, limit=HISTORY_PAGE_SIZE):
+        with self.pool.connection() as conn:
+            rows, after = self.order_listing(conn, user, after, limit)
+
+        counterpart = 'passenger' if user['type'] == 'driver' else 'driver'
+        return [{
+            'order_id': row[0],
+            counterpart: row[1],
+            'delivery_address': row[2],
+            'final_address': row[3],
+        } for row in rows], after
+
+    def owned_order(self, conn, user, order_id, defer=None):
+        driver = user['type'] == 'driver'
+        row = conn.execute(DRIVER_OWNED_ORDER_QUERY if driver else PASSENGER_OWNED_ORDER_QUERY,
+                           (order_id, user['id'])).fetchone()
+        if not row or self.profiles.get(conn, 'about', row[2], defer) is None:
+            return None
+
+        person = self.profiles.get(conn, 'passenger' if driver else 'driver', row[1] if driver else row[3], defer)
+        if driver and person is None:
+            return None
+        return {
+            'order_id': row[0],
+            'passenger_id': row[1],
+            'about_order_id': row[2],
+            'archived': row[4] != "Orders",
+            'passenger' if driver else 'driver': person[0] if person else None,
+        }
+
+    def order_for_deletion(self, user, order_id):
+        with self.pool.connection() as conn:
+            return self.owned_order(conn, user, order_id)
+
+    def remove_order(self, conn, user, order_id):
+        order = self.owned_order(conn, user, order_id, self.writes.after_commit)
+        if not order:
+            raise LookupError(f"заказ с ID {order_id} не найден или не принадлежит вам")
+
+        if order['archived']:
+            conn.execute("DELETE FROM ArchivedOrders WHERE Orders_id = ?", (order_id,))
+            order['about_deleted'] = conn.execute("""
+                DELETE FROM ArchivedAbout_orders
+                WHERE About_orders_id = ?1 AND NOT EXISTS (SELECT 1 FROM Orders WHERE About_orders_id = ?1)
+            """, (order['about_order_id'],)).rowcount == 1
+        else:
+            conn.execute("DELETE FROM Orders WHERE Orders_id = ?", (order_id,))
+
+            other_orders_count = conn.execute(ORDER_USAGE_QUERY, (order['about_order_id'],)).fetchone()[0]
+            order['about_deleted'] = other_orders_count == 0
+            if order['about_deleted']:
+                conn.execute("DELETE FROM About_orders WHERE About_orders_id = ?", (order['about_order_id'],))
+
+        if order['about_deleted']:
+            self.writes.after_commit(self.profiles.invalidate, 'about', order['about_order_id'])
+
+        if user['type'] == 'driver':
+            message = f"Водитель {user['username']} удалил заказ #{order_id} из системы."
+        else:
+            message = f"Вы удалили свой заказ #{order_id} из системы."
+        return order, insert_notification(conn, order['passenger_id'], message)
+
+    @METRICS.timed("delete_order")
+    def delete_order(self, user, order_id):
+        order, notification = self.writes.call(self.remove_order, user, order_id)
+
+        self.book.remove(order_id)
+        self.bus.publish([notification])
+        return order
+
+    @METRICS.timed("show_available_orders")
+    def available_orders(self, after=None, limit=ORDER_BOOK_PAGE_SIZE):
+        rows, after = self.book.page(after, limit)
+        return [order_record(row) for row in rows], after
+
+    @METRICS.timed("show_nearest_orders")
+    def nearest_orders(self, lat, lon, k=NEAREST_DEFAULT_K, radius_km=NEAREST_DEFAULT_RADIUS_KM):
+        k, radius_km = nearest_params(k, radius_km)
+        return [dict(order_record(row), pickup_distance_km=distance)
+                for distance, row in self.book.nearest(lat, lon, k, radius_km)]
+
+    @METRICS.timed("update_location")
+    def update_location(self, driver, lat, lon):
+        if driver['type'] != 'driver':
+            raise PermissionError("местоположение сохраняется только для водителей")
+
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE Drivers SET Current_lat = ?, Current_lon = ?, IsAvailable = 1 WHERE Driver_id = ?",
+                         (lat, lon, driver['id']))
+            conn.commit()
+
+    def update_rating(self, user_type, user_id, rating):
+        if not 0 <= rating <= 5:
+            raise ValueError("рейтинг должен быть от 0 до 5")
+        table, column = user_table(user_type)
+
+        with self.pool.connection() as conn:
+            updated = conn.execute(f"UPDATE {table} SET Rating = ? WHERE {column} = ?", (rating, user_id)).rowcount
+            conn.commit()
+        if not updated:
+            raise LookupError(f"пользователь с ID {user_id} не найден")
+        self.rating_changed(user_type, user_id, rating)
+
+    def rating_changed(self, user_type, user_id, rating):
+        self.profiles.invalidate(user_type, user_id)
+        self.sessions.update_user(user_type, user_id, rating=rating)
+
+    @METRICS.timed("rate_order")
+    def rate_order(self, user, order_id, score):
+        if not RATING_MIN <= score <= RATING_MAX:
+            raise ValueError(f"оценка должна быть от {RATING_MIN} до {RATING_MAX}")
+
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT Driver_id, Passenger_id FROM AllOrders WHERE Orders_id = ?",
+                                   (order_id,)).fetchone()
+                if not row or user['id'] != (row[0] if user['type'] == 'driver' else row[1]):
+                    raise LookupError(f"поездка с ID {order_id} не найдена или не принадлежит вам")
+                if row[0] is None:
+                    raise ValueError("оценить можно только поездку с назначенным водителем")
+
+                ratee_type, ratee_id = ('passenger', row[1]) if user['type'] == 'driver' else ('driver', row[0])
+                try:
+                    rating = record_rating(conn, order_id, user['type'], user['id'], ratee_type, ratee_id, score)
+                except sqlite3.IntegrityError:
+                    raise ValueError("вы уже оценили эту поездку") from None
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+        self.rating_changed(ratee_type, ratee_id, rating)
+        return {'order_id': order_id, 'ratee_type': ratee_type, 'ratee_id': ratee_id, 'score': score,
+                'rating': rating}
+
+    @METRICS.timed("suggest_addresses")
+    def suggest_addresses(self, user, prefix, limit=ADDRESS_SUGGEST_LIMIT):
+        if not 1 <= limit <= ADDRESS_SUGGEST_LIMIT_MAX:
+            raise ValueError(f"limit должен быть от 1 до {ADDRESS_SUGGEST_LIMIT_MAX}")
+        prefixes = address_tokens(prefix)
+
+        with self.pool.connection() as conn:
+            if self.addresses.stale():
+                self.addresses.load(conn)
+            personal = []
+            if user['type'] == 'passenger':
+                for address, uses in conn.execute(PASSENGER_ADDRESSES_QUERY, (user['id'], ADDRESS_PERSONAL_SCAN)):
+                    if address_matches(prefixes, address_tokens(address)):
+                        personal.append({'address': address, 'uses': uses})
+                        if len(personal) == limit:
+                            break
+
+            popular = self.addresses.lookup(prefixes, limit + len(personal))
+            if popular is None and prefixes:
+                popular = conn.execute(ADDRESS_SEARCH_QUERY, (address_match_query(prefixes),
+                                                              limit + len(personal))).fetchall()
+            elif popular is None:
+                popular = conn.execute(POPULAR_ADDRESSES_QUERY, (limit + len(personal),)).fetchall()
+
+        own = {item['address'] for item in personal}
+        return {
+            'personal': personal,
+            'popular': [{'address': address, 'uses': uses} for address, uses in popular if address not in own][:limit],
+        }
+
+    @METRICS.timed("estimate_routes")
+    def estimate_routes(self, routes):
+        routes = [(str(delivery_address), str(final_address)) for delivery_address, final_address in routes]
+        if len(routes) > ROUTE_BATCH_MAX:
+            raise ValueError(f"за один запрос можно оценить не больше {ROUTE_BATCH_MAX} маршрутов")
+
+        with self.pool.connection() as conn:
+            return self.routes.estimate_many(conn, routes)
+
+    def estimate_route(self, delivery_address, final_address):
+        return self.estimate_routes([(delivery_address, final_address)])[0]
+
+    def archive(self, order_days=ARCHIVE_ORDER_AGE_DAYS, notification_days=ARCHIVE_NOTIFICATION_AGE_DAYS, stop=None):
+        with self.pool.connection() as conn:
+            return archive_history(conn, order_days, notification_days, stop=stop)
+
+    def cache_stats(self):
+        return dict(self.profiles.stats(), sessions=self.sessions.cache.stats(), routes=self.routes.stats())
+
+    @METRICS.timed("accept_order")
+    def accept_order(self, driver, order_id):
+        if driver['type'] != 'driver':
+            raise PermissionError("принимать заказы могут только водители")
+
+        result, notification = self.writes.call(apply_acceptance, order_id, driver)
+
+        if result != ACCEPT_MISSING:
+            self.book.remove(order_id)
+        if notification is not None:
+            self.bus.publish([notification])
+        return result
+
+    def insert_order(self, conn, passenger, delivery_address, final_address, time_order, price, distance_km,
+                     pickup_lat, pickup_lon):
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO About_orders (Delivery_address, Time_order, Price, Final_address, Distance_km,
+                                      Pickup_lat, Pickup_lon)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (delivery_address, time_order, price, final_address, distance_km, pickup_lat, pickup_lon))
+
+        about_order_id = cursor.lastrowid
+
+        cursor.execute("""
+            INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id)
+            VALUES (NULL, ?, ?)
+        """, (passenger['id'], about_order_id))
+
+        order_id = cursor.lastrowid
+
+        notification = insert_notification(conn, passenger['id'],
+                                           f"Ваш заказ #{order_id} создан! Ожидайте водителя.")
+        route = self.routes.observe(conn, delivery_address, final_address, distance_km, price, pickup_lat, pickup_lon)
+        self.writes.after_commit(self.routes.cache.put, *route)
+        self.writes.after_commit(self.profiles.invalidate, 'about', about_order_id)
+        return about_order_id, order_id, notification
+
+    @METRICS.timed("create_order")
+    def create_order(self, passenger, delivery_address, final_address, time_order, price=None, distance_km=None,
+                     pickup_lat=None, pickup_lon=None):
+        if passenger['type'] != 'passenger':
+            raise PermissionError("создавать заказы могут только пассажиры")
+        if (pickup_lat is None) != (pickup_lon is None):
+            raise ValueError("нужны обе координаты подачи")
+        if pickup_lat is not None and not (-90 <= pickup_lat <= 90 and -180 <= pickup_lon <= 180):
+            raise ValueError("координаты подачи вне допустимого диапазона")
+        if price is None or distance_km is None:
+            estimate = self.estimate_route(delivery_address, final_address)
+            if estimate is None:
+                raise ValueError("не удалось оценить маршрут, укажите стоимость и расстояние")
+            price = estimate['price'] if price is None else price
+            distance_km = estimate['distance_km'] if distance_km is None else distance_km
+
+        about_order_id, order_id, notification = self.writes.call(
+            self.insert_order, passenger, delivery_address, final_address, time_order, price, distance_km,
+            pickup_lat, pickup_lon)
+
+        row = (about_order_id, passenger['username'], delivery_address, final_address,
+               time_order, price, distance_km, order_id, pickup_lat, pickup_lon)
+        self.book.add(row)
+        self.bus.publish([notification])
+        return order_record(row)
+
+
+def login_user(service, user_type):
+    print(f"\n=== Авторизация {user_type}а ===")
+
+    username = input("Введите ФИО: ")
+    password = input("Введите пароль: ")
+
+    try:
+        user = service.login(user_type, username, password)
+    except (sqlite3.Error, TimeoutError) as e:
+        print(f"\n✗ Ошибка при авторизации: {e}")
+        return None
+
+    if user:
+        print(f"\n✓ Успешный вход! Добро пожаловать, {user['username']}!")
+        return user
+
+    print("\n✗ Ошибка: Неверное имя пользователя или пароль!")
+    return None
+
+
+def show_user_menu(service, user):
+    while True:
+        print(f"\n{'=' * 40}")
+        print(f"МЕНЮ: {user['username']} ({user['type']})")
+        print(f"{'=' * 40}")
+        print("1. 📋 Просмотреть мои заказы")
+        print("2. 🔔 Просмотреть уведомления")
+        print("3. 🗑️ Удалить заказ (физическое удаление)")
+        print("4. 🚪 Выйти из аккаунта")
+
+        if user['type'] == 'driver':
+            print("5. 📦 Просмотреть доступные заказы")
+            print("6. ✅ Принять заказ")
+            print("7. 📍 Найти ближайшие открытые заказы")
+        elif user['type'] == 'passenger':
+            print("2. 🔔 Просмотреть уведомления")
+            print("5. 🚕 Создать новый заказ")
+        print("8. 🔑 Сменить пароль")
+        print("9. ⭐ Оценить поездку")
+
+        choice = input("\nВыберите действие (1-9): ")
+
+        if choice == '4':
+            print("\nВыход из аккаунта...")
+            break
+        elif choice == '1':
+            show_user_orders(service, user)
+        elif choice == '2':
+            show_notifications(service, user)
+        elif choice == '3':
+            delete_order(service, user)
+        elif choice == '5' and user['type'] == 'driver':
+            show_available_orders(service)
+        elif choice == '6' and user['type'] == 'driver':
+            accept_order(service, user)
+        elif choice == '7' and user['type'] == 'driver':
+            show_nearest_orders(service, user)
+        elif choice == '5' and user['type'] == 'passenger':
+            create_order(service, user)
+        elif choice == '8':
+            change_password(service, user)
+        elif choice == '9':
+            rate_order(service, user)
+        else:
+            print("\n✗ Неверный выбор! Попробуйте снова.")
+
+
+def change_password(service, user):
+    old_password = input("Текущий пароль: ")
+    new_password = input("Новый пароль: ")
+
+    if input("Повторите новый пароль: ") != new_password:
+        print("\n✗ Ошибка: Пароли не совпадают!")
+        return
+
+    try:
+        closed = service.change_password(user, old_password, new_password)
+    except (ValueError, PermissionError) as e:
+        print(f"\n✗ Ошибка: {e}!")
+        return
+    except (sqlite3.Error, TimeoutError) as e:
+        print(f"\n✗ Ошибка при смене пароля: {e}")
+        return
+
+    print(f"\n✓ Пароль изменён. Завершено других сессий: {closed}")
+
+
+def show_user_orders(service, user):
+    after = None
+    shown = 0
+    while True:
+        try:
+            orders, after = service.user_orders(user, after)
+        except sqlite3.Error as e:
+            print(f"\n✗ Ошибка при загрузке заказов: {e}")
+            return
+
+        if not shown:
+            if not orders:
+                print("\n📭 У вас пока нет заказов.")
+                return
+            print("\n📋 Ваши заказы (сначала новые):")
+            print("-" * 90)
+        for order in orders:
+            print(f"   ID заказа: {order['order_id']}")
+            if user['type'] == 'driver':
+                print(f"   Пассажир: {order['passenger']}")
+            else:
+                print(f"   Водитель: {order['driver'] if order['driver'] else 'Ожидание водителя...'}")
+            print(f"   Откуда: {order['delivery_address']}")
+            print(f"   Куда: {order['final_address']}")
+            print(f"   Время: {order['time_order']}")
+            print(f"   Цена: {order['price']} руб.")
+            print(f"   Расстояние: {order['distance_km']} км")
+            print(f"   Создан: {order['created_at']}")
+            print("-" * 90)
+        shown += len(orders)
+
+        if after is None or input(f"Показано {shown}. Показать ещё? (д/н): ").strip().lower() not in ("д", "y"):
+            break
+
+
+def show_notifications(service, user):
+    if user['type'] != 'passenger':
+        print("\nℹ️ Уведомления доступны только для пассажиров.")
+        return
+
+    after = None
+    shown = 0
+    while True:
+        try:
+            notifications, after = service.notifications(user, after=after)
+        except sqlite3.Error as e:
+            print(f"\n✗ Ошибка при загрузке уведомлений: {e}")
+            return
+
+        if not shown:
+            if not notifications:
+                print("\n📭 У вас нет новых уведомлений.")
+                return
+            print("\n🔔 Ваши уведомления (сначала новые):")
+            print("-" * 60)
+        for notification in notifications:
+            print(f"   ID: {notification['id']}")
+            print(f"   Сообщение: {notification['message']}")
+            print(f"   Время: {notification['created_at']}")
+            print("-" * 60)
+        shown += len(notifications)
+
+        if after is None or input(f"Показано {shown}. Показать ещё? (д/н): ").strip().lower() not in ("д", "y"):
+            break
+
+
+def delete_order(service, user):
+    try:
+        print(f"\n{'=' * 60}")
+        print("🗑️  УДАЛЕНИЕ ЗАКАЗА ИЗ БАЗЫ ДАННЫХ")
+        print("=" * 60)
+        print("⚠️  ВНИМАНИЕ: Это действие НЕОБРАТИМО!")
+        print("   Заказ будет полностью удален из базы данных.")
+        print("-" * 60)
+
+        orders, after = service.deletable_orders(user)
+
+        if not orders:
+            print("У вас нет заказов для удаления.")
+            return
+
+        print("\n📋 Ваши заказы (сначала новые):")
+        print("-" * 70)
+        while True:
+            for order in orders:
+                if user['type'] == 'driver':
+                    print(f"   ID: {order['order_id']}, Пассажир: {order['passenger']}")
+                else:
+                    print(f"   ID: {order['order_id']}, "
+                          f"Водитель: {order['driver'] if order['driver'] else 'Не назначен'}")
+                print(f"      Откуда: {order['delivery_address']}")
+                print(f"      Куда: {order['final_address']}")
+                print("-" * 70)
+
+            if after is None:
+                order_id = input("\nВведите ID заказа для удаления: ")
+                break
+            order_id = input("\nВведите ID заказа для удаления (Enter — показать ещё): ").strip()
+            if order_id:
+                break
+            orders, after = service.deletable_orders(user, after)
+
+        if not order_id.isdigit():
+            print("\n✗ Ошибка: ID заказа должен быть числом!")
+            return
+
+        order_data = service.order_for_deletion(user, int(order_id))
+
+        if not order_data:
+            print(f"\n✗ Ошибка: Заказ с ID {order_id} не найден или не принадлежит вам!")
+            return
+
+        print(f"\n📄 Информация о заказе #{order_id}:")
+        print("-" * 50)
+        if user['type'] == 'driver':
+            print(f"   Пассажир: {order_data['passenger']}")
+        else:
+            print(f"   Водитель: {order_data['driver'] if order_data['driver'] else 'Не назначен'}")
+
+        print(f"\n{'!' * 60}")
+        print("⚠️  ВНИМАНИЕ! ⚠️")
+        print(f"Вы собираетесь ФИЗИЧЕСКИ удалить заказ #{order_id}!")
+        print(f"Это действие НЕЛЬЗЯ отменить!")
+        print(f"{'!' * 60}")
+
+        confirm1 = input(f"\nДля подтверждения введите 'УДАЛИТЬ': ")
+
+        if confirm1 != 'УДАЛИТЬ':
+            print("❌ Удаление отменено.")
+            return
+
+        confirm2 = input(f"\nПоследнее подтверждение. Введите 'ДА, УДАЛИТЬ': ")
+
+        if confirm2 != 'ДА, УДАЛИТЬ':
+            print("❌ Удаление отменено.")
+            return
+
+        deleted = service.delete_order(user, int(order_id))
+
+        print(f"✓ Запись Orders #{order_id} удалена")
+        if deleted['about_deleted']:
+            print(f"✓ Детали заказа About_orders #{deleted['about_order_id']} удалены")
+        if user['type'] == 'driver':
+            print(f"✓ Пассажир #{deleted['passenger_id']} уведомлен об удалении")
+        else:
+            print(f"✓ Вы уведомлены об удалении заказа")
+
+        print(f"\n✅ Заказ #{order_id} успешно УДАЛЕН из базы данных!")
+        print("⚠️  Восстановление данных НЕВОЗМОЖНО!")
+
+    except LookupError:
+        print(f"\n✗ Ошибка: Заказ с ID {order_id} не найден или не принадлежит вам!")
+    except sqlite3.Error as e:
+        print(f"\n✗ Ошибка при удалении заказа: {e}")
+        print("❌ Удаление отменено из-за ошибки.")
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def nearest_params(k, radius_km):
+    k, radius_km = int(k), float(radius_km)
+    if k < 1:
+        raise ValueError("количество заказов должно быть не меньше 1")
+    if not radius_km > 0:
+        raise ValueError("радиус поиска должен быть больше нуля")
+    return k, radius_km
+
+
+class GeoGrid:
+    def __init__(self, cell_degrees=GEO_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.points = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def add(self, item_id, lat, lon):
+        self.remove(item_id)
+        cell = self.cell(lat, lon)
+        self.cells.setdefault(cell, {})[item_id] = (lat, lon)
+        self.points[item_id] = cell
+
+    def remove(self, item_id):
+        cell = self.points.pop(item_id, None)
+        if cell is None:
+            return False
+        bucket = self.cells[cell]
+        del bucket[item_id]
+        if not bucket:
+            del self.cells[cell]
+        return True
+
+    def nearest(self, lat, lon, k, radius_km):
+        if k <= 0 or radius_km <= 0:
+            return []
+        row, col = self.cell(lat, lon)
+        cell_km = self.cell_degrees * KM_PER_DEGREE * max(math.cos(math.radians(abs(lat) + self.cell_degrees)), 0.01)
+        max_ring = int(math.ceil(radius_km / cell_km))
+        found = []
+
+        if (2 * max_ring + 1) ** 2 > len(self.cells):
+            for (i, j), bucket in self.cells.items():
+                if abs(i - row) > max_ring or abs(j - col) > max_ring:
+                    continue
+                for item_id, (item_lat, item_lon) in bucket.items():
+                    distance = haversine_km(lat, lon, item_lat, item_lon)
+                    if distance <= radius_km:
+                        found.append((distance, item_id))
+            return heapq.nsmallest(k, found)
+
+        for ring in range(max_ring + 1):
+            for i in range(row - ring, row + ring + 1):
+                for j in range(col - ring, col + ring + 1):
+                    if ring and row - ring < i < row + ring and col - ring < j < col + ring:
+                        continue
+                    for item_id, (item_lat, item_lon) in self.cells.get((i, j), {}).items():
+                        distance = haversine_km(lat, lon, item_lat, item_lon)
+                        if distance <= radius_km:
+                            found.append((distance, item_id))
+
+            if len(found) >= k:
+                nearest = heapq.nsmallest(k, found)
+                if nearest[-1][0] <= ring * cell_km:
+                    return nearest
+
+        return heapq.nsmallest(k, found)
+
+
+class OpenOrderBook:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = []
+        self.rows = {}
+        self.key_by_order = {}
+        self.grid = GeoGrid()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def load(self, conn):
+        rows = conn.execute(OPEN_ORDERS_QUERY).fetchall()
+        with self.lock:
+            self.rows = {self.make_key(row): row for row in rows}
+            self.keys = sorted(self.rows)
+            self.key_by_order = {key[2]: key for key in self.keys if key[2]}
+            self.grid = GeoGrid()
+            for row in rows:
+                if row[7] and row[8] is not None and row[9] is not None:
+                    self.grid.add(row[7], row[8], row[9])
+
+    @staticmethod
+    def make_key(row):
+        return row[4], row[0], row[7] or 0
+
+    def add(self, row):
+        key = self.make_key(row)
+        with self.lock:
+            if key in self.rows:
+                return
+            bisect.insort(self.keys, key)
+            self.rows[key] = row
+            if key[2]:
+                self.key_by_order[key[2]] = key
+                if row[8] is not None and row[9] is not None:
+                    self.grid.add(key[2], row[8], row[9])
+
+    def remove(self, order_id):
+        with self.lock:
+            key = self.key_by_order.pop(order_id, None)
+            if key is None:
+                return False
+            del self.keys[bisect.bisect_left(self.keys, key)]
+            del self.rows[key]
+            self.grid.remove(order_id)
+            return True
+
+    def nearest(self, lat, lon, k=NEAREST_DEFAULT_K, radius_km=NEAREST_DEFAULT_RADIUS_KM):
+        with self.lock:
+            return [(distance, self.rows[self.key_by_order[order_id]])
+                    for distance, order_id in self.grid.nearest(lat, lon, k, radius_km)]
+
+    def top(self, k):
+        with self.lock:
+            return [self.rows[key] for key in self.keys[:k]]
+
+    def page(self, after=None, limit=ORDER_BOOK_PAGE_SIZE):
+        after, limit = book_page(after, limit)
+        with self.lock:
+            start = bisect.bisect_right(self.keys, after) if after else 0
+            keys = self.keys[start:start + limit]
+            rows = [self.rows[key] for key in keys]
+            more = start + limit < len(self.keys)
+        return rows, (keys[-1] if more else None)
+
+
+def book_page(after, limit):
+    if after is not None:
+        try:
+            time_order, about_order_id, order_id = after
+            after = str(time_order), int(about_order_id), int(order_id)
+        except (TypeError, ValueError):
+            raise ValueError(f"некорректный курсор страницы: {after!r}") from None
+    return after, min(max(int(limit), 1), ORDER_BOOK_PAGE_SIZE_MAX)
+
+
+def wake_waiter(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class NotificationBus:
+    def __init__(self, buffer_size=NOTIFY_CHANNEL_BUFFER, subscription_ttl=NOTIFY_SUBSCRIPTION_TTL):
+        self.buffer_size = buffer_size
+        self.subscription_ttl = subscription_ttl
+        self.lock = threading.Lock()
+        self.channels = {}
+        self.waiters = {}
+        self.subscribers = {}
+        self.expired_at = time.monotonic()
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, passenger_id):
+        now = time.monotonic()
+        with self.lock:
+            seen = self.subscribers.get(passenger_id)
+            self.subscribers[passenger_id] = now
+        return seen is None or now - seen > self.subscription_ttl
+
+    def expire(self, now):
+        for passenger_id, seen in list(self.subscribers.items()):
+            if now - seen > self.subscription_ttl and passenger_id not in self.waiters:
+                del self.subscribers[passenger_id]
+                self.channels.pop(passenger_id, None)
+        self.expired_at = now
+
+    def publish(self, notifications):
+        waiters = []
+        now = time.monotonic()
+        with self.lock:
+            for notification in notifications:
+                passenger_id = notification['passenger_id']
+                self.published += 1
+                if passenger_id not in self.subscribers:
+                    continue
+                channel = self.channels.get(passenger_id)
+                if channel is None:
+                    channel = self.channels[passenger_id] = collections.deque(maxlen=self.buffer_size)
+                channel.append(notification)
+                waiters.extend(self.waiters.pop(passenger_id, ()))
+            if now - self.expired_at > self.subscription_ttl:
+                self.expire(now)
+
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(wake_waiter, future)
+
+    def take(self, passenger_id):
+        with self.lock:
+            messages = list(self.channels.pop(passenger_id, ()))
+            self.delivered += len(messages)
+        return messages
+
+    def discard(self, passenger_id, notification_ids):
+        with self.lock:
+            channel = self.channels.get(passenger_id)
+            if not channel:
+                return 0
+            kept = [notification for notification in channel if notification['id'] not in notification_ids]
+            discarded = len(channel) - len(kept)
+            channel.clear()
+            channel.extend(kept)
+        return discarded
+
+    async def wait(self, passenger_id, timeout):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self.lock:
+            if self.channels.get(passenger_id):
+                future.set_result(None)
+            else:
+                self.waiters.setdefault(passenger_id, []).append(waiter)
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                waiters = self.waiters.get(passenger_id)
+                if waiters and waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self.waiters[passenger_id]
+                self.subscribers[passenger_id] = time.monotonic()
+
+        return self.take(passenger_id)
+
+
+def address_tokens(text):
+    return ADDRESS_TOKEN.findall(text.lower())
+
+
+def address_matches(prefixes, tokens):
+    return all(any(token.startswith(prefix) for token in tokens) for prefix in prefixes)
+
+
+def address_match_query(prefixes):
+    return " ".join(f'"{prefix}"*' for prefix in prefixes)
+
+
+class AddressTrie:
+    def __init__(self, size=ADDRESS_TRIE_SIZE, node_top=ADDRESS_TRIE_NODE_TOP, depth=ADDRESS_TRIE_DEPTH,
+                 ttl=ADDRESS_TRIE_TTL, clock=time.monotonic):
+        self.size = size
+        self.node_top = node_top
+        self.depth = depth
+        self.ttl = ttl
+        self.clock = clock
+        self.root = ({}, [])
+        self.entries = []
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stale(self):
+        return self.loaded_at is None or self.clock() - self.loaded_at > self.ttl
+
+    def load(self, conn):
+        entries = [(address, uses, address_tokens(address))
+                   for address, uses in conn.execute(POPULAR_ADDRESSES_QUERY, (self.size,))]
+        root = ({}, [])
+        for i, (_, _, tokens) in enumerate(entries):
+            if len(root[1]) < self.node_top:
+                root[1].append(i)
+            for token in set(tokens):
+                node = root
+                for char in token[:self.depth]:
+                    node = node[0].setdefault(char, ({}, []))
+                    if len(node[1]) < self.node_top and (not node[1] or node[1][-1] != i):
+                        node[1].append(i)
+
+        self.root, self.entries = root, entries
+        self.loaded_at = self.clock()
+
+    def node(self, prefix):
+        node = self.root
+        for char in prefix[:self.depth]:
+            node = node[0].get(char)
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, prefixes, limit):
+        entries = self.entries
+        nodes = [self.node(prefix) for prefix in prefixes] or [self.root]
+        if None in nodes:
+            return None
+
+        found = []
+        for i in min(nodes, key=lambda node: len(node[1]))[1]:
+            address, uses, tokens = entries[i]
+            if address_matches(prefixes, tokens):
+                found.append((address, uses))
+                if len(found) == limit:
+                    return found
+        return None
+
+
+def route_address(address):
+    return " ".join(address_tokens(address))
+
+
+def route_fare(distance_km):
+    return FARE_BASE + FARE_PER_KM * distance_km
+
+
+def route_record(route, estimate):
+    if estimate is None:
+        return None
+    distance_km, price, trips = estimate
+    return {
+        'delivery_address': route[0],
+        'final_address': route[1],
+        'distance_km': round(distance_km, 1),
+        'price': round(price),
+        'trips': trips,
+        'source': 'history' if trips else 'model',
+    }
+
+
+def store_routes(conn, rows):
+    conn.executemany(ROUTE_STORE, rows)
+
+
+class RouteEstimator:
+    def __init__(self, size=ROUTE_CACHE_SIZE, writes=None):
+        self.cache = LRUCache(size)
+        self.writes = writes
+        self.lock = threading.Lock()
+        self.stored = 0
+        self.computed = 0
+        self.unknown = 0
+        self.store_failed = 0
+
+    def estimate_many(self, conn, routes):
+        keys = {route: (route_address(route[0]), route_address(route[1])) for route in routes}
+        found = self.cache.get_many(set(keys.values()))
+        missing = [key for key in set(keys.values()) if key not in found]
+
+        stored = {}
+        for start in range(0, len(missing), CACHE_QUERY_CHUNK):
+            chunk = missing[start:start + CACHE_QUERY_CHUNK]
+            rows = conn.execute(ROUTE_ESTIMATES_QUERY.format(", ".join(["(?, ?)"] * len(chunk))),
+                                [part for key in chunk for part in key])
+            stored.update(((row[0], row[1]), row[2:]) for row in rows)
+
+        computed = self.compute(conn, [key for key in missing if key not in stored])
+        self.cache.put_many([*stored.items(), *computed.items()])
+        with self.lock:
+            self.stored += len(stored)
+            self.computed += len(computed)
+            self.unknown += len(missing) - len(stored) - len(computed)
+
+        found.update(stored)
+        found.update(computed)
+        return [route_record(route, found.get(keys[route])) for route in routes]
+
+    def compute(self, conn, keys):
+        addresses = list({address for key in keys for address in key})
+        points = {}
+        for start in range(0, len(addresses), CACHE_QUERY_CHUNK):
+            chunk = addresses[start:start + CACHE_QUERY_CHUNK]
+            rows = conn.execute(ADDRESS_POINTS_QUERY.format(", ".join("?" * len(chunk))), chunk)
+            points.update((row[0], row[1:]) for row in rows)
+
+        computed = {}
+        for key in keys:
+            if key[0] in points and key[1] in points:
+                distance_km = haversine_km(*points[key[0]], *points[key[1]]) * ROUTE_DETOUR
+                computed[key] = (distance_km, route_fare(distance_km), 0)
+
+        if computed and self.writes is not None:
+            future = self.writes.submit(store_routes, [(*key, distance_km, price)
+                                                       for key, (distance_km, price, _) in computed.items()])
+            future.add_done_callback(self.stored_routes)
+        return computed
+
+    def stored_routes(self, future):
+        error = future.exception()
+        if error is None:
+            return
+        with self.lock:
+            self.store_failed += 1
+        print(f"✗ Ошибка при сохранении оценок маршрутов: {error}")
+
+    def observe(self, conn, delivery_address, final_address, distance_km, price, pickup_lat=None, pickup_lon=None):
+        key = (route_address(delivery_address), route_address(final_address))
+        estimate = conn.execute(ROUTE_OBSERVE, (*key, distance_km, price)).fetchone()
+        if pickup_lat is not None:
+            conn.execute(POINT_OBSERVE, (key[0], pickup_lat, pickup_lon))
+        return key, estimate
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        stats = self.cache.stats()
+        with self.lock:
+            lookups = stats["hits"] + stats["misses"]
+            hits = stats["hits"] + self.stored
+            return dict(stats, memory_hits=stats["hits"], stored_hits=self.stored, computed=self.computed,
+                        unknown=self.unknown, store_failed=self.store_failed, hits=hits, misses=lookups - hits,
+                        hit_ratio=hits / lookups if lookups else 0.0)
+
+
+def history_page(after, limit):
+    try:
+        created_at, row_id = HISTORY_START if after is None else after
+        row_id = int(row_id)
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректный курсор страницы: {after!r}") from None
+    return str(created_at), row_id, min(max(int(limit), 1), HISTORY_PAGE_SIZE_MAX)
+
+
+def split_page(rows, limit, created_at_column):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1][created_at_column], rows[-1][0])
+
+
+def order_record(row):
+    return {
+        'order_id': row[7],
+        'about_order_id': row[0],
+        'passenger': row[1],
+        'delivery_address': row[2],
+        'final_address': row[3],
+        'time_order': row[4],
+        'price': row[5],
+        'distance_km': row[6],
+        'pickup_lat': row[8],
+        'pickup_lon': row[9],
+    }
+
+
+def print_available_order(order):
+    print(f"   ID заказа: {order['order_id'] if order['order_id'] else 'Новый'}")
+    print(f"   ID деталей: {order['about_order_id']}")
+    print(f"   Пассажир: {order['passenger']}")
+    print(f"   Откуда: {order['delivery_address']}")
+    print(f"   Куда: {order['final_address']}")
+    print(f"   Время: {order['time_order']}")
+    print(f"   Цена: {order['price']} руб.")
+    print(f"   Расстояние: {order['distance_km']} км")
+    print("-" * 100)
+
+
+def parse_coordinates(value):
+    parts = value.replace(";", ",").split(",")
+    if len(parts) != 2:
+        raise ValueError(value)
+    lat, lon = float(parts[0]), float(parts[1])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(value)
+    return lat, lon
+
+
+def show_nearest_orders(service, driver):
+    try:
+        lat, lon = parse_coordinates(input("Ваше местоположение (широта, долгота): "))
+        k = int(input(f"Сколько заказов показать [{NEAREST_DEFAULT_K}]: ") or NEAREST_DEFAULT_K)
+        radius = float(input(f"Радиус поиска, км [{NEAREST_DEFAULT_RADIUS_KM}]: ") or NEAREST_DEFAULT_RADIUS_KM)
+    except ValueError:
+        print("\n✗ Ошибка: Координаты, количество и радиус должны быть числами!")
+        return
+
+    try:
+        k, radius = nearest_params(k, radius)
+    except ValueError as e:
+        print(f"\n✗ Ошибка: {e}!")
+        return
+
+    try:
+        service.update_location(driver, lat, lon)
+    except sqlite3.Error as e:
+        print(f"\n✗ Ошибка при сохранении местоположения: {e}")
+
+    started = time.perf_counter()
+    found = service.nearest_orders(lat, lon, k, radius)
+    elapsed = time.perf_counter() - started
+
+    if not found:
+        print(f"\n📭 В радиусе {radius} км нет открытых заказов.")
+        return
+
+    print(f"\n📍 Ближайшие заказы ({len(found)}, поиск {elapsed * 1000:.3f} мс):")
+    print("-" * 100)
+    for order in found:
+        print(f"   До точки подачи: {order['pickup_distance_km']:.2f} км")
+        print_available_order(order)
+
+
+def show_available_orders(service):
+    if not len(service.book):
+        print("\n📭 Нет доступных заказов в данный момент.")
+        return
+
+    print(f"\n📦 Доступные заказы ({len(service.book)}):")
+    print("-" * 100)
+    after = None
+    while True:
+        orders, after = service.available_orders(after)
+        for order in orders:
+            print_available_order(order)
+        if after is None or input("Показать ещё? (д/н): ").strip().lower() not in ("д", "y"):
+            break
+
+
+def is_busy_error(error):
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return "locked" in str(error)
+
+
+def insert_notification(conn, passenger_id, message):
+    created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    notification_id = conn.execute("""
+        INSERT INTO Notification (Passenger_id, message, CreatedAt)
+        VALUES (?, ?, ?)
+    """, (passenger_id, message, created_at)).lastrowid
+    return {'id': notification_id, 'passenger_id': passenger_id, 'message': message, 'created_at': created_at}
+
+
+def apply_acceptance(conn, order_id, driver):
+    updated = conn.execute("""
+        UPDATE Orders
+        SET Driver_id = ?
+        WHERE Orders_id = ? AND Driver_id IS NULL
+    """, (driver['id'], order_id)).rowcount
+
+    if updated != 1:
+        exists = conn.execute("SELECT 1 FROM Orders WHERE Orders_id = ?", (order_id,)).fetchone()
+        return ACCEPT_TAKEN if exists else ACCEPT_MISSING, None
+
+    passenger_id = conn.execute("SELECT Passenger_id FROM Orders WHERE Orders_id = ?", (order_id,)).fetchone()[0]
+    conn.execute("UPDATE Drivers SET IsAvailable = 0 WHERE Driver_id = ?", (driver['id'],))
+
+    notification = insert_notification(conn, passenger_id,
+                                       f"Ваш заказ #{order_id} принят водителем {driver['username']}!")
+    return ACCEPT_OK, notification
+
+
+def try_accept_order(conn, order_id, driver, retries=ACCEPT_RETRIES, backoff=ACCEPT_BACKOFF, bus=None):
+    for attempt in range(retries + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+
+            result, notification = apply_acceptance(conn, order_id, driver)
+            if result != ACCEPT_OK:
+                conn.rollback()
+                return result
+
+            conn.commit()
+            if bus is not None:
+                bus.publish([notification])
+            return ACCEPT_OK
+
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_busy_error(e) or attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def accept_order(service, driver):
+    order_id = input("Введите ID заказа для принятия: ")
+
+    if not order_id.isdigit():
+        print("\n✗ Ошибка: ID заказа должен быть числом!")
+        return
+
+    try:
+        result = service.accept_order(driver, int(order_id))
+    except sqlite3.Error as e:
+        print(f"\n✗ Ошибка при принятии заказа: {e}")
+        return
+
+    if result == ACCEPT_MISSING:
+        print(f"\n✗ Ошибка: Заказ с ID {order_id} не найден!")
+    elif result == ACCEPT_TAKEN:
+        print(f"\n✗ Ошибка: Этот заказ уже принят другим водителем!")
+    else:
+        print(f"\n✓ Успех! Вы приняли заказ #{order_id}!")
+
+
+def dispatch_costs(orders, drivers, max_pickup_km=DISPATCH_MAX_PICKUP_KM):
+    order_lat = np.radians(np.array([order[2] for order in orders], dtype=np.float64))[:, None]
+    order_lon = np.radians(np.array([order[3] for order in orders], dtype=np.float64))[:, None]
+    waiting = np.array([order[4] or 0.0 for order in orders], dtype=np.float64)[:, None]
+    driver_lat = np.radians(np.array([driver[3] for driver in drivers], dtype=np.float64))[None, :]
+    driver_lon = np.radians(np.array([driver[4] for driver in drivers], dtype=np.float64))[None, :]
+    rating = np.array([driver[2] for driver in drivers], dtype=np.float64)[None, :]
+
+    a = (np.sin((driver_lat - order_lat) / 2) ** 2
+         + np.cos(order_lat) * np.cos(driver_lat) * np.sin((driver_lon - order_lon) / 2) ** 2)
+    distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    costs = distance - DISPATCH_RATING_WEIGHT * rating - DISPATCH_WAIT_WEIGHT * waiting
+    costs[distance > max_pickup_km] = np.inf
+    return costs
+
+
+def match_greedy(orders, drivers, max_pickup_km=DISPATCH_MAX_PICKUP_KM):
+    if not orders or not drivers:
+        return []
+
+    if np is not None:
+        costs = dispatch_costs(orders, drivers, max_pickup_km)
+        flat = np.argsort(costs, axis=None, kind="stable")
+        flat = flat[np.isfinite(costs.ravel()[flat])]
+        pairs = zip(*np.unravel_index(flat, costs.shape))
+    else:
+        candidates = []
+        for i, order in enumerate(orders):
+            for j, driver in enumerate(drivers):
+                distance = haversine_km(order[2], order[3], driver[3], driver[4])
+                if distance <= max_pickup_km:
+                    cost = distance - DISPATCH_RATING_WEIGHT * driver[2] - DISPATCH_WAIT_WEIGHT * (order[4] or 0.0)
+                    candidates.append((cost, i, j))
+        candidates.sort()
+        pairs = ((i, j) for _, i, j in candidates)
+
+    taken_orders = set()
+    taken_drivers = set()
+    matches = []
+    limit = min(len(orders), len(drivers))
+    for i, j in pairs:
+        if i in taken_orders or j in taken_drivers:
+            continue
+        taken_orders.add(i)
+        taken_drivers.add(j)
+        matches.append((int(i), int(j)))
+        if len(matches) == limit:
+            break
+    return matches
+
+
+@METRICS.timed("batch_dispatch")
+def batch_dispatch(conn, max_pickup_km=DISPATCH_MAX_PICKUP_KM, retries=ACCEPT_RETRIES, backoff=ACCEPT_BACKOFF,
+                   bus=None):
+    for attempt in range(retries + 1):
+        try:
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+
+            orders = conn.execute(DISPATCH_ORDERS_QUERY).fetchall()
+            drivers = conn.execute(DISPATCH_DRIVERS_QUERY).fetchall()
+            matches = match_greedy(orders, drivers, max_pickup_km)
+
+            conn.executemany("""
+                UPDATE Orders
+                SET Driver_id = ?
+                WHERE Orders_id = ? AND Driver_id IS NULL
+            """, [(drivers[j][0], orders[i][0]) for i, j in matches])
+            conn.executemany("UPDATE Drivers SET IsAvailable = 0 WHERE Driver_id = ?",
+                             [(drivers[j][0],) for _, j in matches])
+            first_notification = next_id(conn, "Notification", "notification_id")
+            created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+            notifications = [{
+                'id': first_notification + n,
+                'passenger_id': orders[i][1],
+                'message': f"Ваш заказ #{orders[i][0]} принят водителем {drivers[j][1]}!",
+                'created_at': created_at,
+            } for n, (i, j) in enumerate(matches)]
+            conn.executemany("""
+                INSERT INTO Notification (Passenger_id, message, CreatedAt)
+                VALUES (:passenger_id, :message, :created_at)
+            """, notifications)
+            if notifications and sequence_value(conn, "Notification") != notifications[-1]['id']:
+                conn.rollback()
+                raise sqlite3.IntegrityError("идентификаторы уведомлений выданы не подряд")
+
+            conn.commit()
+            elapsed = time.perf_counter() - started
+            if bus is not None:
+                bus.publish(notifications)
+            return [(orders[i][0], drivers[j][0]) for i, j in matches], len(orders), len(drivers), elapsed
+
+        except sqlite3.OperationalError as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if not is_busy_error(e) or attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def run_batch_dispatch(conn, book=None, max_pickup_km=DISPATCH_MAX_PICKUP_KM, bus=None):
+    print("\n" + "=" * 50)
+    print("ПАКЕТНОЕ РАСПРЕДЕЛЕНИЕ ЗАКАЗОВ")
+    print("=" * 50)
+
+    try:
+        assignments, orders, drivers, elapsed = batch_dispatch(conn, max_pickup_km, bus=bus)
+    except sqlite3.Error as e:
+        print(f"\n✗ Ошибка при распределении заказов: {e}")
+        return []
+
+    if book is not None:
+        for order_id, _ in assignments:
+            book.remove(order_id)
+
+    print(f"Открытых заказов с координатами: {orders}, водителей на линии: {drivers}")
+    print(f"✓ Назначено заказов: {len(assignments)} за {elapsed * 1000:.1f} мс "
+          f"({len(assignments) / elapsed if elapsed else 0:.0f} назначений/с)")
+    return assignments
+
+
+def user_table(user_type):
+    if user_type == "driver":
+        return "Drivers", "Driver_id"
+    if user_type == "passenger":
+        return "Passengers", "Passenger_id"
+    raise ValueError(f"неизвестный тип пользователя: {user_type}")
+
+
+def apply_rating(aggregate, score, at, half_life=RATING_HALF_LIFE):
+    if aggregate is None:
+        return 1, score, float(score), 1.0, at
+
+    count, total, decayed_sum, decayed_weight, decayed_at = aggregate
+    if at >= decayed_at:
+        factor = 0.5 ** ((at - decayed_at) / half_life)
+        return count + 1, total + score, decayed_sum * factor + score, decayed_weight * factor + 1.0, at
+    factor = 0.5 ** ((decayed_at - at) / half_life)
+    return count + 1, total + score, decayed_sum + score * factor, decayed_weight + factor, decayed_at
+
+
+def prior_rating(rating, at):
+    return 0, 0, rating * RATING_PRIOR_WEIGHT, RATING_PRIOR_WEIGHT, at
+
+
+def seed_rating(conn, user_type, user_id, at):
+    prior = conn.execute("SELECT Rating, SeededAt FROM RatingPriors WHERE User_type = ? AND User_id = ?",
+                         (user_type, user_id)).fetchone()
+    if prior is None:
+        table, column = user_table(user_type)
+        row = conn.execute(f"SELECT Rating FROM {table} WHERE {column} = ?", (user_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        prior = row[0], at
+        conn.execute("INSERT INTO RatingPriors VALUES (?, ?, ?, ?)", (user_type, user_id) + prior)
+    return prior_rating(*prior)
+
+
+def aggregate_rating(aggregate):
+    return round(aggregate[2] / aggregate[3], 2)
+
+
+def record_rating(conn, order_id, rater_type, rater_id, ratee_type, ratee_id, score, at=None,
+                  half_life=RATING_HALF_LIFE):
+    table, column = user_table(ratee_type)
+    at = int(time.time()) if at is None else at
+    conn.execute("""
+        INSERT INTO Ratings (Orders_id, Rater_type, Rater_id, Ratee_type, Ratee_id, Score, CreatedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (order_id, rater_type, rater_id, ratee_type, ratee_id, score,
+          time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(at))))
+
+    aggregate = conn.execute("""
+        SELECT RatingCount, RatingSum, DecayedSum, DecayedWeight, DecayedAt
+        FROM RatingAggregates
+        WHERE User_type = ? AND User_id = ?
+    """, (ratee_type, ratee_id)).fetchone()
+    if aggregate is None:
+        aggregate = seed_rating(conn, ratee_type, ratee_id, at)
+    aggregate = apply_rating(aggregate, score, at, half_life)
+    conn.execute("INSERT OR REPLACE INTO RatingAggregates VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (ratee_type, ratee_id) + aggregate)
+
+    rating = aggregate_rating(aggregate)
+    conn.execute(f"UPDATE {table} SET Rating = ? WHERE {column} = ?", (rating, ratee_id))
+    return rating
+
+
+@METRICS.timed("recompute_ratings")
+def recompute_ratings(conn, half_life=RATING_HALF_LIFE, batch_size=RATING_RECOMPUTE_BATCH):
+    started = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DELETE FROM RatingAggregates")
+
+    events = users = 0
+    aggregates = []
+    ratings = {"driver": [], "passenger": []}
+
+    def flush():
+        conn.executemany("INSERT INTO RatingAggregates VALUES (?, ?, ?, ?, ?, ?, ?)", aggregates)
+        for user_type, rows in ratings.items():
+            table, column = user_table(user_type)
+            conn.executemany(f"UPDATE {table} SET Rating = ? WHERE {column} = ?", rows)
+            rows.clear()
+        aggregates.clear()
+
+    try:
+        priors = {row[:2]: row[2:] for row in conn.execute("SELECT * FROM RatingPriors")}
+        cursor = conn.execute("""
+            SELECT Ratee_type, Ratee_id, Score, CAST(strftime('%s', CreatedAt) AS INTEGER)
+            FROM Ratings
+            ORDER BY Ratee_type, Ratee_id, CreatedAt
+        """)
+        for (user_type, user_id), group in itertools.groupby(cursor, key=lambda row: (row[0], row[1])):
+            prior = priors.pop((user_type, user_id), None)
+            aggregate = prior_rating(*prior) if prior else None
+            for _, _, score, at in group:
+                aggregate = apply_rating(aggregate, score, at, half_life)
+                events += 1
+            users += 1
+            aggregates.append((user_type, user_id) + aggregate)
+            ratings[user_type].append((aggregate_rating(aggregate), user_id))
+            if len(aggregates) >= batch_size:
+                flush()
+        aggregates.extend(key + prior_rating(*prior) for key, prior in priors.items())
+        flush()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return events, users, time.perf_counter() - started
+
+
+def rate_order(service, user):
+    order_id = input("\nВведите ID поездки для оценки: ")
+    score = input(f"Оценка ({RATING_MIN}-{RATING_MAX}): ")
+
+    if not order_id.isdigit() or not score.isdigit():
+        print("\n✗ Ошибка: ID поездки и оценка должны быть числами!")
+        return
+
+    try:
+        result = service.rate_order(user, int(order_id), int(score))
+    except (ValueError, LookupError, PermissionError) as e:
+        print(f"\n✗ Ошибка: {e}!")
+        return
+    except sqlite3.Error as e:
+        print(f"\n✗ Ошибка при сохранении оценки: {e}")
+        return
+
+    who = "водителя" if result['ratee_type'] == 'driver' else "пассажира"
+    print(f"\n✓ Спасибо! Новый рейтинг {who}: {result['rating']}")
+
+
+def input_address(service, passenger, prompt):
+    while True:
+        value = input(f"{prompt}, «?» в конце — подсказки): ")
+        if not value.rstrip().endswith("?"):
+            return value
+
+        suggestions = service.suggest_addresses(passenger, value.rstrip()[:-1])
+        options = [item['address'] for item in suggestions['personal'] + suggestions['popular']]
+        if not options:
+            print("   Подходящих адресов не найдено.")
+            continue
+        for i, item in enumerate(suggestions['personal'] + suggestions['popular'], 1):
+            mark = "★" if i <= len(suggestions['personal']) else " "
+            print(f"   {i:>2}. {mark} {item['address']} ({item['uses']})")
+        choice = input("Номер адреса или Enter, чтобы ввести заново: ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(options):
+            return options[int(choice) - 1]
+
+
+def create_order(service, passenger):
+    print("\n📝 Создание нового заказа")
+    print("-" * 40)
+
+    delivery_address = input_address(service, passenger, "Откуда (адрес подачи")
+    final_address = input_address(service, passenger, "Куда (адрес назначения")
+    time_order = input("Время заказа (например, 15:30): ")
+
+    try:
+        estimate = service.estimate_route(delivery_address, final_address)
+    except sqlite3.Error as e:
+        print(f"\n⚠️  Не удалось оценить маршрут: {e}")
+        estimate = None
+
+    try:
+        if estimate is None:
+            price = float(input("Стоимость поездки (руб.): "))
+            distance = float(input("Расстояние (км): "))
+        else:
+            basis = f"по {estimate['trips']} поездкам" if estimate['trips'] else "по карте"
+            print(f"💡 Оценка {basis}: {estimate['price']} руб., {estimate['distance_km']} км")
+            price = float(input(f"Стоимость поездки (руб., Enter — {estimate['price']}): ") or estimate['price'])
+            distance = float(input(f"Расстояние (км, Enter — {estimate['distance_km']}): ")
+                             or estimate['distance_km'])
+    except ValueError:
+        print("\n✗ Ошибка: Стоимость и расстояние должны быть числами!")
+        return
+
+    pickup = input("Координаты подачи (широта, долгота) или Enter, чтобы пропустить: ").strip()
+    try:
+        pickup_lat, pickup_lon = parse_coordinates(pickup) if pickup else (None, None)
+    except ValueError:
+        print("\n✗ Ошибка: Координаты должны быть в формате 56.3269, 44.0059!")
+        return
+
+    try:
+        order = service.create_order(passenger, delivery_address, final_address, time_order, price, distance,
+                                     pickup_lat, pickup_lon)
+    except sqlite3.Error as e:
+        print(f"\n✗ Ошибка при создании заказа: {e}")
+        return
+
+    print(f"\n✓ Успех! Заказ #{order['order_id']} создан!")
+    print(f"   Откуда: {delivery_address}")
+    print(f"   Куда: {final_address}")
+    print(f"   Время: {time_order}")
+    print(f"   Стоимость: {price} руб.")
+    print(f"   Расстояние: {distance} км")
+
+
+def sequence_value(cursor, table):
+    row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def next_id(cursor, table, column):
+    tables = (table, ARCHIVE_TABLES[table]) if table in ARCHIVE_TABLES else (table,)
+    used = [cursor.execute(f"SELECT MAX({column}) FROM {name}").fetchone()[0] or 0 for name in tables]
+    return max(sequence_value(cursor, table), *used) + 1
+
+
+def seed_test_data(conn):
+    cursor = conn.cursor()
+
+    test_drivers = [
+        ("Славка Андрей Владиславович", 2.3, "driver123", 56.3287, 44.0020),
+        ("Капитанов Иван Александрович", 4.7, "driver456", 56.2965, 43.9361),
+        ("Хороших Егор Эдуардович", 3.6, "driver789", 56.3301, 43.8612)
+    ]
+
+    test_passengers = [
+        ("Раева Кира Сергеевна", 4.3, "pass123"),
+        ("Галкин Илья Алексеевич", 5.0, "pass456"),
+        ("Боярсков Павел Владиславович", 2.8, "pass789")
+    ]
+
+    print("\n" + "=" * 50)
+    print("СОЗДАНИЕ ТЕСТОВЫХ ДАННЫХ")
+    print("=" * 50)
+
+    first_driver = next_id(cursor, "Drivers", "Driver_id")
+    first_passenger = next_id(cursor, "Passengers", "Passenger_id")
+    first_about = next_id(cursor, "About_orders", "About_orders_id")
+
+    print("\nСоздаю тестовых водителей...")
+    drivers = [(first_driver + i, username, rating, lat, lon)
+               for i, (username, rating, _, lat, lon) in enumerate(test_drivers)]
+    cursor.executemany("INSERT INTO Drivers (Driver_id, Username, Rating, Current_lat, Current_lon) "
+                       "VALUES (?, ?, ?, ?, ?)", drivers)
+    credentials = []
+    for (driver_id, *_), (username, _, password, *_) in zip(drivers, test_drivers):
+        credentials.append((driver_id, *new_credentials(password)))
+        print(f"  ✓ Водитель: {username} (пароль: {password})")
+    cursor.executemany("INSERT INTO DriverCredentials (Driver_id, PasswordHash, Salt) VALUES (?, ?, ?)",
+                       credentials)
+
+    print("\nСоздаю тестовых пассажиров...")
+    passengers = [(first_passenger + i, username, rating)
+                  for i, (username, rating, _) in enumerate(test_passengers)]
+    cursor.executemany("INSERT INTO Passengers (Passenger_id, Username, Rating) VALUES (?, ?, ?)", passengers)
+    credentials = []
+    for (passenger_id, *_), (username, _, password) in zip(passengers, test_passengers):
+        credentials.append((passenger_id, *new_credentials(password)))
+        print(f"  ✓ Пассажир: {username} (пароль: {password})")
+    cursor.executemany("INSERT INTO PassengerCredentials (Passenger_id, PasswordHash, Salt) VALUES (?, ?, ?)",
+                       credentials)
+
+    print("\nСоздаю тестовые заказы...")
+    About_orders = [
+        ("Ул. Красная Поляна, д. 2, подъезд 1", "15:06", 654, "Ул. Бурнаковская, д. 75", 1.9, 56.3405, 43.8694),
+        ("Ул. Осипенко, д. 82", "19:59", 427, "Ул. Нижневолжсая, д. 19", 5.0, 56.2421, 43.8567),
+        ("Ул. Минина, д. 24", "6:44", 987, "Ул. Рожденственская, д 10", 2.8, 56.3219, 44.0126)
+    ]
+
+    cursor.executemany(
+        "INSERT INTO About_orders (About_orders_id, Delivery_address, Time_order, Price, Final_address, "
+        "Distance_km, Pickup_lat, Pickup_lon) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(first_about + i, *order) for i, order in enumerate(About_orders)])
+    for order in About_orders:
+        print(f"  ✓ Заказ из {order[0]} в {order[3]}")
+
+    print("\nНазначаю заказы...")
+    orders = [(2, 3, 2), (1, 1, 1), (3, 2, 3), (None, 1, 1)]
+    cursor.executemany("INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id) VALUES (?, ?, ?)",
+                       [(first_driver + driver - 1 if driver else None, first_passenger + passenger - 1,
+                         first_about + about - 1) for driver, passenger, about in orders])
+    print("  ✓ Назначено 4 заказа (3 с водителями, 1 ожидающий)")
+
+    notifications = [
+        (1, "Ваш водитель уже в пути!"),
+        (2, "Ваш водитель подъезжает!"),
+        (3, "Ожидайте водителя в течение 5 минут")
+    ]
+
+    cursor.executemany("INSERT INTO Notification (Passenger_id, message) VALUES (?, ?)",
+                       [(first_passenger + passenger_id - 1, message) for passenger_id, message in notifications])
+
+    conn.commit()
+    refresh_routes(conn)
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def run_accept_driver(db_path, driver, order_ids, seed, outcomes):
+    rng = random.Random(seed)
+    conn = connect(db_path)
+    remaining = list(order_ids)
+
+    while remaining:
+        index = rng.randrange(len(remaining))
+        order_id = remaining[index]
+        started = time.perf_counter()
+        try:
+            result = try_accept_order(conn, order_id, driver)
+        except sqlite3.OperationalError:
+            result = "error"
+        outcomes.append((order_id, result, time.perf_counter() - started))
+        if result != "error":
+            remaining[index] = remaining[-1]
+            remaining.pop()
+
+    conn.close()
+
+
+def run_accept_process(db_path, drivers, order_ids, seed, results):
+    outcomes = []
+    threads = [threading.Thread(target=run_accept_driver,
+                                args=(db_path, driver, order_ids, seed * 1000 + i, outcomes))
+               for i, driver in enumerate(drivers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(outcomes)
+
+
+def benchmark_accept(db_path, drivers=200, orders=2000, processes=8):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = connect(db_path)
+    migrate(conn)
+    generate_dataset(conn, orders, drivers=drivers, passengers=max(1, orders // 10), notifications=0, open_share=1.0)
+    order_ids = [row[0] for row in conn.execute("SELECT Orders_id FROM Orders WHERE Driver_id IS NULL")]
+    driver_rows = [{'id': row[0], 'username': row[1]}
+                   for row in conn.execute("SELECT Driver_id, Username FROM Drivers")]
+    conn.close()
+
+    print("\n" + "=" * 60)
+    print("СТРЕСС-ТЕСТ ПРИНЯТИЯ ЗАКАЗОВ")
+    print("=" * 60)
+    print(f"Водителей: {len(driver_rows)}, процессов: {processes}, открытых заказов: {len(order_ids)}")
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=run_accept_process,
+                                       args=(db_path, driver_rows[i::processes], order_ids, i, results))
+               for i in range(processes)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    outcomes = []
+    for _ in workers:
+        outcomes.extend(results.get())
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    accepted = {}
+    for order_id, result, _ in outcomes:
+        if result == ACCEPT_OK:
+            accepted[order_id] = accepted.get(order_id, 0) + 1
+    latencies = [latency for _, result, latency in outcomes if result != "error"]
+    errors = sum(1 for _, result, _ in outcomes if result == "error")
+
+    conn = connect(db_path)
+    unassigned = conn.execute("SELECT COUNT(*) FROM Orders WHERE Driver_id IS NULL").fetchone()[0]
+    notified = conn.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT message FROM Notification WHERE message LIKE 'Ваш заказ #% принят водителем %'
+            GROUP BY message
+        )
+    """).fetchone()[0]
+    conn.close()
+    double_assignments = sum(count - 1 for count in accepted.values() if count > 1)
+
+    print(f"Попыток: {len(outcomes)}, принято: {sum(accepted.values())}, ошибок блокировки: {errors}")
+    print(f"Пропускная способность: {sum(accepted.values()) / elapsed:.0f} принятий/с за {elapsed:.2f} с")
+    print(f"Задержка p50: {percentile(latencies, 0.5) * 1000:.2f} мс, "
+          f"p99: {percentile(latencies, 0.99) * 1000:.2f} мс")
+    print(f"Двойных назначений: {double_assignments}, без водителя: {unassigned}, "
+          f"уведомлений о принятии: {notified}")
+    return double_assignments == 0 and unassigned == 0
+
+
+def probe_reads(service, passenger_ids, stop, latencies):
+    rng = random.Random(0)
+    while not stop.is_set():
+        started = time.perf_counter()
+        service.user_orders({'id': rng.choice(passenger_ids), 'type': 'passenger'})
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.002)
+
+
+def benchmark_login(db_path, logins=200, concurrency=16, kdf=PASSWORD_KDF, cost=None, workers=PASSWORD_WORKERS):
+    remove_database(db_path)
+    conn = connect(db_path)
+    migrate(conn)
+    generate_dataset(conn, logins * 10, drivers=10, passengers=logins * 2, notifications=0)
+    usernames = [row[0] for row in conn.execute("""
+        SELECT Username FROM Passengers GROUP BY Username HAVING COUNT(*) = 1 LIMIT ?
+    """, (logins,))]
+    passenger_ids = [row[0] for row in conn.execute("SELECT Passenger_id FROM Passengers")]
+    conn.executemany("""
+        UPDATE PassengerCredentials SET PasswordHash = ?, Salt = ?
+        WHERE Passenger_id = (SELECT Passenger_id FROM Passengers WHERE Username = ?)
+    """, [(legacy_password_hash(GENERATED_PASSWORD, f"salt_passenger_{i}"), f"salt_passenger_{i}", username)
+          for i, username in enumerate(usernames)])
+    conn.commit()
+    conn.close()
+
+    service = DuberService(ConnectionPool(db_path, size=concurrency + 1), kdf=kdf, password_cost=cost,
+                           password_workers=workers)
+
+    print("\n" + "=" * 90)
+    print("БЕНЧМАРК ВХОДА")
+    print("=" * 90)
+    print(f"KDF: {service.kdf} ({service.password_cost}), потоков KDF: {workers}, "
+          f"клиентов: {concurrency}, входов за проход: {len(usernames)}")
+
+    def login(username):
+        started = time.perf_counter()
+        try:
+            user = service.login("passenger", username, GENERATED_PASSWORD)
+        except TimeoutError:
+            user = None
+        return time.perf_counter() - started, user is not None
+
+    def measure(run):
+        stop = threading.Event()
+        reads = []
+        prober = threading.Thread(target=probe_reads, args=(service, passenger_ids, stop, reads))
+        prober.start()
+        started = time.perf_counter()
+        results = run()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        prober.join()
+        return results, elapsed, reads
+
+    _, _, idle_reads = measure(lambda: time.sleep(1.0))
+    print(f"\n{'Проход':<28} {'Входов/с':>9} {'p50, мс':>9} {'p99, мс':>9} {'Отказов':>8} "
+          f"{'Чтение p50':>11} {'Чтение p99':>11}")
+    print(f"{'без входов':<28} {'':>9} {'':>9} {'':>9} {'':>8} "
+          f"{percentile(idle_reads, 0.5) * 1000:>11.2f} {percentile(idle_reads, 0.99) * 1000:>11.2f}")
+
+    for name in ("первый вход (legacy → KDF)", "повторный вход"):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as clients:
+            results, elapsed, reads = measure(lambda: list(clients.map(login, usernames)))
+        latencies = [latency for latency, _ in results]
+        failed = sum(1 for _, ok in results if not ok)
+        print(f"{name:<28} {len(results) / elapsed:>9.1f} {percentile(latencies, 0.5) * 1000:>9.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>9.1f} {failed:>8} "
+              f"{percentile(reads, 0.5) * 1000:>11.2f} {percentile(reads, 0.99) * 1000:>11.2f}")
+
+    with service.pool.connection() as conn:
+        legacy = conn.execute("SELECT COUNT(*) FROM PassengerCredentials WHERE PasswordHash NOT LIKE '%$%'"
+                              ).fetchone()[0]
+    service.close()
+    print(f"\nОсталось хэшей старого формата: {legacy}")
+
+
+def benchmark_ratings(db_path, events=1000000, drivers=10000, passengers=100000, updates=10000, seed=0):
+    remove_database(db_path)
+    conn = connect(db_path)
+    migrate(conn)
+    generate_dataset(conn, passengers, drivers=drivers, passengers=passengers, notifications=0, seed=seed)
+    driver_ids = [row[0] for row in conn.execute("SELECT Driver_id FROM Drivers ORDER BY Driver_id")]
+    passenger_ids = [row[0] for row in conn.execute("SELECT Passenger_id FROM Passengers ORDER BY Passenger_id")]
+    driver_weights = zipf_weights(len(driver_ids))
+    passenger_weights = zipf_weights(len(passenger_ids))
+    first_order = conn.execute("SELECT MAX(Orders_id) FROM Orders").fetchone()[0] + 1
+    rng = random.Random(seed)
+
+    def sample_events(count):
+        riders = rng.choices(passenger_ids, cum_weights=passenger_weights, k=count)
+        chauffeurs = rng.choices(driver_ids, cum_weights=driver_weights, k=count)
+        scores = rng.choices(range(RATING_MIN, RATING_MAX + 1), weights=GENERATED_SCORE_WEIGHTS, k=count)
+        for rider, chauffeur, score in zip(riders, chauffeurs, scores):
+            if rng.random() < 0.5:
+                yield "passenger", rider, "driver", chauffeur, score
+            else:
+                yield "driver", chauffeur, "passenger", rider, score
+
+    print("\n" + "=" * 90)
+    print("БЕНЧМАРК РЕЙТИНГОВ")
+    print("=" * 90)
+    print(f"Событий в истории: {events}, водителей: {len(driver_ids)}, пассажиров: {len(passenger_ids)}, "
+          f"инкрементальных оценок: {updates}")
+
+    now = int(time.time())
+    history_start = now - 2 * GENERATED_HISTORY_DAYS * 86400
+    step = (now - history_start) / max(events, 1)
+    started = time.perf_counter()
+    for start in range(0, events, RATING_RECOMPUTE_BATCH):
+        rows = []
+        for i, event in enumerate(sample_events(min(RATING_RECOMPUTE_BATCH, events - start))):
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(history_start + (start + i) * step))
+            rows.append((first_order + start + i,) + event + (created,))
+        conn.executemany("""
+            INSERT INTO Ratings (Orders_id, Rater_type, Rater_id, Ratee_type, Ratee_id, Score, CreatedAt)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    load_elapsed = time.perf_counter() - started
+
+    _, users, recompute_elapsed = recompute_ratings(conn)
+    hottest = conn.execute("SELECT MAX(RatingCount) FROM RatingAggregates").fetchone()[0]
+    print(f"Оценённых пользователей: {users}, событий у самого популярного: {hottest}")
+
+    incremental = []
+    scans = []
+    first_update = first_order + events
+    for i, (rater_type, rater_id, ratee_type, ratee_id, score) in enumerate(sample_events(updates)):
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        record_rating(conn, first_update + i, rater_type, rater_id, ratee_type, ratee_id, score)
+        conn.commit()
+        incremental.append(time.perf_counter() - started)
+
+        if i < BENCH_RATING_SCANS:
+            started = time.perf_counter()
+            aggregate = None
+            for score, at in conn.execute("""
+                SELECT Score, CAST(strftime('%s', CreatedAt) AS INTEGER)
+                FROM Ratings
+                WHERE Ratee_type = ? AND Ratee_id = ?
+                ORDER BY CreatedAt
+            """, (ratee_type, ratee_id)):
+                aggregate = apply_rating(aggregate, score, at)
+            scans.append(time.perf_counter() - started)
+
+    print(f"\n{'Проход':<36} {'Событий':>10} {'Событий/с':>11} {'p50, мс':>9} {'p99, мс':>9}")
+    print(f"{'загрузка истории (executemany)':<36} {events:>10} {events / load_elapsed:>11.0f}")
+    print(f"{'пересчёт агрегатов (recompute)':<36} {events:>10} {events / recompute_elapsed:>11.0f}")
+    for name, latencies in (("инкрементально, O(1) на событие", incremental),
+                            ("пересчёт по истории на событие", scans)):
+        if latencies:
+            print(f"{name:<36} {len(latencies):>10} {len(latencies) / sum(latencies):>11.0f} "
+                  f"{percentile(latencies, 0.5) * 1000:>9.3f} {percentile(latencies, 0.99) * 1000:>9.3f}")
+
+    incremental_state = {row[:2]: row[2:] for row in conn.execute("SELECT * FROM RatingAggregates")}
+    recompute_ratings(conn)
+    recomputed_state = {row[:2]: row[2:] for row in conn.execute("SELECT * FROM RatingAggregates")}
+    mismatched = sum(1 for key, row in recomputed_state.items()
+                     if incremental_state.get(key, (None, None))[:2] != row[:2])
+    drift = max((abs(incremental_state[key][2] / incremental_state[key][3] - row[2] / row[3])
+                 for key, row in recomputed_state.items() if key in incremental_state), default=0.0)
+    conn.close()
+    print(f"\nРасхождение с полным пересчётом: счётчиков {mismatched}, среднего не больше {drift:.2e}")
+    return mismatched == 0 and drift < 1e-6
+
+
+def parse_formats(value):
+    formats = [fmt.strip().lower() for fmt in value.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in formats if fmt not in EXPORT_WRITERS]
+    if unknown or not formats:
+        raise argparse.ArgumentTypeError(f"неизвестные форматы: {', '.join(unknown) or value}")
+    return formats
+
+
+HTTP_HOST = "127.0.0.1"
+HTTP_PORT = 8080
+HTTP_BACKLOG = 1024
+HTTP_IDLE_TIMEOUT = 30
+HTTP_MAX_BODY = 1 << 20
+
+METRICS_TOKEN_ENV = "DUBER_METRICS_TOKEN"
+
+ACCEPT_STATUS = {ACCEPT_OK: 200, ACCEPT_TAKEN: 409, ACCEPT_MISSING: 404}
+
+
+def json_body(body):
+    payload = json.loads(body) if body else {}
+    if not isinstance(payload, dict):
+        raise ValueError("тело запроса должно быть JSON-объектом")
+    return payload
+
+
+def bearer_token(headers):
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    return token.strip() if scheme.lower() == "bearer" else None
+
+
+def api_request(service, method, target, headers, body):
+    url = urllib.parse.urlsplit(target)
+    query = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+    parts = [part for part in url.path.split("/") if part]
+
+    token = bearer_token(headers)
+    user = service.session(token) if token else None
+    if user is None:
+        return 401, {"error": "требуется авторизация"}
+
+    if parts == ["logout"] and method == "POST":
+        service.close_session(token)
+        return 200, {}
+
+    if parts == ["password"] and method == "POST":
+        payload = json_body(body)
+        service.change_password(user, str(payload["old_password"]), str(payload["new_password"]))
+        return 200, {"token": service.open_session(user)}
+
+    if parts == ["orders"] and method == "GET":
+        after = tuple(json.loads(query["after"])) if "after" in query else None
+        orders, after = service.user_orders(user, after, int(query.get("limit", HISTORY_PAGE_SIZE)))
+        return 200, {"orders": orders, "after": json.dumps(after) if after else None}
+
+    if parts == ["orders"] and method == "POST":
+        payload = json_body(body)
+        pickup_lat, pickup_lon = payload.get("pickup_lat"), payload.get("pickup_lon")
+        price, distance_km = payload.get("price"), payload.get("distance_km")
+        order = service.create_order(user, str(payload["delivery_address"]), str(payload["final_address"]),
+                                     str(payload["time_order"]), None if price is None else float(price),
+                                     None if distance_km is None else float(distance_km),
+                                     None if pickup_lat is None else float(pickup_lat),
+                                     None if pickup_lon is None else float(pickup_lon))
+        return 201, order
+
+    if parts == ["routes", "estimate"] and method == "GET":
+        estimate = service.estimate_route(query["from"], query["to"])
+        if estimate is None:
+            raise LookupError("не удалось оценить маршрут: координаты адресов неизвестны")
+        return 200, estimate
+
+    if parts == ["routes", "estimate"] and method == "POST":
+        routes = [(route["delivery_address"], route["final_address"]) for route in json_body(body)["routes"]]
+        return 200, {"estimates": service.estimate_routes(routes)}
+
+    if parts == ["addresses", "suggest"] and method == "GET":
+        return 200, service.suggest_addresses(user, query.get("prefix", ""),
+                                              int(query.get("limit", ADDRESS_SUGGEST_LIMIT)))
+
+    if parts == ["orders", "available"] and method == "GET":
+        after = tuple(json.loads(query["after"])) if "after" in query else None
+        orders, after = service.available_orders(after, int(query.get("limit", ORDER_BOOK_PAGE_SIZE)))
+        return 200, {"orders": orders, "after": json.dumps(after) if after else None}
+
+    if parts == ["orders", "nearest"] and method == "GET":
+        lat, lon = float(query["lat"]), float(query["lon"])
+        k, radius_km = nearest_params(query.get("k", NEAREST_DEFAULT_K),
+                                      query.get("radius", NEAREST_DEFAULT_RADIUS_KM))
+        if user['type'] == 'driver':
+            service.update_location(user, lat, lon)
+        return 200, {"orders": service.nearest_orders(lat, lon, k, radius_km)}
+
+    if len(parts) == 3 and parts[0] == "orders" and parts[2] == "accept" and method == "POST":
+        result = service.accept_order(user, int(parts[1]))
+        return ACCEPT_STATUS[result], {"order_id": int(parts[1]), "result": result}
+
+    if len(parts) == 3 and parts[0] == "orders" and parts[2] == "rate" and method == "POST":
+        return 200, service.rate_order(user, int(parts[1]), int(json_body(body)["score"]))
+
+    if len(parts) == 2 and parts[0] == "orders" and method == "DELETE":
+        return 200, service.delete_order(user, int(parts[1]))
+
+    if parts == ["notifications"] and method == "GET":
+        after = tuple(json.loads(query["after"])) if "after" in query else None
+        notifications, after = service.notifications(user, after=after,
+                                                     limit=int(query.get("limit", HISTORY_PAGE_SIZE)))
+        return 200, {"notifications": notifications, "after": json.dumps(after) if after else None}
+
+    return 404, {"error": f"нет обработчика для {method} {url.path}"}
+
+
+API_ERRORS = (ValueError, TypeError, LookupError, PermissionError, TimeoutError, sqlite3.Error)
+
+
+def api_error(error):
+    if isinstance(error, KeyError):
+        return 400, {"error": f"не хватает поля {error}"}
+    if isinstance(error, (ValueError, TypeError)):
+        return 400, {"error": str(error)}
+    if isinstance(error, PermissionError):
+        return 403, {"error": str(error)}
+    if isinstance(error, LookupError):
+        return 404, {"error": str(error)}
+    if isinstance(error, TimeoutError):
+        return 503, {"error": str(error)}
+    return 503 if is_busy_error(error) else 500, {"error": str(error)}
+
+
+def handle_api_request(service, method, target, headers, body):
+    try:
+        return api_request(service, method, target, headers, body)
+    except API_ERRORS as e:
+        return api_error(e)
+
+
+async def handle_login_request(service, executor, body):
+    loop = asyncio.get_running_loop()
+    try:
+        payload = json_body(body)
+        user, stored_hash, salt = await loop.run_in_executor(executor, service.find_credentials,
+                                                             payload["type"], payload["username"])
+        ok, rehashed = await asyncio.wrap_future(
+            service.submit_password_check(payload["password"], stored_hash, salt, timeout=0))
+        if ok and rehashed:
+            await loop.run_in_executor(executor, service.store_password_hash, user, stored_hash, rehashed)
+    except API_ERRORS as e:
+        return api_error(e)
+
+    if not ok:
+        return 401, {"error": "неверное имя пользователя или пароль"}
+    try:
+        token = await loop.run_in_executor(executor, service.open_session, user)
+    except sqlite3.Error as e:
+        return api_error(e)
+    return 200, {"token": token, "user": user}
+
+
+async def poll_notifications(service, executor, user, timeout):
+    if user['type'] != 'passenger':
+        raise PermissionError("уведомления доступны только для пассажиров")
+
+    loop = asyncio.get_running_loop()
+    messages = []
+    if service.bus.subscribe(user['id']):
+        messages, _ = await loop.run_in_executor(executor, lambda: service.notifications(
+            user, False, limit=NOTIFY_CHANNEL_BUFFER))
+    messages += service.bus.take(user['id'])
+    if not messages:
+        messages = await service.bus.wait(user['id'], timeout)
+
+    messages = sorted({message['id']: message for message in messages}.values(), key=lambda message: message['id'])
+    if messages:
+        await loop.run_in_executor(executor, service.mark_read, [message['id'] for message in messages])
+    return messages
+
+
+async def handle_poll_request(service, executor, target, headers):
+    token = bearer_token(headers)
+    user = service.sessions.get(token, load=False) if token else None
+    if user is None and token and service.sessions.pool is not None:
+        try:
+            user = await asyncio.get_running_loop().run_in_executor(executor, service.session, token)
+        except sqlite3.Error as e:
+            return api_error(e)
+    if user is None:
+        return 401, {"error": "требуется авторизация"}
+
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(target).query)
+    try:
+        timeout = min(float(query.get("timeout", [NOTIFY_POLL_TIMEOUT])[-1]), NOTIFY_POLL_TIMEOUT_MAX)
+        return 200, {"notifications": await poll_notifications(service, executor, user, max(timeout, 0.0))}
+    except API_ERRORS as e:
+        return api_error(e)
+
+
+async def flush_read_marks_periodically(service, executor):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(NOTIFY_FLUSH_INTERVAL)
+        try:
+            await loop.run_in_executor(executor, service.flush_read_marks)
+        except sqlite3.Error as e:
+            print(f"✗ Ошибка при отметке уведомлений прочитанными: {e}")
+
+
+async def archive_periodically(service, executor, stop, interval, order_days, notification_days):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            orders, notifications, elapsed = await loop.run_in_executor(
+                executor, lambda: service.archive(order_days, notification_days, stop))
+            if orders or notifications:
+                print(f"✓ В архив перенесено заказов: {orders}, уведомлений: {notifications} за {elapsed:.1f} с")
+        except sqlite3.Error as e:
+            print(f"✗ Ошибка архивации: {e}")
+        await asyncio.sleep(interval)
+
+
+def api_route(method, path):
+    return f"{method} " + "/".join("{id}" if part.isdigit() else part for part in path.split("/"))
+
+
+def http_response(status, payload, keep_alive):
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+    head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+def metrics_access(headers, peer, metrics_token):
+    if metrics_token:
+        token = bearer_token(headers)
+        if token is None:
+            return 401, {"error": "требуется авторизация"}
+        if not hmac.compare_digest(token.encode(), metrics_token.encode()):
+            return 403, {"error": "нет доступа к метрикам"}
+        return None
+    try:
+        local = ipaddress.ip_address(peer[0].partition("%")[0]).is_loopback
+    except (TypeError, ValueError, IndexError):
+        local = False
+    return None if local else (403, {"error": "метрики доступны только с локального адреса или по токену"})
+
+
+async def handle_http_connection(service, executor, reader, writer, metrics_token=None):
+    loop = asyncio.get_running_loop()
+    peer = writer.get_extra_info("peername")
+    try:
+        while True:
+            request_line = await asyncio.wait_for(reader.readline(), HTTP_IDLE_TIMEOUT)
+            if not request_line:
+                break
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                writer.write(http_response(400, {"error": "некорректная строка запроса"}, False))
+                break
+
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), HTTP_IDLE_TIMEOUT)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            connection = headers.get("connection", "").lower()
+            keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+
+            length = int(headers.get("content-length") or 0)
+            if length > HTTP_MAX_BODY:
+                writer.write(http_response(413, {"error": "слишком большое тело запроса"}, False))
+                break
+            body = await reader.readexactly(length) if length else b""
+
+            method = method.upper()
+            url = urllib.parse.urlsplit(target)
+            path = url.path.rstrip("/")
+            started = time.perf_counter()
+            if method == "POST" and path == "/login":
+                status, payload = await handle_login_request(service, executor, body)
+            elif method == "GET" and path == "/notifications/poll":
+                status, payload = await handle_poll_request(service, executor, target, headers)
+            elif method == "GET" and path == "/metrics":
+                fmt = urllib.parse.parse_qs(url.query).get("format", ["prom"])[-1]
+                denied = metrics_access(headers, peer, metrics_token)
+                status, payload = denied or (200, metrics_dump(service, fmt))
+            else:
+                status, payload = await loop.run_in_executor(executor, handle_api_request, service,
+                                                             method, target, headers, body)
+            if path != "/metrics":
+                METRICS.observe_operation(api_route(method, path), time.perf_counter() - started, status >= 500)
+            writer.write(http_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_http(service, host=HTTP_HOST, port=HTTP_PORT, archive_interval=ARCHIVE_INTERVAL,
+                     order_days=ARCHIVE_ORDER_AGE_DAYS, notification_days=ARCHIVE_NOTIFICATION_AGE_DAYS,
+                     metrics_token=None):
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=service.pool.size)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_http_connection(service, executor, reader, writer, metrics_token),
+        host, port, backlog=HTTP_BACKLOG)
+
+    print(f"✓ HTTP API слушает http://{host}:{port} (потоков БД: {service.pool.size})")
+    flusher = asyncio.create_task(flush_read_marks_periodically(service, executor))
+    stop = threading.Event()
+    archiver = None
+    if archive_interval:
+        archiver = asyncio.create_task(archive_periodically(service, executor, stop, archive_interval,
+                                                            order_days, notification_days))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        flusher.cancel()
+        stop.set()
+        if archiver:
+            archiver.cancel()
+        executor.shutdown(wait=True)
+        service.flush_read_marks()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DuberBuber - система заказа такси")
+    parser.add_argument("--db", default="DuberBuber.db", help="путь к файлу базы данных")
+    parser.add_argument("--metrics-sample", type=float, default=METRICS_SAMPLE_RATE,
+                        help="доля операций, для которых замеряется каждый SQL-запрос (0 — только время операций)")
+    parser.add_argument("--metrics-out", help="куда сохранить метрики при выходе (.json или .prom)")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("check-plans", help="проверить, что горячие запросы используют индексы")
+    export_parser = subparsers.add_parser("export", help="экспортировать заказы без интерактивного меню")
+    export_parser.add_argument("--out", default="out", help="папка для файлов экспорта")
+    export_parser.add_argument("--incremental", action="store_true",
+                               help="выгрузить только новые и изменённые заказы с прошлого запуска")
+    analytics_parser = subparsers.add_parser("analytics", help="сводка по водителям, пассажирам и часам")
+    analytics_parser.add_argument("--by", choices=ANALYTICS_BY, default="driver")
+    analytics_parser.add_argument("--top", type=int, default=ANALYTICS_TOP)
+    analytics_parser.add_argument("--since", help="начало периода: ГГГГ-ММ-ДД или ГГГГ-ММ-ДД ЧЧ:ММ")
+    analytics_parser.add_argument("--until", help="конец периода, не включая")
+    analytics_parser.add_argument("--adhoc", action="store_true", help="считать по заказам, а не по сводным таблицам")
+    analytics_parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    subparsers.add_parser("refresh-analytics", help="пересобрать сводные таблицы аналитики")
+    subparsers.add_parser("refresh-routes", help="пересобрать оценки маршрутов по истории заказов")
+    archive_parser = subparsers.add_parser("archive", help="перенести старые заказы и уведомления в архивные таблицы")
+    archive_parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    bench_parser = subparsers.add_parser("bench-export", help="замерить время и пиковую память экспорта")
+    bench_parser.add_argument("--orders", default="10000,100000,1000000",
+                              help="размеры тестовых баз через запятую")
+    bench_parser.add_argument("--work-dir", default="bench")
+    for command_parser in (export_parser, bench_parser):
+        command_parser.add_argument("--formats", type=parse_formats, default=list(EXPORT_WRITERS),
+                                    help=f"форматы через запятую: {','.join(EXPORT_WRITERS)}")
+        command_parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+        mode = command_parser.add_mutually_exclusive_group()
+        mode.add_argument("--parallel", dest="parallel", action="store_true", default=None,
+                          help="писать каждый формат в отдельном процессе")
+        mode.add_argument("--sequential", dest="parallel", action="store_false",
+                          help="писать форматы по очереди в одном процессе")
+    seed_parser = subparsers.add_parser("seed", help="сгенерировать синтетические данные")
+    seed_parser.add_argument("--orders", type=int, default=100000)
+    seed_parser.add_argument("--drivers", type=int)
+    seed_parser.add_argument("--passengers", type=int)
+    seed_parser.add_argument("--notifications", type=int)
+    seed_parser.add_argument("--open-share", type=float, default=0.05)
+    seed_parser.add_argument("--seed", type=int, default=0)
+    load_parser = subparsers.add_parser("load", help="загрузить заказы из CSV/JSON экспорта")
+    load_parser.add_argument("paths", nargs="+")
+    for command_parser in (seed_parser, load_parser):
+        command_parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    dispatch_parser = subparsers.add_parser("dispatch", help="распределить все открытые заказы за один проход")
+    dispatch_parser.add_argument("--max-pickup-km", type=float, default=DISPATCH_MAX_PICKUP_KM)
+    accept_parser = subparsers.add_parser("bench-accept", help="гонка водителей за открытые заказы")
+    accept_parser.add_argument("--drivers", type=int, default=200)
+    accept_parser.add_argument("--orders", type=int, default=2000)
+    accept_parser.add_argument("--processes", type=int, default=8)
+    accept_parser.add_argument("--bench-db", default="bench_accept.db")
+    all_parser = subparsers.add_parser("bench", help="замерить все операции меню на сгенерированных базах")
+    all_parser.add_argument("--orders", default=BENCH_SIZES, help="размеры тестовых баз через запятую")
+    all_parser.add_argument("--operations", help=f"операции через запятую: {','.join(BENCH_OPERATIONS)}")
+    all_parser.add_argument("--iterations", type=int, default=BENCH_ITERATIONS)
+    all_parser.add_argument("--export-iterations", type=int, default=BENCH_EXPORT_ITERATIONS)
+    all_parser.add_argument("--export-formats", type=parse_formats, default=["csv"])
+    all_parser.add_argument("--seed", type=int, default=0)
+    all_parser.add_argument("--work-dir", default="bench")
+    all_parser.add_argument("--output", help="куда сохранить результаты в JSON")
+    all_parser.add_argument("--compare", help="JSON с результатами прошлого запуска")
+    all_parser.add_argument("--threshold", type=float, default=BENCH_REGRESSION_THRESHOLD,
+                            help="допустимое ухудшение, доля")
+    ratings_parser = subparsers.add_parser("bench-ratings", help="замерить обновление и пересчёт рейтингов")
+    ratings_parser.add_argument("--events", type=int, default=1000000)
+    ratings_parser.add_argument("--drivers", type=int, default=10000)
+    ratings_parser.add_argument("--passengers", type=int, default=100000)
+    ratings_parser.add_argument("--updates", type=int, default=10000)
+    ratings_parser.add_argument("--seed", type=int, default=0)
+    ratings_parser.add_argument("--bench-db", default="bench_ratings.db")
+    recompute_parser = subparsers.add_parser("recompute-ratings", help="пересчитать агрегаты рейтингов по истории")
+    recompute_parser.add_argument("--half-life-days", type=float, default=RATING_HALF_LIFE / 86400)
+    login_parser = subparsers.add_parser("bench-login", help="замерить пропускную способность входа")
+    login_parser.add_argument("--logins", type=int, default=200)
+    login_parser.add_argument("--concurrency", type=int, default=16)
+    login_parser.add_argument("--kdf", choices=list(PASSWORD_KDFS), default=PASSWORD_KDF)
+    login_parser.add_argument("--cost", help="параметры KDF: итерации для pbkdf2_sha256, n:r:p для scrypt")
+    login_parser.add_argument("--workers", type=int, default=PASSWORD_WORKERS, help="потоков для KDF")
+    login_parser.add_argument("--bench-db", default="bench_login.db")
+    serve_parser = subparsers.add_parser("serve", help="запустить HTTP/JSON API")
+    serve_parser.add_argument("--host", default=HTTP_HOST)
+    serve_parser.add_argument("--port", type=int, default=HTTP_PORT)
+    serve_parser.add_argument("--workers", type=int, default=16, help="потоков и соединений с базой")
+    serve_parser.add_argument("--metrics-token", default=os.environ.get(METRICS_TOKEN_ENV),
+                              help=f"токен для /metrics (по умолчанию ${METRICS_TOKEN_ENV}); "
+                                   "без токена метрики отдаются только локальным клиентам")
+    serve_parser.add_argument("--write-batch-size", type=int, default=WRITE_BATCH_SIZE,
+                              help="сколько изменений объединять в одну транзакцию")
+    serve_parser.add_argument("--write-batch-delay", type=float, default=WRITE_BATCH_DELAY,
+                              help="сколько секунд ждать изменений для общей транзакции")
+    serve_parser.add_argument("--persist-sessions", action="store_true",
+                              help="хранить сессии в базе, чтобы они переживали перезапуск")
+    serve_parser.add_argument("--archive-interval", type=float, default=ARCHIVE_INTERVAL,
+                              help="как часто переносить старую историю в архив, секунды (0 — не переносить)")
+    for command_parser in (archive_parser, serve_parser):
+        command_parser.add_argument("--order-days", type=float, default=ARCHIVE_ORDER_AGE_DAYS,
+                                    help="архивировать завершённые заказы старше стольких дней")
+        command_parser.add_argument("--notification-days", type=float, default=ARCHIVE_NOTIFICATION_AGE_DAYS,
+                                    help="архивировать прочитанные уведомления старше стольких дней")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        operations = [name.strip() for name in args.operations.split(",")] if args.operations else None
+        unknown = [name for name in operations or [] if name not in BENCH_OPERATIONS]
+        if unknown:
+            parser.error(f"неизвестные операции: {', '.join(unknown)}")
+        options = {
+            "work_dir": args.work_dir,
+            "formats": args.export_formats,
+            "batch_size": EXPORT_BATCH_SIZE,
+            "parallel": None,
+            "export_iterations": args.export_iterations,
+        }
+        report = benchmark_all([int(size) for size in args.orders.split(",")], args.work_dir, operations,
+                               args.iterations, args.seed, options)
+        output = args.output or os.path.join(args.work_dir, f"bench-{time.strftime('%Y%m%dT%H%M%S')}.json")
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📁 Результаты сохранены в {output}")
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                ok = compare_benchmarks(json.load(f), report, args.threshold)
+            raise SystemExit(0 if ok else 1)
+        return
+
+    if args.command == "bench-accept":
+        ok = benchmark_accept(args.bench_db, args.drivers, args.orders, args.processes)
+        raise SystemExit(0 if ok else 1)
+
+    if args.command == "bench-ratings":
+        ok = benchmark_ratings(args.bench_db, args.events, args.drivers, args.passengers, args.updates, args.seed)
+        raise SystemExit(0 if ok else 1)
+
+    if args.command == "bench-login":
+        benchmark_login(args.bench_db, args.logins, args.concurrency, args.kdf, args.cost, args.workers)
+        return
+
+    if args.command == "bench-export":
+        benchmark_export([int(size) for size in args.orders.split(",")], args.work_dir,
+                         args.formats, args.batch_size, args.parallel)
+        return
+
+    METRICS.sample_rate = args.metrics_sample
+    metrics = METRICS if args.command in (None, "serve") or args.metrics_out else None
+    pool = (ConnectionPool(args.db, size=args.workers, metrics=metrics) if args.command == "serve"
+            else ConnectionPool(args.db, metrics=metrics))
+
+    with pool.connection() as conn:
+        applied = migrate(conn)
+        if applied:
+            print(f"✓ Применены миграции схемы: {', '.join(map(str, applied))}")
+        if 12 in applied:
+            routes, elapsed = refresh_routes(conn)
+            print(f"✓ Оценки маршрутов собраны из истории: {routes} за {elapsed:.1f} с")
+
+        if args.command == "check-plans":
+            ok = print_query_plans(conn)
+        elif args.command == "export":
+            export_data(conn, args.formats, args.out, args.batch_size, args.parallel, args.incremental)
+        elif args.command == "analytics":
+            try:
+                if args.json:
+                    print(json.dumps(analytics_rows(conn, args.by, args.since, args.until, args.top, args.adhoc),
+                                     ensure_ascii=False, indent=2))
+                else:
+                    analytics_report(conn, args.by, args.since, args.until, args.top, args.adhoc)
+            except ValueError as e:
+                parser.error(str(e))
+        elif args.command == "refresh-analytics":
+            drivers, passengers, hours, elapsed = refresh_analytics(conn)
+            print(f"✓ Сводки пересобраны: водителей {drivers}, пассажиров {passengers}, часов {hours} "
+                  f"за {elapsed:.1f} с")
+        elif args.command == "refresh-routes":
+            routes, elapsed = refresh_routes(conn)
+            print(f"✓ Оценки маршрутов пересобраны: {routes} за {elapsed:.1f} с")
+        elif args.command == "archive":
+            run_archive(conn, args.order_days, args.notification_days, args.batch_size)
+        elif args.command == "dispatch":
+            run_batch_dispatch(conn, max_pickup_km=args.max_pickup_km)
+        elif args.command == "recompute-ratings":
+            events, users, elapsed = recompute_ratings(conn, args.half_life_days * 86400)
+            print(f"✓ Пересчитано событий: {events}, пользователей: {users} за {elapsed:.1f} с")
+        elif args.command == "seed":
+            elapsed = generate_dataset(conn, args.orders, args.drivers, args.passengers, args.notifications,
+                                       args.seed, args.batch_size, args.open_share)
+            print(f"✓ Сгенерировано заказов: {args.orders} за {elapsed:.1f} с "
+                  f"({args.orders / elapsed if elapsed else 0:.0f} заказов/с)")
+        elif args.command == "load":
+            for path in args.paths:
+                try:
+                    loaded, elapsed = load_export(conn, path, args.batch_size)
+                except (OSError, ValueError, KeyError, IndexError) as e:
+                    print(f"✗ Ошибка загрузки {path}: {e}")
+                    continue
+                print(f"✓ Загружено заказов из {path}: {loaded} за {elapsed:.1f} с")
+        elif not conn.execute("SELECT 1 FROM Drivers LIMIT 1").fetchone():
+            seed_test_data(conn)
+
+    if args.command == "serve":
+        service = DuberService(pool, persist_sessions=args.persist_sessions, write_batch_size=args.write_batch_size,
+                               write_batch_delay=args.write_batch_delay)
+        service.load()
+        try:
+            asyncio.run(serve_http(service, args.host, args.port, args.archive_interval, args.order_days,
+                                   args.notification_days, args.metrics_token))
+        except KeyboardInterrupt:
+            print("\nСервер остановлен.")
+        if args.metrics_out:
+            save_metrics(service, args.metrics_out)
+        service.close()
+        return
+
+    if args.command:
+        pool.close()
+        if args.metrics_out:
+            save_metrics(None, args.metrics_out)
+        if args.command == "check-plans":
+            raise SystemExit(0 if ok else 1)
+        return
+
+    service = DuberService(pool)
+    service.load()
+
+    print("\n" + "=" * 50)
+    print("СИСТЕМА ГОТОВА К РАБОТЕ")
+    print("=" * 50)
+
+    while True:
+        print("\n" + "=" * 50)
+        print("DUBER BUBER - СИСТЕМА ЗАКАЗА ТАКСИ")
+        print("=" * 50)
+        print("1. 🚗 Войти как водитель")
         print("2. 👤 Войти как пассажир")
         print("3. 📊 Экспортировать данные (администратор)")
         print("4. 🚪 Выйти из системы")
+        print("5. 🚦 Распределить открытые заказы (администратор)")
+        print("6. 📈 Аналитика (администратор)")
+        print("7. 📉 Метрики производительности (администратор)")
+        print("8. 🗄️  Архивировать старую историю (администратор)")
+
+        choice = input("\nВыберите действие (1-8): ")
+
+        if choice == '1':
+            user = login_user(service, "driver")
+            if user:
+                show_user_menu(service, user)
+        elif choice == '2':
+            user = login_user(service, "passenger")
+            if user:
+                show_user_menu(service, user)
+        elif choice == '3':
+            admin_pass = input("Введите пароль администратора: ")
+            if admin_pass == "admin123":
+                with pool.connection() as conn:
+                    export_data(conn)
+            else:
+                print("\n✗ Неверный пароль администратора!")
+        elif choice == '4':
+            print("\n" + "=" * 50)
+            print("Спасибо за использование DuberBuber! До свидания!")
+            print("=" * 50)
+            break
+        elif choice == '5':
+            admin_pass = input("Введите пароль администратора: ")
+            if admin_pass == "admin123":
+                with pool.connection() as conn:
+                    run_batch_dispatch(conn, service.book, bus=service.bus)
+            else:
+                print("\n✗ Неверный пароль администратора!")
+        elif choice == '6':
+            admin_pass = input("Введите пароль администратора: ")
+            if admin_pass == "admin123":
+                with pool.connection() as conn:
+                    show_analytics(conn)
+            else:
+                print("\n✗ Неверный пароль администратора!")
+        elif choice == '7':
+            admin_pass = input("Введите пароль администратора: ")
+            if admin_pass == "admin123":
+                show_metrics(service)
+            else:
+                print("\n✗ Неверный пароль администратора!")
+        elif choice == '8':
+            admin_pass = input("Введите пароль администратора: ")
+            if admin_pass == "admin123":
+                with pool.connection() as conn:
+                    run_archive(conn)
+            else:
+                print("\n✗ Неверный пароль администратора!")
+        else:
+            print("\n✗ Неверный выбор! Пожалуйста, выберите 1-8.")
+
+    if args.metrics_out:
+        save_metrics(service, args.metrics_out)
+    service.close()
+
+
+EXPORT_SELECT = """
+    SELECT O.Orders_id, D.Driver_id, D.Username, D.Rating, P.Passenger_id, P.Username, P.Rating,
+           A.Delivery_address, A.Final_address, A.Time_order, A.Price, A.Distance_km
+    FROM {orders} O
+    JOIN Drivers D ON O.Driver_id = D.Driver_id
+    JOIN Passengers P ON O.Passenger_id = P.Passenger_id
+    JOIN {about_orders} A ON O.About_orders_id = A.About_orders_id
+    """
+
+EXPORT_QUERY = with_archive(EXPORT_SELECT, """
+    ORDER BY O.Orders_id
+    """)
+
+EXPORT_DELTA_QUERY = with_archive(EXPORT_SELECT + """
+    WHERE O.Orders_id IN (
+        SELECT Orders_id FROM {orders}
+        WHERE Orders_id > :last_order_id AND Orders_id <= :max_order_id
+          AND (UpdatedAt IS NULL OR UpdatedAt <= :max_updated_at)
+        UNION
+        SELECT Orders_id FROM {orders}
+        WHERE UpdatedAt > :last_updated_at AND UpdatedAt <= :max_updated_at
+          AND Orders_id <= :max_order_id
+    )
+    """, """
+    ORDER BY O.Orders_id
+    """)
+
+EXPORT_STATE_FILE = "DuberBuber.state.json"
+
+EXPORT_DICTIONARY_FIELDS = {"driver_name", "passenger_name", "delivery_address", "final_address"}
+EXPORT_INTEGER_FIELDS = {"order_id", "driver_id", "passenger_id"}
+
+EXPORT_FIELDS = [
+    "order_id", "driver_id", "driver_name", "driver_rating",
+    "passenger_id", "passenger_name", "passenger_rating",
+    "delivery_address", "final_address", "time_order", "price",
+    "distance_km"
+]
+
+EXPORT_BATCH_SIZE = 5000
+EXPORT_ROW_GROUP_SIZE = 100000
+EXPORT_QUEUE_SIZE = 8
+
+
+def iter_export_batches(conn, batch_size=EXPORT_BATCH_SIZE, query=EXPORT_QUERY, params=()):
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def export_record(row):
+    return {
+        "order_id": row[0],
+        "driver": {
+            "driver_id": row[1],
+            "name": row[2],
+            "rating": row[3]
+        },
+        "passenger": {
+            "passenger_id": row[4],
+            "name": row[5],
+            "rating": row[6]
+        },
+        "order_details": {
+            "delivery_address": row[7],
+            "final_address": row[8],
+            "time_order": row[9],
+            "price": row[10],
+            "distance_km": row[11]
+        }
+    }
+
+
+class JsonExportWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write("[")
+        self.count = 0
+
+    def write(self, rows):
+        for row in rows:
+            item = json.dumps(export_record(row), ensure_ascii=False, indent=2)
+            self.file.write(",\n  " if self.count else "\n  ")
+            self.file.write(item.replace("\n", "\n  "))
+            self.count += 1
+
+    def close(self):
+        self.file.write("\n]" if self.count else "]")
+        self.file.close()
+
+
+class CsvExportWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", newline='', encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_FIELDS)
+        self.count = 0
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.count += len(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class XmlExportWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.xml = XMLGenerator(self.file, encoding="utf-8")
+        self.xml.startDocument()
+        self.xml.startElement("orders", {})
+        self.count = 0
+
+    def element(self, name, value):
+        self.xml.startElement(name, {})
+        self.xml.characters(str(value))
+        self.xml.endElement(name)
+
+    def write(self, rows):
+        for row in rows:
+            self.xml.startElement("order", {})
+            self.element("order_id", row[0])
+
+            self.xml.startElement("driver", {})
+            self.element("driver_id", row[1])
+            self.element("name", row[2])
+            self.element("rating", row[3])
+            self.xml.endElement("driver")
+
+            self.xml.startElement("passenger", {})
+            self.element("passenger_id", row[4])
+            self.element("name", row[5])
+            self.element("rating", row[6])
+            self.xml.endElement("passenger")
+
+            self.xml.startElement("order_details", {})
+            self.element("delivery_address", row[7])
+            self.element("final_address", row[8])
+            self.element("time_order", row[9])
+            self.element("price", row[10])
+            self.element("distance_km", row[11])
+            self.xml.endElement("order_details")
+
+            self.xml.endElement("order")
+            self.count += 1
+
+    def close(self):
+        self.xml.endElement("orders")
+        self.xml.endDocument()
+        self.file.close()
+
+
+class YamlExportWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", encoding="utf-8")
+        self.count = 0
+
+    def write(self, rows):
+        yaml.dump([export_record(row) for row in rows], self.file,
+                  Dumper=YAML_DUMPER, allow_unicode=True, sort_keys=False)
+        self.count += len(rows)
 
-        choice = input("\nВыберите действие (1-4): ")
+    def close(self):
+        if not self.count:
+            self.file.write("[]\n")
+        self.file.close()
 
-        if choice == '1':
-            user = login_user(conn, "driver")
-            if user:
-                show_user_menu(conn, user)
-        elif choice == '2':
-            user = login_user(conn, "passenger")
-            if user:
-                show_user_menu(conn, user)
-        elif choice == '3':
-            admin_pass = input("Введите пароль администратора: ")
-            if admin_pass == "admin123":
-                export_data(conn)
+
+class ParquetExportWriter:
+    def __init__(self, path):
+        fields = []
+        for name in EXPORT_FIELDS:
+            if name in EXPORT_DICTIONARY_FIELDS:
+                fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+            elif name in EXPORT_INTEGER_FIELDS:
+                fields.append(pa.field(name, pa.int64()))
+            elif name == "time_order":
+                fields.append(pa.field(name, pa.string()))
             else:
-                print("\n✗ Неверный пароль администратора!")
-        elif choice == '4':
-            print("\n" + "=" * 50)
-            print("Спасибо за использование DuberBuber! До свидания!")
-            print("=" * 50)
+                fields.append(pa.field(name, pa.float64()))
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.buffer = []
+        self.count = 0
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        self.count += len(rows)
+        if len(self.buffer) >= EXPORT_ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        columns = list(zip(*self.buffer))
+        arrays = [pa.array(column, type=field.type) for column, field in zip(columns, self.schema)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema),
+                                row_group_size=len(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class NumpyExportWriter:
+    def __init__(self, path):
+        self.bundle = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        self.dictionaries = {name: {} for name in EXPORT_DICTIONARY_FIELDS}
+        self.buffer = []
+        self.groups = 0
+        self.count = 0
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        self.count += len(rows)
+        if len(self.buffer) >= EXPORT_ROW_GROUP_SIZE:
+            self.flush()
+
+    def save(self, name, array):
+        with self.bundle.open(f"{name}.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, array, allow_pickle=False)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        for name, column in zip(EXPORT_FIELDS, zip(*self.buffer)):
+            if name in EXPORT_DICTIONARY_FIELDS:
+                codes = self.dictionaries[name]
+                array = np.fromiter((codes.setdefault(value, len(codes)) for value in column),
+                                    dtype=np.int32, count=len(column))
+            elif name in EXPORT_INTEGER_FIELDS:
+                array = np.array(column, dtype=np.int64)
+            elif name == "time_order":
+                array = np.array(column, dtype=str)
+            else:
+                array = np.array(column, dtype=np.float64)
+            self.save(f"rg{self.groups:05d}/{name}", array)
+        self.groups += 1
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        for name, codes in self.dictionaries.items():
+            self.save(f"dictionary/{name}", np.array(list(codes), dtype=str))
+        self.bundle.close()
+
+
+def load_columnar(path):
+    if path.endswith(".parquet"):
+        table = pq.read_table(path)
+        return {name: table.column(name).combine_chunks() for name in table.column_names}
+
+    with np.load(path, allow_pickle=False) as bundle:
+        groups = sorted({key.split("/")[0] for key in bundle.files if key.startswith("rg")})
+        columns = {name: np.concatenate([bundle[f"{group}/{name}"] for group in groups])
+                   if groups else np.array([]) for name in EXPORT_FIELDS}
+        for name in EXPORT_DICTIONARY_FIELDS:
+            columns[f"{name}_dictionary"] = bundle[f"dictionary/{name}"]
+    return columns
+
+
+EXPORT_WRITERS = {
+    "json": ("JSON", JsonExportWriter),
+    "csv": ("CSV", CsvExportWriter),
+    "xml": ("XML", XmlExportWriter),
+    "yaml": ("YAML", YamlExportWriter),
+}
+
+if pa is not None:
+    EXPORT_WRITERS["parquet"] = ("Parquet", ParquetExportWriter)
+elif np is not None:
+    EXPORT_WRITERS["npz"] = ("NumPy", NumpyExportWriter)
+
+
+def export_sequential(batches, paths):
+    writers = {fmt: EXPORT_WRITERS[fmt][1](path) for fmt, path in paths.items()}
+    busy = dict.fromkeys(paths, 0.0)
+
+    total = 0
+    try:
+        for rows in batches:
+            for fmt, writer in writers.items():
+                started = time.perf_counter()
+                writer.write(rows)
+                busy[fmt] += time.perf_counter() - started
+            total += len(rows)
+    finally:
+        for fmt, writer in writers.items():
+            started = time.perf_counter()
+            writer.close()
+            busy[fmt] += time.perf_counter() - started
+
+    return total, {fmt: (writers[fmt].count, busy[fmt], None) for fmt in paths}
+
+
+def run_export_writer(fmt, path, batches, results):
+    writer = None
+    error = None
+    busy = 0.0
+
+    try:
+        writer = EXPORT_WRITERS[fmt][1](path)
+    except OSError as e:
+        error = str(e)
+
+    while True:
+        payload = batches.get()
+        if payload is None:
             break
+        if error:
+            continue
+        started = time.perf_counter()
+        try:
+            writer.write(pickle.loads(payload))
+        except Exception as e:
+            error = str(e)
+        busy += time.perf_counter() - started
+
+    if writer:
+        started = time.perf_counter()
+        writer.close()
+        busy += time.perf_counter() - started
+
+    results.put((fmt, writer.count if writer else 0, busy, error))
+
+
+def export_parallel(batches, paths):
+    results = multiprocessing.Queue()
+    queues = {fmt: multiprocessing.Queue(EXPORT_QUEUE_SIZE) for fmt in paths}
+    workers = [multiprocessing.Process(target=run_export_writer, args=(fmt, path, queues[fmt], results))
+               for fmt, path in paths.items()]
+    for worker in workers:
+        worker.start()
+
+    total = 0
+    try:
+        for rows in batches:
+            payload = pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)
+            for batches in queues.values():
+                batches.put(payload)
+            total += len(rows)
+    finally:
+        for batches in queues.values():
+            batches.put(None)
+
+    stats = {}
+    for _ in workers:
+        fmt, count, busy, error = results.get()
+        stats[fmt] = (count, busy, error)
+    for worker in workers:
+        worker.join()
+
+    return total, stats
+
+
+def load_export_state(out_dir):
+    path = os.path.join(out_dir, EXPORT_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_export_state(out_dir, state):
+    path = os.path.join(out_dir, EXPORT_STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+@METRICS.timed("export_data")
+def export_data(conn, formats=None, out_dir="out", batch_size=EXPORT_BATCH_SIZE, parallel=None,
+                incremental=False):
+    formats = formats or list(EXPORT_WRITERS)
+    if parallel is None:
+        parallel = (os.cpu_count() or 1) > 1
+    export = export_parallel if parallel and len(formats) > 1 else export_sequential
+
+    print("\n" + "=" * 50)
+    print("ЭКСПОРТ ДАННЫХ" + (" (ИНКРЕМЕНТАЛЬНЫЙ)" if incremental else ""))
+    print("=" * 50)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    state = load_export_state(out_dir)
+    conn.execute("BEGIN")
+    try:
+        max_order_id, max_updated_at = conn.execute(
+            "SELECT MAX(Orders_id), MAX(UpdatedAt) FROM AllOrders").fetchone()
+        high_water = {
+            "last_order_id": max_order_id or 0,
+            "last_updated_at": max_updated_at or "",
+        }
+
+        if incremental:
+            stamp = time.strftime("%Y%m%dT%H%M%S")
+
+            groups = {}
+            for fmt in formats:
+                mark = state.get(fmt, {})
+                key = (mark.get("last_order_id", 0), mark.get("last_updated_at", ""))
+                groups.setdefault(key, []).append(fmt)
+
+            paths = {}
+            stats = {}
+            total = 0
+            for (last_order_id, last_updated_at), group in groups.items():
+                params = {
+                    "last_order_id": last_order_id,
+                    "last_updated_at": last_updated_at,
+                    "max_order_id": high_water["last_order_id"],
+                    "max_updated_at": high_water["last_updated_at"],
+                }
+                group_paths = {fmt: os.path.join(out_dir, f"DuberBuber.delta-{stamp}.{fmt}") for fmt in group}
+                count, group_stats = export(iter_export_batches(conn, batch_size, EXPORT_DELTA_QUERY, params),
+                                            group_paths)
+                paths.update(group_paths)
+                stats.update(group_stats)
+                total = max(total, count)
         else:
-            print("\n✗ Неверный выбор! Пожалуйста, выберите 1-4.")
+            paths = {fmt: os.path.join(out_dir, f"DuberBuber.{fmt}") for fmt in formats}
+            total, stats = export(iter_export_batches(conn, batch_size), paths)
+    finally:
+        conn.commit()
 
-    conn.close()
+    for fmt in formats:
+        if not stats[fmt][2]:
+            state[fmt] = high_water
+    save_export_state(out_dir, state)
+    elapsed = time.perf_counter() - started
+
+    for fmt in formats:
+        count, busy, error = stats[fmt]
+        if error:
+            print(f"✗ Ошибка экспорта в {EXPORT_WRITERS[fmt][0]}: {error}")
+        else:
+            print(f"✓ Данные экспортированы в {EXPORT_WRITERS[fmt][0]}: {paths[fmt]} ({busy:.2f} с)")
 
+    print(f"\n📁 Все файлы сохранены в папке '{out_dir}/'")
+    print(f"📊 Всего экспортировано заказов: {total}")
+    print(f"⏱️  Общее время экспорта: {elapsed:.2f} с")
+    return total
+
+
+ANALYTICS_ADHOC_KEYS = {
+    "driver": "o.Driver_id",
+    "passenger": "o.Passenger_id",
+    "hour": "strftime('%Y-%m-%d %H:00', o.CreatedAt)",
+    "hour-of-day": "CAST(strftime('%H', o.CreatedAt) AS INTEGER)",
+}
+
+ANALYTICS_ADHOC_ORDER = {
+    "driver": "Revenue DESC",
+    "passenger": "Revenue DESC",
+    "hour": "1 DESC",
+    "hour-of-day": "1",
+}
+
+ANALYTICS_ADHOC_QUERY = """
+    SELECT {key}, COUNT(*), COUNT(o.Driver_id), TOTAL((o.Driver_id IS NOT NULL) * o.Price) AS Revenue,
+           TOTAL((o.Driver_id IS NOT NULL) * o.Distance_km)
+    FROM ({facts}) o
+    WHERE o.CreatedAt >= ? AND o.CreatedAt < ? AND {key} IS NOT NULL
+    GROUP BY 1
+    ORDER BY {order}
+    LIMIT ?
+"""
+
+
+def analytics_bound(value, default):
+    if not value:
+        return default
+    for pattern in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return time.strftime("%Y-%m-%d %H:%M", time.strptime(value.strip(), pattern))
+        except ValueError:
+            pass
+    raise ValueError(f"некорректная дата: {value!r}, ожидается ГГГГ-ММ-ДД или ГГГГ-ММ-ДД ЧЧ:ММ")
+
+
+@METRICS.timed("refresh_analytics")
+def refresh_analytics(conn):
+    script = ANALYTICS_REFRESH.format(facts=with_archive(ANALYTICS_FACTS))
+    started = time.perf_counter()
+    try:
+        conn.executescript(f"BEGIN IMMEDIATE;\n{script}\nCOMMIT;")
+    except BaseException:
+        conn.rollback()
+        raise
+    drivers, passengers, hours = conn.execute("""
+        SELECT (SELECT COUNT(*) FROM DriverStats), (SELECT COUNT(*) FROM PassengerStats),
+               (SELECT COUNT(*) FROM HourlyStats)
+    """).fetchone()
+    return drivers, passengers, hours, time.perf_counter() - started
+
+
+@METRICS.timed("refresh_addresses")
+def refresh_addresses(conn):
+    started = time.perf_counter()
+    try:
+        conn.executescript(f"BEGIN IMMEDIATE;\n{ADDRESS_REFRESH}\nCOMMIT;")
+    except BaseException:
+        conn.rollback()
+        raise
+    return conn.execute("SELECT COUNT(*) FROM Addresses WHERE Uses > 0").fetchone()[0], time.perf_counter() - started
+
+
+@METRICS.timed("refresh_routes")
+def refresh_routes(conn):
+    started = time.perf_counter()
+    conn.create_function("route_key", 1, route_address, deterministic=True)
+    try:
+        conn.executescript(f"BEGIN IMMEDIATE;\n{ROUTE_REFRESH}\nCOMMIT;")
+    except BaseException:
+        conn.rollback()
+        raise
+    return conn.execute("SELECT COUNT(*) FROM RouteEstimates").fetchone()[0], time.perf_counter() - started
+
+
+@METRICS.timed("analytics_report")
+def analytics_rows(conn, by="driver", since=None, until=None, top=ANALYTICS_TOP, adhoc=False):
+    if by not in ANALYTICS_QUERIES:
+        raise ValueError(f"неизвестный разрез аналитики: {by}")
+    limit = 24 if by == "hour-of-day" else top
+    if by in ("driver", "passenger") and (since or until):
+        adhoc = True
+    since = analytics_bound(since, ANALYTICS_RANGE[0])
+    until = analytics_bound(until, ANALYTICS_RANGE[1])
+
+    if adhoc:
+        query = ANALYTICS_ADHOC_QUERY.format(facts=with_archive(ANALYTICS_FACTS), key=ANALYTICS_ADHOC_KEYS[by],
+                                             order=ANALYTICS_ADHOC_ORDER[by])
+        rows = conn.execute(query, (since, until, limit)).fetchall()
+    elif by in ("driver", "passenger"):
+        rows = conn.execute(ANALYTICS_QUERIES[by], (limit,)).fetchall()
+    else:
+        rows = conn.execute(ANALYTICS_QUERIES[by], (since, until, limit)).fetchall()
+
+    names = {}
+    if by in ("driver", "passenger") and rows:
+        names = {row[0]: row[1] for row in conn.execute(
+            PROFILE_QUERIES[by].format(", ".join("?" * len(rows))), [row[0] for row in rows])}
+
+    return [{
+        "key": key,
+        "name": names.get(key, ""),
+        "orders": orders,
+        "trips": trips,
+        "revenue": round(revenue, 2),
+        "distance_km": round(distance, 1),
+    } for key, orders, trips, revenue, distance in rows]
+
+
+def analytics_report(conn, by="driver", since=None, until=None, top=ANALYTICS_TOP, adhoc=False):
+    titles = {
+        "driver": ("ВОДИТЕЛИ ПО ВЫРУЧКЕ", "ID водителя"),
+        "passenger": ("ПАССАЖИРЫ ПО ТРАТАМ", "ID пассажира"),
+        "hour": ("ЗАКАЗЫ ПО ЧАСАМ", "Час"),
+        "hour-of-day": ("ЗАКАЗЫ ПО ЧАСАМ СУТОК", "Час суток"),
+    }
+    adhoc = adhoc or by in ("driver", "passenger") and bool(since or until)
+    started = time.perf_counter()
+    rows = analytics_rows(conn, by, since, until, top, adhoc)
+    elapsed = time.perf_counter() - started
+    title, key_title = titles[by]
+
+    print("\n" + "=" * 100)
+    print(f"АНАЛИТИКА: {title}" + (" (ПО ЗАКАЗАМ)" if adhoc else ""))
+    print("=" * 100)
+    if not rows:
+        print("📭 Нет данных за выбранный период.")
+    else:
+        print(f"{key_title:<18} {'Имя':<35} {'Заказов':>9} {'Поездок':>9} {'Выручка':>14} {'Км':>11}")
+        for row in rows:
+            print(f"{row['key']!s:<18} {row['name']:<35} {row['orders']:>9} {row['trips']:>9} "
+                  f"{row['revenue']:>14.2f} {row['distance_km']:>11.1f}")
+    print(f"\n⏱️  Время запроса: {elapsed * 1000:.1f} мс")
+    return rows
+
+
+def show_analytics(conn):
+    choice = input("\nРазрез (1 — водители, 2 — пассажиры, 3 — по часам, 4 — по часам суток): ").strip()
+    if choice not in ("1", "2", "3", "4"):
+        print("\n✗ Неверный выбор!")
+        return
+    since = input("С даты (ГГГГ-ММ-ДД, Enter — за всё время): ").strip() or None
+    until = input("По дату, не включая (ГГГГ-ММ-ДД, Enter — без ограничения): ").strip() or None
+    try:
+        analytics_report(conn, ANALYTICS_BY[int(choice) - 1], since, until)
+    except ValueError as e:
+        print(f"\n✗ {e}")
+
+
+def metrics_dump(service, fmt="prom"):
+    caches = service.cache_stats() if service is not None else {}
+    writes = service.writes.stats() if service is not None else None
+    if fmt == "json":
+        return dict(METRICS.snapshot(), caches=caches, writes=writes)
+
+    lines = METRICS.prometheus().splitlines()
+    for metric, field, kind in (("cache_entries", "size", "gauge"), ("cache_hits_total", "hits", "counter"),
+                                ("cache_misses_total", "misses", "counter"),
+                                ("cache_evictions_total", "evictions", "counter")):
+        lines.append(f"# TYPE duber_{metric} {kind}")
+        lines.extend(f'duber_{metric}{{cache="{name}"}} {stats[field]}' for name, stats in caches.items())
+    if writes is not None:
+        for metric, field in (("write_batches_total", "batches"), ("write_operations_total", "operations"),
+                              ("write_failed_total", "failed"), ("write_hook_errors_total", "hook_errors")):
+            lines.append(f"# TYPE duber_{metric} counter")
+            lines.append(f"duber_{metric} {writes[field]}")
+    return "\n".join(lines) + "\n"
+
+
+def save_metrics(service, path):
+    dump = metrics_dump(service, "json" if path.endswith(".json") else "prom")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        if isinstance(dump, str):
+            f.write(dump)
+        else:
+            json.dump(dump, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def show_metrics(service):
+    snapshot = METRICS.snapshot()
+
+    print("\n" + "=" * 100)
+    print(f"МЕТРИКИ (выборка запросов {snapshot['sample_rate']:.0%}, за {snapshot['uptime_s'] / 60:.1f} мин)")
+    print("=" * 100)
+    if not snapshot["operations"]:
+        print("📭 Операций пока не было.")
+    else:
+        print(f"{'Операция':<30} {'Вызовов':>9} {'Ошибок':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} "
+              f"{'Запросов SQL':>13}")
+        for name, operation in snapshot["operations"].items():
+            statements = operation["statements"] / operation["sampled"] if operation["sampled"] else 0
+            print(f"{name:<30} {operation['count']:>9} {operation['errors']:>7} {operation['p50'] * 1000:>9.2f} "
+                  f"{operation['p95'] * 1000:>9.2f} {operation['p99'] * 1000:>9.2f} {statements:>13.1f}")
+
+    print(f"\nСамые дорогие запросы (топ {METRICS_TOP_QUERIES} по суммарному времени):")
+    print(f"{'Всего, с':>9} {'Вызовов':>9} {'p95, мс':>9} {'Строк':>10} {'Шагов VM':>12}  Запрос")
+    for query in snapshot["queries"][:METRICS_TOP_QUERIES]:
+        text = query["query"] if len(query["query"]) <= 80 else query["query"][:77] + "..."
+        print(f"{query['sum']:>9.3f} {query['count']:>9} {query['p95'] * 1000:>9.2f} {query['rows']:>10} "
+              f"{query['vm_steps']:>12}  {text}")
+
+    print("\nОжидание блокировок:")
+    for kind, wait in snapshot["lock_waits"].items():
+        print(f"   {kind}: {wait['count']} раз, p95 {wait['p95'] * 1000:.2f} мс, макс. {wait['max'] * 1000:.2f} мс, "
+              f"всего {wait['sum']:.3f} с")
+
+    print("\nКэши:")
+    for name, stats in service.cache_stats().items():
+        print(f"   {name}: {stats['size']}/{stats['max_size']}, попаданий {stats['hit_ratio']:.1%}")
+    routes = service.routes.stats()
+    print(f"   маршруты: из памяти {routes['memory_hits']}, из базы {routes['stored_hits']}, "
+          f"рассчитано {routes['computed']}, без оценки {routes['unknown']}, "
+          f"не сохранено {routes['store_failed']}")
+
+    writes = service.writes.stats()
+    print(f"\nГрупповая запись: транзакций {writes['batches']}, изменений {writes['operations']} "
+          f"(в среднем {writes['average_batch']:.1f}, максимум {writes['largest_batch']}), ошибок {writes['failed']}, "
+          f"сбоев после фиксации {writes['hook_errors']}")
+
+    fmt = input("\nСохранить дамп (json/prom, Enter — не сохранять): ").strip().lower()
+    if fmt in ("json", "prom"):
+        os.makedirs("out", exist_ok=True)
+        path = os.path.join("out", f"metrics-{time.strftime('%Y%m%dT%H%M%S')}.{fmt}")
+        save_metrics(service, path)
+        print(f"✓ Метрики сохранены в {path}")
+
+
+ARCHIVE_ORDER_COLUMNS = "Orders_id, Driver_id, Passenger_id, About_orders_id, CreatedAt, UpdatedAt"
+ARCHIVE_ABOUT_COLUMNS = ("About_orders_id, Delivery_address, Time_order, Price, Final_address, Distance_km, "
+                         "CreatedAt, Pickup_lat, Pickup_lon")
+ARCHIVE_NOTIFICATION_COLUMNS = "notification_id, Passenger_id, message, IsRead, CreatedAt"
+
+ARCHIVE_ORDERS_FILTER = """
+        o.Driver_id IS NOT NULL AND o.CreatedAt < :cutoff
+        AND NOT EXISTS (
+            SELECT 1 FROM Orders s WHERE s.About_orders_id = o.About_orders_id AND s.Orders_id <> o.Orders_id
+        )
+"""
+
+ARCHIVE_NOTIFICATIONS_FILTER = """
+        IsRead = 1 AND CreatedAt < :cutoff
+"""
+
+ARCHIVE_STEPS = {
+    "orders": (f"""
+        SELECT o.Orders_id FROM Orders o
+        WHERE o.Orders_id > :after AND {ARCHIVE_ORDERS_FILTER}
+        ORDER BY o.Orders_id
+        LIMIT :limit
+    """, [
+        f"""
+        INSERT INTO ArchivedOrders ({ARCHIVE_ORDER_COLUMNS})
+        SELECT {ARCHIVE_ORDER_COLUMNS} FROM Orders o
+        WHERE o.Orders_id BETWEEN :low AND :high AND {ARCHIVE_ORDERS_FILTER}
+        """,
+        f"""
+        INSERT INTO ArchivedAbout_orders ({ARCHIVE_ABOUT_COLUMNS})
+        SELECT {ARCHIVE_ABOUT_COLUMNS} FROM About_orders
+        WHERE About_orders_id IN (SELECT About_orders_id FROM ArchivedOrders WHERE Orders_id BETWEEN :low AND :high)
+        """,
+        """
+        DELETE FROM Orders
+        WHERE Orders_id IN (SELECT Orders_id FROM ArchivedOrders WHERE Orders_id BETWEEN :low AND :high)
+        """,
+        """
+        DELETE FROM About_orders
+        WHERE About_orders_id IN (SELECT About_orders_id FROM ArchivedOrders WHERE Orders_id BETWEEN :low AND :high)
+        """,
+    ]),
+    "notifications": (f"""
+        SELECT notification_id FROM Notification
+        WHERE notification_id > :after AND {ARCHIVE_NOTIFICATIONS_FILTER}
+        ORDER BY notification_id
+        LIMIT :limit
+    """, [
+        f"""
+        INSERT INTO ArchivedNotification ({ARCHIVE_NOTIFICATION_COLUMNS})
+        SELECT {ARCHIVE_NOTIFICATION_COLUMNS} FROM Notification
+        WHERE notification_id BETWEEN :low AND :high AND {ARCHIVE_NOTIFICATIONS_FILTER}
+        """,
+        """
+        DELETE FROM Notification
+        WHERE notification_id IN (
+            SELECT notification_id FROM ArchivedNotification WHERE notification_id BETWEEN :low AND :high
+        )
+        """,
+    ]),
+}
+
+
+def archive_cutoff(days):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - days * 86400))
 
-def export_data(conn):
-    cursor = conn.cursor()
 
+def archive_batch(conn, kind, cutoff, after=0, batch_size=ARCHIVE_BATCH_SIZE):
+    select, statements = ARCHIVE_STEPS[kind]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        ids = [row[0] for row in conn.execute(select, {"after": after, "cutoff": cutoff, "limit": batch_size})]
+        if ids:
+            params = {"low": ids[0], "high": ids[-1], "cutoff": cutoff}
+            for statement in statements:
+                conn.execute(statement, params)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(ids), ids[-1] if ids else after
+
+
+@METRICS.timed("archive_history")
+def archive_history(conn, order_days=ARCHIVE_ORDER_AGE_DAYS, notification_days=ARCHIVE_NOTIFICATION_AGE_DAYS,
+                    batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_PAUSE, stop=None):
+    started = time.perf_counter()
+    moved = {}
+    for kind, days in (("orders", order_days), ("notifications", notification_days)):
+        cutoff = archive_cutoff(days)
+        moved[kind] = after = 0
+        while not (stop and stop.is_set()):
+            count, after = archive_batch(conn, kind, cutoff, after, batch_size)
+            moved[kind] += count
+            if count < batch_size:
+                break
+            time.sleep(pause)
+
+    if any(moved.values()):
+        conn.execute("PRAGMA optimize")
+    return moved["orders"], moved["notifications"], time.perf_counter() - started
+
+
+def run_archive(conn, order_days=ARCHIVE_ORDER_AGE_DAYS, notification_days=ARCHIVE_NOTIFICATION_AGE_DAYS,
+                batch_size=ARCHIVE_BATCH_SIZE):
     print("\n" + "=" * 50)
-    print("ЭКСПОРТ ДАННЫХ")
+    print("АРХИВАЦИЯ ИСТОРИИ")
     print("=" * 50)
+    print(f"Завершённые заказы старше {order_days:g} дн. и прочитанные уведомления старше {notification_days:g} дн.")
 
-    cursor.execute("""
-    SELECT O.Orders_id, D.Driver_id, D.Username, D.Rating, P.Passenger_id, P.Username, P.Rating, 
-           A.Delivery_address, A.Final_address, A.Time_order, A.Price, A.Distance_km
-    FROM Orders O
-    JOIN Drivers D ON O.Driver_id = D.Driver_id
-    JOIN Passengers P ON O.Passenger_id = P.Passenger_id
-    JOIN About_orders A ON O.About_orders_id = A.About_orders_id
-    LEFT JOIN Notification N ON P.Passenger_id = N.Passenger_id
-    ORDER BY O.Orders_id
-    """)
-    rows = cursor.fetchall()
-
-    data = []
-    for row in rows:
-        data.append({
-            "order_id": row[0],
-            "driver": {
-                "driver_id": row[1],
-                "name": row[2],
-                "rating": row[3]
-            },
-            "passenger": {
-                "passenger_id": row[4],
-                "name": row[5],
-                "rating": row[6]
-            },
-            "order_details": {
-                "delivery_address": row[7],
-                "final_address": row[8],
-                "time_order": row[9],
-                "price": row[10],
-                "distance_km": row[11]
-            }
-        })
-
-    os.makedirs("out", exist_ok=True)
-
-    json_path = "out/DuberBuber.json"
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"✓ Данные экспортированы в JSON: {json_path}")
-
-    csv_path = "out/DuberBuber.csv"
-    with open(csv_path, "w", newline='', encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            "order_id", "driver_id", "driver_name", "driver_rating",
-            "passenger_id", "passenger_name", "passenger_rating",
-            "delivery_address", "final_address", "time_order", "price",
-            "distance_km"
-        ])
-        writer.writeheader()
-        for d in data:
-            writer.writerow({
-                "order_id": d["order_id"],
-                "driver_id": d["driver"]["driver_id"],
-                "driver_name": d["driver"]["name"],
-                "driver_rating": d["driver"]["rating"],
-                "passenger_id": d["passenger"]["passenger_id"],
-                "passenger_name": d["passenger"]["name"],
-                "passenger_rating": d["passenger"]["rating"],
-                "delivery_address": d["order_details"]["delivery_address"],
-                "final_address": d["order_details"]["final_address"],
-                "time_order": d["order_details"]["time_order"],
-                "price": d["order_details"]["price"],
-                "distance_km": d["order_details"]["distance_km"],
-            })
-    print(f"✓ Данные экспортированы в CSV: {csv_path}")
-
-    xml_path = "out/DuberBuber.xml"
-    root = ET.Element("orders")
-    for d in data:
-        order_elem = ET.SubElement(root, "order")
-        ET.SubElement(order_elem, "order_id").text = str(d["order_id"])
-
-        driver_elem = ET.SubElement(order_elem, "driver")
-        ET.SubElement(driver_elem, "driver_id").text = str(d["driver"]["driver_id"])
-        ET.SubElement(driver_elem, "name").text = str(d["driver"]["name"])
-        ET.SubElement(driver_elem, "rating").text = str(d["driver"]["rating"])
-
-        passenger_elem = ET.SubElement(order_elem, "passenger")
-        ET.SubElement(passenger_elem, "passenger_id").text = str(d["passenger"]["passenger_id"])
-        ET.SubElement(passenger_elem, "name").text = str(d["passenger"]["name"])
-        ET.SubElement(passenger_elem, "rating").text = str(d["passenger"]["rating"])
-
-        order_details_elem = ET.SubElement(order_elem, "order_details")
-        ET.SubElement(order_details_elem, "delivery_address").text = str(d["order_details"]["delivery_address"])
-        ET.SubElement(order_details_elem, "final_address").text = str(d["order_details"]["final_address"])
-        ET.SubElement(order_details_elem, "time_order").text = str(d["order_details"]["time_order"])
-        ET.SubElement(order_details_elem, "price").text = str(d["order_details"]["price"])
-        ET.SubElement(order_details_elem, "distance_km").text = str(d["order_details"]["distance_km"])
-
-    tree = ET.ElementTree(root)
-    tree.write(xml_path, encoding="utf-8", xml_declaration=True)
-    print(f"✓ Данные экспортированы в XML: {xml_path}")
-
-    yaml_path = "out/DuberBuber.yaml"
-    with open(yaml_path, "w", encoding="utf-8") as f:
-        yaml.dump(data, f, allow_unicode=True, sort_keys=False)
-    print(f"✓ Данные экспортированы в YAML: {yaml_path}")
-
-    print(f"\n📁 Все файлы сохранены в папке 'out/'")
-    print(f"📊 Всего экспортировано заказов: {len(data)}")
+    orders, notifications, elapsed = archive_history(conn, order_days, notification_days, batch_size)
+    print(f"✓ В архив перенесено заказов: {orders}, уведомлений: {notifications} за {elapsed:.1f} с")
+    return orders, notifications
+
+
+BULK_BATCH_SIZE = 100000
+BULK_CACHE_SIZE = -524288
+BULK_DEFER_INDEX_ROWS = 100000
+
+DEFERRED_SCHEMA_TABLE = """
+    CREATE TABLE IF NOT EXISTS DeferredSchema (
+        Name TEXT PRIMARY KEY,
+        Type TEXT NOT NULL,
+        Sql TEXT NOT NULL
+    ) WITHOUT ROWID
+"""
+
+CITY_CENTER = (56.3269, 44.0059)
+GENERATED_PASSWORD = "password123"
+GENERATED_HISTORY_DAYS = 365
+GENERATED_BASE_FARE = 99
+GENERATED_PER_KM = 28
+GENERATED_SCORE_WEIGHTS = [2, 3, 10, 30, 55]
+
+GENERATED_SURNAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков",
+    "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров", "Павлов", "Козлов",
+    "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин", "Захаров", "Галкин", "Капитанов",
+]
+GENERATED_MALE_NAMES = [
+    "Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Артем", "Илья", "Кирилл", "Михаил",
+    "Никита", "Матвей", "Роман", "Егор", "Иван", "Павел", "Владимир", "Денис", "Евгений", "Олег",
+]
+GENERATED_FEMALE_NAMES = [
+    "Анна", "Мария", "Елена", "Ольга", "Наталья", "Екатерина", "Татьяна", "Ирина", "Светлана", "Юлия",
+    "Анастасия", "Дарья", "Кира", "Полина", "Ксения", "Виктория", "Алина", "Софья", "Вера", "Марина",
+]
+GENERATED_PATRONYMICS = [
+    "Александрович", "Дмитриевич", "Сергеевич", "Андреевич", "Алексеевич", "Владимирович", "Иванович",
+    "Михайлович", "Николаевич", "Павлович", "Викторович", "Олегович", "Романович", "Игоревич", "Юрьевич",
+]
+GENERATED_STREETS = [
+    "Ул. Минина", "Ул. Рождественская", "Ул. Большая Покровская", "Ул. Белинского", "Ул. Ванеева",
+    "Ул. Родионова", "Ул. Горького", "Ул. Максима Горького", "Ул. Осипенко", "Ул. Бурнаковская",
+    "Ул. Красная Поляна", "Ул. Нижневолжская набережная", "Ул. Ильинская", "Ул. Варварская",
+    "Ул. Пискунова", "Ул. Звездинка", "Ул. Костина", "Ул. Генкиной", "Ул. Ошарская", "Ул. Деловая",
+    "Ул. Коминтерна", "Ул. Сормовское шоссе", "Ул. Гагарина", "Ул. Ларина", "Ул. Бекетова",
+    "Пр. Ленина", "Пр. Гагарина", "Московское шоссе", "Ул. Чаадаева", "Ул. Июльских Дней",
+]
+GENERATED_MESSAGES = [
+    "Ваш заказ #{order_id} создан! Ожидайте водителя.",
+    "Ваш заказ #{order_id} принят водителем!",
+    "Ваш водитель уже в пути!",
+    "Ваш водитель подъезжает!",
+    "Ожидайте водителя в течение 5 минут",
+]
+
+
+def defer_schema(conn):
+    conn.execute(DEFERRED_SCHEMA_TABLE)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        deferred = conn.execute("""
+            SELECT type, name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ('Orders', 'Notification', 'About_orders')
+               OR type = 'trigger' AND (name GLOB 'trg_*_stats*' OR name GLOB 'trg_*_addresses_*')
+        """).fetchall()
+        conn.executemany("INSERT OR REPLACE INTO DeferredSchema (Type, Name, Sql) VALUES (?, ?, ?)", deferred)
+        for kind, name, _ in deferred:
+            conn.execute(f"DROP {kind.upper()} {name}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(deferred)
+
+
+def restore_deferred_schema(conn):
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'DeferredSchema'").fetchone():
+        return 0
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        deferred = conn.execute("""
+            SELECT d.Type, d.Sql FROM DeferredSchema d
+            WHERE NOT EXISTS (SELECT 1 FROM sqlite_master m WHERE m.name = d.Name)
+            ORDER BY d.Type
+        """).fetchall()
+        for _, sql in deferred:
+            conn.execute(sql)
+        conn.execute("DELETE FROM DeferredSchema")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    if any(kind == "trigger" for kind, _ in deferred):
+        refresh_analytics(conn)
+        refresh_addresses(conn)
+    return len(deferred)
+
+
+@contextlib.contextmanager
+def bulk_load_mode(conn, defer_indexes=True):
+    conn.commit()
+    synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+    cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(f"PRAGMA cache_size = {BULK_CACHE_SIZE}")
+
+    if defer_indexes:
+        defer_schema(conn)
+
+    try:
+        yield
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        try:
+            restore_deferred_schema(conn)
+        except sqlite3.Error as e:
+            print(f"✗ Индексы и триггеры не восстановлены, они будут пересозданы при следующем запуске: {e}")
+        raise
+    else:
+        restore_deferred_schema(conn)
+        refresh_routes(conn)
+    finally:
+        conn.execute(f"PRAGMA synchronous = {synchronous}")
+        conn.execute(f"PRAGMA cache_size = {cache_size}")
+    conn.execute("PRAGMA optimize")
+
+
+def zipf_weights(count, exponent=1.1):
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def generate_people(rng, count, female_share=0.5):
+    for _ in range(count):
+        surname = rng.choice(GENERATED_SURNAMES)
+        if rng.random() < female_share:
+            name = rng.choice(GENERATED_FEMALE_NAMES)
+            patronymic = rng.choice(GENERATED_PATRONYMICS)[:-2] + "на"
+            surname = surname + "а" if surname.endswith(("ов", "ев", "ин")) else surname
+        else:
+            name = rng.choice(GENERATED_MALE_NAMES)
+            patronymic = rng.choice(GENERATED_PATRONYMICS)
+        yield f"{surname} {name} {patronymic}", round(min(5.0, max(1.0, rng.gauss(4.5, 0.4))), 1)
+
+
+def generate_time_order(rng):
+    hour = int(rng.choice((rng.gauss(8.5, 1.2), rng.gauss(18.5, 1.5), rng.uniform(0, 24)))) % 24
+    return f"{hour}:{rng.randrange(60):02d}"
+
+
+def generate_dataset(conn, orders, drivers=None, passengers=None, notifications=None, seed=0,
+                     batch_size=BULK_BATCH_SIZE, open_share=0.05, defer_indexes=None):
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+    drivers = drivers if drivers is not None else max(10, orders // 100)
+    passengers = passengers if passengers is not None else max(10, orders // 10)
+    notifications = notifications if notifications is not None else orders
+    if defer_indexes is None:
+        defer_indexes = orders >= BULK_DEFER_INDEX_ROWS
+
+    first_driver = next_id(cursor, "Drivers", "Driver_id")
+    first_passenger = next_id(cursor, "Passengers", "Passenger_id")
+    first_about = next_id(cursor, "About_orders", "About_orders_id")
+    first_order = next_id(cursor, "Orders", "Orders_id")
+
+    addresses = [(f"{rng.choice(GENERATED_STREETS)}, д. {rng.randint(1, 150)}",
+                  round(CITY_CENTER[0] + rng.gauss(0, 0.05), 6), round(CITY_CENTER[1] + rng.gauss(0, 0.08), 6))
+                 for _ in range(max(100, min(50000, orders // 20)))]
+    address_weights = zipf_weights(len(addresses))
+    passenger_weights = zipf_weights(passengers, 0.8)
+    driver_ids = range(first_driver, first_driver + drivers)
+    history_start = time.time() - GENERATED_HISTORY_DAYS * 86400
+    step = GENERATED_HISTORY_DAYS * 86400 / max(orders, 1)
+    notifications_per_order = notifications / orders if orders else 0
+    unread_from = int(orders * 0.99)
+    password_hash, salt = new_credentials(GENERATED_PASSWORD)
+
+    started = time.perf_counter()
+    with bulk_load_mode(conn, defer_indexes):
+        people = list(generate_people(rng, drivers))
+        cursor.executemany("INSERT INTO Drivers (Driver_id, Username, Rating, Current_lat, Current_lon) "
+                           "VALUES (?, ?, ?, ?, ?)",
+                           [(first_driver + i, name, rating,
+                             round(CITY_CENTER[0] + rng.gauss(0, 0.05), 6),
+                             round(CITY_CENTER[1] + rng.gauss(0, 0.08), 6))
+                            for i, (name, rating) in enumerate(people)])
+        cursor.executemany("INSERT INTO DriverCredentials (Driver_id, PasswordHash, Salt) VALUES (?, ?, ?)",
+                           [(driver_id, password_hash, salt) for driver_id in driver_ids])
+        people = list(generate_people(rng, passengers))
+        cursor.executemany("INSERT INTO Passengers (Passenger_id, Username, Rating) VALUES (?, ?, ?)",
+                           [(first_passenger + i, name, rating) for i, (name, rating) in enumerate(people)])
+        cursor.executemany("INSERT INTO PassengerCredentials (Passenger_id, PasswordHash, Salt) VALUES (?, ?, ?)",
+                           [(passenger_id, password_hash, salt)
+                            for passenger_id in range(first_passenger, first_passenger + passengers)])
+        conn.commit()
+
+        for start in range(0, orders, batch_size):
+            count = min(batch_size, orders - start)
+            pickups = rng.choices(addresses, cum_weights=address_weights, k=count)
+            targets = rng.choices(addresses, cum_weights=address_weights, k=count)
+            riders = rng.choices(range(first_passenger, first_passenger + passengers),
+                                 cum_weights=passenger_weights, k=count)
+            details = []
+            assignments = []
+            messages = []
+            for i in range(count):
+                about_id = first_about + start + i
+                created = time.strftime("%Y-%m-%d %H:%M:%S",
+                                        time.gmtime(history_start + (start + i) * step))
+                distance = round(min(80.0, rng.lognormvariate(1.6, 0.6)), 1)
+                price = round((GENERATED_BASE_FARE + distance * GENERATED_PER_KM) * rng.uniform(0.9, 1.4))
+                pickup, target = pickups[i], targets[i]
+                details.append((about_id, pickup[0], generate_time_order(rng), price, target[0], distance,
+                                created, pickup[1], pickup[2]))
+                driver_id = None if rng.random() < open_share else rng.choice(driver_ids)
+                order_id = first_order + start + i
+                assignments.append((order_id, driver_id, riders[i], about_id, created))
+                sent = int(notifications_per_order) + (rng.random() < notifications_per_order % 1)
+                for _ in range(sent):
+                    messages.append((riders[i], rng.choice(GENERATED_MESSAGES).format(order_id=order_id),
+                                     int(start + i < unread_from), created))
+            cursor.executemany("INSERT INTO About_orders (About_orders_id, Delivery_address, Time_order, Price, "
+                               "Final_address, Distance_km, CreatedAt, Pickup_lat, Pickup_lon) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", details)
+            cursor.executemany("INSERT INTO Orders (Orders_id, Driver_id, Passenger_id, About_orders_id, CreatedAt) "
+                               "VALUES (?, ?, ?, ?, ?)", assignments)
+            cursor.executemany("INSERT INTO Notification (Passenger_id, message, IsRead, CreatedAt) "
+                               "VALUES (?, ?, ?, ?)", messages)
+            conn.commit()
+
+    return time.perf_counter() - started
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("ожидался JSON-массив заказов")
+    buffer = buffer[1:]
+
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(","):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            if not buffer:
+                raise json.JSONDecodeError("неполные данные", buffer, 0)
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_export_file(path):
+    if path.endswith(".csv"):
+        with open(path, newline='', encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                yield (int(row[0]), int(row[1]), row[2], float(row[3]) if row[3] else None,
+                       int(row[4]), row[5], float(row[6]) if row[6] else None,
+                       row[7], row[8], row[9], float(row[10]), float(row[11]))
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            for item in iter_json_array(f):
+                driver, passenger, details = item["driver"], item["passenger"], item["order_details"]
+                yield (item["order_id"], driver["driver_id"], driver["name"], driver["rating"],
+                       passenger["passenger_id"], passenger["name"], passenger["rating"],
+                       details["delivery_address"], details["final_address"], details["time_order"],
+                       details["price"], details["distance_km"])
+    else:
+        raise ValueError(f"неподдерживаемый формат файла: {path}")
+
+
+def load_export(conn, path, batch_size=BULK_BATCH_SIZE, defer_indexes=True):
+    cursor = conn.cursor()
+    rows = iter_export_file(path)
+    loaded = 0
+    password_hash, salt = new_credentials(GENERATED_PASSWORD)
+
+    started = time.perf_counter()
+    with bulk_load_mode(conn, defer_indexes):
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+
+            low, high = min(row[0] for row in batch), max(row[0] for row in batch)
+            existing = {row[0] for row in cursor.execute(
+                "SELECT Orders_id FROM AllOrders WHERE Orders_id BETWEEN ? AND ?", (low, high))}
+            batch = [row for row in batch if row[0] not in existing]
+            if not batch:
+                continue
+
+            drivers = {row[1]: (row[1], row[2], row[3]) for row in batch}
+            passengers = {row[4]: (row[4], row[5], row[6]) for row in batch}
+            cursor.executemany("INSERT OR IGNORE INTO Drivers (Driver_id, Username, Rating) VALUES (?, ?, ?)",
+                               drivers.values())
+            cursor.executemany("INSERT OR IGNORE INTO DriverCredentials (Driver_id, PasswordHash, Salt) "
+                               "VALUES (?, ?, ?)",
+                               [(driver_id, password_hash, salt) for driver_id in drivers])
+            cursor.executemany("INSERT OR IGNORE INTO Passengers (Passenger_id, Username, Rating) VALUES (?, ?, ?)",
+                               passengers.values())
+            cursor.executemany("INSERT OR IGNORE INTO PassengerCredentials (Passenger_id, PasswordHash, Salt) "
+                               "VALUES (?, ?, ?)",
+                               [(passenger_id, password_hash, salt) for passenger_id in passengers])
+
+            first_about = next_id(cursor, "About_orders", "About_orders_id")
+            cursor.executemany("INSERT INTO About_orders (About_orders_id, Delivery_address, Final_address, "
+                               "Time_order, Price, Distance_km) VALUES (?, ?, ?, ?, ?, ?)",
+                               [(first_about + i, *row[7:]) for i, row in enumerate(batch)])
+            cursor.executemany("INSERT INTO Orders (Orders_id, Driver_id, Passenger_id, About_orders_id) "
+                               "VALUES (?, ?, ?, ?)",
+                               [(row[0], row[1], row[4], first_about + i) for i, row in enumerate(batch)])
+            conn.commit()
+            loaded += len(batch)
+
+    return loaded, time.perf_counter() - started
+
+
+def run_export_benchmark(db_path, out_dir, formats, batch_size, parallel, results):
+    conn = connect(db_path)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        total = export_data(conn, formats, out_dir, batch_size, parallel)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    results.put((total, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def benchmark_export(sizes, work_dir, formats=None, batch_size=EXPORT_BATCH_SIZE, parallel=None):
+    os.makedirs(work_dir, exist_ok=True)
+
+    print("\n" + "=" * 70)
+    print("БЕНЧМАРК ЭКСПОРТА")
+    print("=" * 70)
+    print(f"{'Заказов':>10} {'Время, с':>10} {'Заказов/с':>12} {'Пик RSS, МБ':>14}")
+
+    for size in sizes:
+        db_path = os.path.join(work_dir, f"bench_{size}.db")
+        if not os.path.exists(db_path):
+            conn = connect(db_path)
+            migrate(conn)
+            generate_dataset(conn, size)
+            conn.close()
+
+        results = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=run_export_benchmark,
+                                         args=(db_path, os.path.join(work_dir, f"out_{size}"),
+                                               formats, batch_size, parallel, results))
+        worker.start()
+        total, elapsed, max_rss = results.get()
+        worker.join()
+        print(f"{total:>10} {elapsed:>10.2f} {total / elapsed:>12.0f} {max_rss / 1024:>14.1f}")
+
+
+BENCH_SIZES = "10000,1000000,10000000"
+BENCH_ITERATIONS = 200
+BENCH_EXPORT_ITERATIONS = 1
+BENCH_REGRESSION_THRESHOLD = 0.10
+BENCH_RATING_SCANS = 2000
+
+BENCH_OPERATIONS = [
+    "login_user (водитель)",
+    "login_user (пассажир)",
+    "show_user_orders (водитель)",
+    "show_user_orders (пассажир)",
+    "show_available_orders",
+    "export_data",
+    "analytics_report",
+    "create_order",
+    "accept_order",
+    "show_notifications",
+    "delete_order",
+]
+
+
+@contextlib.contextmanager
+def headless(answers):
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt="": next(answers)
+    try:
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            yield
+    finally:
+        builtins.input = original
+
+
+def sample_users(conn, user_type, count, rng):
+    table, column = ("Drivers", "Driver_id") if user_type == "driver" else ("Passengers", "Passenger_id")
+    max_id = conn.execute(f"SELECT MAX({column}) FROM {table}").fetchone()[0] or 0
+    users = []
+    for _ in range(count * 10):
+        if len(users) == count or not max_id:
+            break
+        row = conn.execute(f"SELECT {column}, Username, Rating FROM {table} WHERE {column} = ?",
+                           (rng.randint(1, max_id),)).fetchone()
+        if row:
+            users.append({'id': row[0], 'username': row[1], 'rating': row[2], 'type': user_type})
+    return users
+
+
+def benchmark_cases(conn, service, operation, iterations, rng, options):
+    if operation.startswith("login_user"):
+        user_type = "driver" if "водитель" in operation else "passenger"
+        return [(login_user, (service, user_type), [user['username'], GENERATED_PASSWORD])
+                for user in sample_users(conn, user_type, iterations, rng)]
+
+    if operation.startswith("show_user_orders"):
+        user_type = "driver" if "водитель" in operation else "passenger"
+        return [(show_user_orders, (service, user), ["н"])
+                for user in sample_users(conn, user_type, iterations, rng)]
+
+    if operation == "show_available_orders":
+        return [(show_available_orders, (service,), ["н"])] * iterations
+
+    if operation == "export_data":
+        return [(export_data, (conn, options["formats"], os.path.join(options["work_dir"], "out"),
+                               options["batch_size"], options["parallel"]), [])] * options["export_iterations"]
+
+    if operation == "analytics_report":
+        return [(analytics_report, (conn, ANALYTICS_BY[i % len(ANALYTICS_BY)]), []) for i in range(iterations)]
+
+    if operation == "create_order":
+        cases = []
+        for passenger in sample_users(conn, "passenger", iterations, rng):
+            distance = round(rng.lognormvariate(1.6, 0.6), 1)
+            cases.append((create_order, (service, passenger), [
+                f"{rng.choice(GENERATED_STREETS)}, д. {rng.randint(1, 150)}",
+                f"{rng.choice(GENERATED_STREETS)}, д. {rng.randint(1, 150)}",
+                generate_time_order(rng),
+                str(round(GENERATED_BASE_FARE + distance * GENERATED_PER_KM)),
+                str(distance),
+                f"{CITY_CENTER[0] + rng.gauss(0, 0.05):.6f}, {CITY_CENTER[1] + rng.gauss(0, 0.08):.6f}",
+            ]))
+        return cases
+
+    if operation == "accept_order":
+        open_ids = [row[0] for row in conn.execute("SELECT Orders_id FROM Orders WHERE Driver_id IS NULL")]
+        order_ids = rng.sample(open_ids, min(iterations, len(open_ids)))
+        drivers = sample_users(conn, "driver", len(order_ids), rng)
+        return [(accept_order, (service, driver), [str(order_id)])
+                for driver, order_id in zip(drivers, order_ids)]
+
+    if operation == "show_notifications":
+        return [(show_notifications, (service, passenger), ["н"])
+                for passenger in sample_users(conn, "passenger", iterations, rng)]
+
+    if operation == "delete_order":
+        max_id = conn.execute("SELECT MAX(Orders_id) FROM Orders").fetchone()[0] or 0
+        cases = []
+        seen = set()
+        for _ in range(iterations * 10):
+            if len(cases) == iterations or not max_id:
+                break
+            order_id = rng.randint(1, max_id)
+            row = conn.execute("""
+                SELECT o.Passenger_id, p.Username, p.Rating
+                FROM Orders o
+                JOIN Passengers p ON o.Passenger_id = p.Passenger_id
+                WHERE o.Orders_id = ?
+            """, (order_id,)).fetchone()
+            if row and order_id not in seen:
+                seen.add(order_id)
+                passenger = {'id': row[0], 'username': row[1], 'rating': row[2], 'type': 'passenger'}
+                cases.append((delete_order, (service, passenger),
+                              [str(order_id), "УДАЛИТЬ", "ДА, УДАЛИТЬ"]))
+        return cases
+
+    raise ValueError(operation)
+
+
+def run_operation_benchmark(db_path, operation, iterations, seed, options, results):
+    rng = random.Random(f"{seed}:{operation}")
+    conn = connect(db_path)
+    pool = ConnectionPool(db_path, size=1)
+    service = DuberService(pool)
+    if operation in ("show_available_orders", "create_order", "accept_order", "delete_order"):
+        service.load()
+    cases = benchmark_cases(conn, service, operation, iterations, rng, options)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies = []
+    for fn, args, answers in cases:
+        with headless(answers):
+            started = time.perf_counter()
+            fn(*args)
+            latencies.append(time.perf_counter() - started)
+
+    service.close()
+    conn.close()
+    results.put({
+        "iterations": len(latencies),
+        "ops_per_sec": len(latencies) / sum(latencies) if latencies and sum(latencies) else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "base_rss_mb": base_rss / 1024,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def run_generate_dataset(db_path, orders, seed):
+    conn = connect(db_path)
+    migrate(conn)
+    generate_dataset(conn, orders, seed=seed)
+    conn.close()
+
+
+def run_in_child(target, *args):
+    results = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=target, args=args + (results,))
+    worker.start()
+    result = results.get()
+    worker.join()
+    return result
+
+
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def benchmark_all(sizes, work_dir, operations=None, iterations=BENCH_ITERATIONS, seed=0, options=None):
+    operations = operations or BENCH_OPERATIONS
+    os.makedirs(work_dir, exist_ok=True)
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "iterations": iterations,
+        "sizes": {},
+    }
+
+    print("\n" + "=" * 100)
+    print("БЕНЧМАРК ОПЕРАЦИЙ МЕНЮ")
+    print("=" * 100)
+
+    for size in sizes:
+        pristine = os.path.join(work_dir, f"bench_{size}_seed{seed}.db")
+        if not os.path.exists(pristine):
+            print(f"\nГенерация базы на {size} заказов...")
+            worker = multiprocessing.Process(target=run_generate_dataset, args=(pristine, size, seed))
+            worker.start()
+            worker.join()
+
+        db_path = os.path.join(work_dir, f"run_{size}.db")
+        remove_database(db_path)
+        shutil.copyfile(pristine, db_path)
+
+        print(f"\nЗаказов в базе: {size}")
+        print(f"{'Операция':<30} {'Итераций':>9} {'Опер./с':>10} {'p50, мс':>9} {'p95, мс':>9} "
+              f"{'p99, мс':>9} {'Пик RSS, МБ':>12}")
+        measured = {}
+        for operation in operations:
+            result = run_in_child(run_operation_benchmark, db_path, operation, iterations, seed, options)
+            measured[operation] = result
+            print(f"{operation:<30} {result['iterations']:>9} {result['ops_per_sec']:>10.1f} "
+                  f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+                  f"{result['peak_rss_mb']:>12.1f}")
+        report["sizes"][str(size)] = measured
+        remove_database(db_path)
+
+    return report
+
+
+def compare_benchmarks(baseline, current, threshold=BENCH_REGRESSION_THRESHOLD):
+    regressions = []
+
+    print("\n" + "=" * 100)
+    print(f"СРАВНЕНИЕ С {baseline.get('started_at', '?')} (порог {threshold:.0%})")
+    print("=" * 100)
+    print(f"{'Заказов':>10} {'Операция':<30} {'Опер./с было':>13} {'стало':>10} {'p95 было':>10} {'стало':>10}")
+
+    for size, measured in current["sizes"].items():
+        for operation, result in measured.items():
+            before = baseline.get("sizes", {}).get(size, {}).get(operation)
+            if not before:
+                continue
+            slower = (before["ops_per_sec"] and result["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold)
+                      or result["p95_ms"] > before["p95_ms"] * (1 + threshold))
+            if slower:
+                regressions.append((size, operation))
+            print(f"{size:>10} {operation:<30} {before['ops_per_sec']:>13.1f} {result['ops_per_sec']:>10.1f} "
+                  f"{before['p95_ms']:>10.2f} {result['p95_ms']:>10.2f} {'✗' if slower else '✓'}")
+
+    if regressions:
+        print(f"\n✗ Регрессий: {len(regressions)}")
+    else:
+        print("\n✓ Регрессий не найдено")
+    return not regressions
 
 
 if __name__ == "__main__":
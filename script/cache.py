@@ -0,0 +1,104 @@
+import time
+import threading
+import collections
+
+
+class LRUCache:
+    def __init__(self, max_size, ttl=None, on_evict=None, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.items = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            return item is not None and (item[1] is None or item[1] > self.clock())
+
+    def get(self, key, default=None):
+        evicted = None
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and item[1] is not None and item[1] <= self.clock():
+                evicted = (key, self.items.pop(key)[0])
+                item = None
+            if item is None:
+                self.misses += 1
+            else:
+                self.items.move_to_end(key)
+                self.hits += 1
+
+        if evicted and self.on_evict:
+            self.on_evict(*evicted)
+        return default if item is None else item[0]
+
+    def get_many(self, keys):
+        found = {}
+        evicted = []
+        with self.lock:
+            now = self.clock()
+            for key in keys:
+                item = self.items.get(key)
+                if item is not None and item[1] is not None and item[1] <= now:
+                    evicted.append((key, self.items.pop(key)[0]))
+                    item = None
+                if item is None:
+                    self.misses += 1
+                else:
+                    self.items.move_to_end(key)
+                    self.hits += 1
+                    found[key] = item[0]
+
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
+        return found
+
+    def put(self, key, value, ttl=None):
+        self.put_many(((key, value),), ttl)
+
+    def put_many(self, items, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = self.clock() + ttl if ttl else None
+        evicted = []
+        with self.lock:
+            for key, value in items:
+                self.items[key] = (value, expires)
+                self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                old_key, (old_value, _) = self.items.popitem(last=False)
+                evicted.append((old_key, old_value))
+            self.evictions += len(evicted)
+
+        if self.on_evict:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            item = self.items.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.items),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
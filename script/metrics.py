@@ -0,0 +1,376 @@
+import re
+import time
+import bisect
+import random
+import sqlite3
+import threading
+import functools
+
+
+LATENCY_BUCKETS = tuple(0.000025 * 2 ** (i / 2) for i in range(41))
+MAX_QUERIES = 500
+OTHER_QUERIES = "(другие запросы)"
+OTHER_OPERATIONS = "(другие операции)"
+PROGRESS_STEPS = 1000
+ITER_BATCH = 256
+LOCK_STATEMENTS = ("BEGIN IMMEDIATE", "BEGIN EXCLUSIVE")
+PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, share):
+        rank = share * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Series:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.rows = 0
+        self.steps = 0
+        self.sampled = 0
+        self.statements = 0
+
+    def snapshot(self):
+        return dict(self.latency.snapshot(), errors=self.errors, rows=self.rows, vm_steps=self.steps,
+                    sampled=self.sampled, statements=self.statements)
+
+
+class Operation:
+    __slots__ = ("metrics", "name", "outer", "statements", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        local = self.metrics.local
+        self.outer = getattr(local, "sampled", None)
+        if self.outer is None:
+            local.sampled = self.metrics.sample()
+            local.statements = 0
+        self.statements = local.statements
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        elapsed = time.perf_counter() - self.started
+        local = self.metrics.local
+        self.metrics.observe_operation(self.name, elapsed, kind is not None,
+                                       local.statements - self.statements if local.sampled else None)
+        if self.outer is None:
+            local.sampled = None
+        return False
+
+
+def query_key(sql):
+    return PLACEHOLDER_LIST.sub("?, ...", " ".join(sql.split()))
+
+
+def prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_histogram(lines, name, label, series):
+    for value, histogram in series:
+        label_text = f'{label}="{prometheus_label(value)}"'
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label_text},le="{bound:.6g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{label_text}}} {histogram.total:.9g}")
+        lines.append(f"{name}_count{{{label_text}}} {histogram.count}")
+
+
+class Metrics:
+    def __init__(self, sample_rate=1.0, max_queries=MAX_QUERIES, rng=random.random):
+        self.sample_rate = sample_rate
+        self.max_queries = max_queries
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.keys = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.operations = {}
+            self.queries = {}
+            self.lock_waits = {"sqlite": Histogram(), "pool": Histogram()}
+
+    def sample(self):
+        return self.sample_rate > 0 and self.rng() < self.sample_rate
+
+    def tracing(self):
+        sampled = getattr(self.local, "sampled", None)
+        return self.sample() if sampled is None else sampled
+
+    def operation(self, name):
+        return Operation(self, name)
+
+    def timed(self, name):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with Operation(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def statement_started(self, sql):
+        if getattr(self.local, "sampled", None):
+            self.local.statements += 1
+
+    def observe_operation(self, name, seconds, failed=False, statements=None):
+        with self.lock:
+            series = self.operations.get(name)
+            if series is None:
+                if len(self.operations) >= self.max_queries:
+                    name = OTHER_OPERATIONS
+                series = self.operations.get(name)
+                if series is None:
+                    series = self.operations[name] = Series()
+            series.latency.observe(seconds)
+            series.errors += failed
+            if statements is not None:
+                series.sampled += 1
+                series.statements += statements
+
+    def observe_query(self, sql, seconds, rows=0, steps=0, failed=False):
+        key = self.keys.get(sql)
+        if key is None:
+            key = query_key(sql)
+            if len(self.keys) < self.max_queries * 4:
+                self.keys[sql] = key
+
+        with self.lock:
+            series = self.queries.get(key)
+            if series is None:
+                if len(self.queries) >= self.max_queries:
+                    key = OTHER_QUERIES
+                series = self.queries.get(key)
+                if series is None:
+                    series = self.queries[key] = Series()
+            series.latency.observe(seconds)
+            series.rows += rows
+            series.steps += steps
+            series.errors += failed
+            if key.startswith(LOCK_STATEMENTS):
+                self.lock_waits["sqlite"].observe(seconds)
+
+    def observe_lock_wait(self, kind, seconds):
+        with self.lock:
+            self.lock_waits[kind].observe(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "uptime_s": time.time() - self.started,
+                "sample_rate": self.sample_rate,
+                "operations": {name: series.snapshot() for name, series in sorted(self.operations.items())},
+                "queries": sorted(({"query": key, **series.snapshot()} for key, series in self.queries.items()),
+                                  key=lambda query: query["sum"], reverse=True),
+                "lock_waits": {kind: histogram.snapshot() for kind, histogram in self.lock_waits.items()},
+            }
+
+    def prometheus(self, prefix="duber"):
+        lines = [f"# TYPE {prefix}_metrics_sample_rate gauge", f"{prefix}_metrics_sample_rate {self.sample_rate}"]
+        with self.lock:
+            operations = sorted(self.operations.items())
+            queries = sorted(self.queries.items())
+
+            lines.append(f"# TYPE {prefix}_operation_seconds histogram")
+            prometheus_histogram(lines, f"{prefix}_operation_seconds", "operation",
+                                 [(name, series.latency) for name, series in operations])
+            lines.append(f"# TYPE {prefix}_operation_errors_total counter")
+            lines.extend(f'{prefix}_operation_errors_total{{operation="{prometheus_label(name)}"}} {series.errors}'
+                         for name, series in operations)
+            lines.append(f"# TYPE {prefix}_operation_statements_total counter")
+            lines.extend(f'{prefix}_operation_statements_total{{operation="{prometheus_label(name)}"}} '
+                         f'{series.statements}' for name, series in operations)
+
+            lines.append(f"# TYPE {prefix}_query_seconds histogram")
+            prometheus_histogram(lines, f"{prefix}_query_seconds", "query",
+                                 [(key, series.latency) for key, series in queries])
+            for metric, field in (("rows", "rows"), ("vm_steps", "steps"), ("errors", "errors")):
+                lines.append(f"# TYPE {prefix}_query_{metric}_total counter")
+                lines.extend(f'{prefix}_query_{metric}_total{{query="{prometheus_label(key)}"}} '
+                             f'{getattr(series, field)}' for key, series in queries)
+
+            lines.append(f"# TYPE {prefix}_lock_wait_seconds histogram")
+            prometheus_histogram(lines, f"{prefix}_lock_wait_seconds", "kind", sorted(self.lock_waits.items()))
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    sql = None
+
+    def __del__(self):
+        self.finish()
+
+    def finish(self, failed=False):
+        if self.sql is not None:
+            sql, self.sql = self.sql, None
+            connection = self.connection
+            connection.unhook()
+            connection.metrics.observe_query(sql, self.elapsed, self.rows, connection.steps - self.steps, failed)
+
+    def timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    def start(self, method, sql, *args):
+        connection = self.connection
+        connection.hook()
+        self.sql, self.elapsed, self.rows, self.steps = sql, 0.0, 0, connection.steps
+        try:
+            self.timed(method, self, sql, *args)
+        except BaseException:
+            self.finish(True)
+            raise
+        if self.description is None:
+            self.rows = max(self.rowcount, 0)
+            self.finish()
+        return self
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        if not self.connection.metrics.tracing():
+            return super().execute(sql, parameters)
+        return self.start(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        if not self.connection.metrics.tracing():
+            return super().executemany(sql, seq_of_parameters)
+        return self.start(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        if self.sql is None:
+            return super().fetchone()
+        row = self.timed(super().fetchone)
+        if row is None:
+            self.finish()
+        else:
+            self.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self.sql is None:
+            return super().fetchmany(size)
+        rows = self.timed(super().fetchmany, size)
+        self.rows += len(rows)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        if self.sql is None:
+            return super().fetchall()
+        rows = self.timed(super().fetchall)
+        self.rows += len(rows)
+        self.finish()
+        return rows
+
+    def __iter__(self):
+        return self if self.sql is None else self.traced_rows()
+
+    def traced_rows(self):
+        while True:
+            rows = self.fetchmany(ITER_BATCH)
+            yield from rows
+            if len(rows) < ITER_BATCH:
+                return
+
+    def close(self):
+        self.finish()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    metrics = None
+    steps = 0
+    hooked = 0
+    progress_steps = PROGRESS_STEPS
+
+    def instrument(self, metrics, progress_steps=PROGRESS_STEPS):
+        self.metrics = metrics
+        self.progress_steps = progress_steps
+
+    def hook(self):
+        if not self.hooked:
+            self.set_trace_callback(self.metrics.statement_started)
+            self.set_progress_handler(self.progress, self.progress_steps)
+        self.hooked += 1
+
+    def unhook(self):
+        self.hooked -= 1
+        if not self.hooked:
+            self.set_trace_callback(None)
+            self.set_progress_handler(None, 0)
+
+    def progress(self):
+        self.steps += self.progress_steps
+        return 0
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not self.metrics.tracing():
+            return super().execute(sql, parameters)
+        return self.cursor().start(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not self.metrics.tracing():
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().start(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def commit(self):
+        if not self.in_transaction or not self.metrics.tracing():
+            return super().commit()
+        self.hook()
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.metrics.observe_query("COMMIT", time.perf_counter() - started)
+            self.unhook()
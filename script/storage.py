@@ -0,0 +1,244 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+import contextlib
+import concurrent.futures
+
+from metrics import InstrumentedConnection
+
+
+PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -65536),
+    ("mmap_size", 268435456),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),
+]
+
+CACHED_STATEMENTS = 256
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_DELAY = 0.002
+
+
+def connect(path, cached_statements=CACHED_STATEMENTS, metrics=None):
+    if metrics is None:
+        conn = sqlite3.connect(path, check_same_thread=False, cached_statements=cached_statements)
+    else:
+        conn = sqlite3.connect(path, check_same_thread=False, cached_statements=cached_statements,
+                               factory=InstrumentedConnection)
+        conn.instrument(metrics)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, path, size=8, timeout=30, metrics=None):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.metrics = metrics
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.pid = os.getpid()
+
+    def reset_after_fork(self):
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.pid = os.getpid()
+
+    def acquire(self):
+        if self.pid != os.getpid():
+            self.reset_after_fork()
+
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            can_create = self.created < self.size
+            if can_create:
+                self.created += 1
+
+        if can_create:
+            try:
+                return connect(self.path, metrics=self.metrics)
+            except sqlite3.Error:
+                with self.lock:
+                    self.created -= 1
+                raise
+
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"нет свободных соединений с базой {self.path}") from None
+
+    def release(self, conn):
+        if self.pid != os.getpid():
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self.idle.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        if self.metrics is None:
+            conn = self.acquire()
+        else:
+            started = time.perf_counter()
+            conn = self.acquire()
+            self.metrics.observe_lock_wait("pool", time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self.lock:
+                self.created -= 1
+
+
+class WriteBatcher:
+    def __init__(self, pool, batch_size=WRITE_BATCH_SIZE, delay=WRITE_BATCH_DELAY):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset_after_fork()
+        self.batches = 0
+        self.operations = 0
+        self.failed = 0
+        self.hook_errors = 0
+        self.largest = 0
+
+    def reset_after_fork(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.pid = os.getpid()
+
+    def submit(self, fn, *args):
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset_after_fork()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="write-batcher", daemon=True)
+                self.thread.start()
+            self.queue.put((future, fn, args))
+        return future
+
+    def call(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def after_commit(self, fn, *args):
+        hooks = getattr(self.local, "hooks", None)
+        if hooks is None:
+            raise RuntimeError("after_commit можно вызывать только внутри групповой записи")
+        hooks.append((fn, args))
+
+    def run(self):
+        last = 0
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + (self.delay if last > 1 else 0)
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+
+            last = len(batch)
+            self.write([item for item in batch if item[0].set_running_or_notify_cancel()])
+
+    def write(self, batch):
+        if not batch:
+            return
+
+        done = []
+        failed = 0
+        metrics = self.pool.metrics
+        operation = metrics.operation("write_batch") if metrics else contextlib.nullcontext()
+        try:
+            with operation, self.pool.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for future, fn, args in batch:
+                    conn.execute("SAVEPOINT write")
+                    self.local.hooks = hooks = []
+                    try:
+                        result = fn(conn, *args)
+                    except Exception as e:
+                        if not conn.in_transaction:
+                            raise
+                        conn.execute("ROLLBACK TO write")
+                        conn.execute("RELEASE write")
+                        future.set_exception(e)
+                        failed += 1
+                    else:
+                        conn.execute("RELEASE write")
+                        done.append((future, result, hooks))
+                    finally:
+                        self.local.hooks = None
+                conn.commit()
+        except Exception as e:
+            for future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            failed = len(batch)
+            done = []
+
+        hook_errors = 0
+        for future, result, hooks in done:
+            future.set_result(result)
+            for fn, args in hooks:
+                try:
+                    fn(*args)
+                except Exception as e:
+                    hook_errors += 1
+                    print(f"✗ Ошибка обработчика после фиксации записи: {e!r}")
+
+        with self.lock:
+            self.batches += 1
+            self.operations += len(batch)
+            self.failed += failed
+            self.hook_errors += hook_errors
+            self.largest = max(self.largest, len(batch))
+
+    def close(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+            if thread is not None:
+                self.queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "operations": self.operations,
+                "failed": self.failed,
+                "hook_errors": self.hook_errors,
+                "largest_batch": self.largest,
+                "average_batch": self.operations / self.batches if self.batches else 0.0,
+            }
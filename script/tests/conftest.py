@@ -0,0 +1,56 @@
+import os
+import sys
+import sqlite3
+import importlib.util
+
+import pytest
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SCRIPT_DIR)
+
+spec = importlib.util.spec_from_file_location("duber", os.path.join(SCRIPT_DIR, "1111.py"))
+duber_module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(duber_module)
+
+
+@pytest.fixture
+def duber():
+    return duber_module
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "duber.db"))
+    duber_module.migrate(conn)
+    duber_module.seed_test_data(conn)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def service(tmp_path):
+    pool = duber_module.ConnectionPool(str(tmp_path / "duber.db"))
+    with pool.connection() as conn:
+        duber_module.migrate(conn)
+        duber_module.seed_test_data(conn)
+    service = duber_module.DuberService(pool)
+    service.load()
+    yield service
+    service.close()
+
+
+def first_user(service, user_type):
+    table, column = ("Drivers", "Driver_id") if user_type == "driver" else ("Passengers", "Passenger_id")
+    with service.pool.connection() as conn:
+        user_id, username = conn.execute(f"SELECT {column}, Username FROM {table} ORDER BY {column} LIMIT 1").fetchone()
+    return {'type': user_type, 'id': user_id, 'username': username, 'rating': None}
+
+
+@pytest.fixture
+def passenger(service):
+    return first_user(service, "passenger")
+
+
+@pytest.fixture
+def driver(service):
+    return first_user(service, "driver")
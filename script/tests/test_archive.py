@@ -0,0 +1,62 @@
+SUMMARY_TABLES = {
+    "DriverStats": "Trips",
+    "PassengerStats": "Orders",
+    "HourlyStats": "Orders",
+    "Addresses": "Uses",
+    "PassengerAddresses": "Uses",
+}
+
+
+def summaries(conn):
+    snapshot = {}
+    for table, counter in SUMMARY_TABLES.items():
+        rows = conn.execute(f"SELECT * FROM {table} WHERE {counter} > 0")
+        snapshot[table] = sorted(tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+                                 for row in rows)
+    return snapshot
+
+
+def archived_order(duber, service, passenger, driver):
+    order = service.create_order(passenger, "Ул. Архивная, д. 1", "Ул. Архивная, д. 2", "10:00", 300, 5.0)
+    assert service.accept_order(driver, order['order_id']) == duber.ACCEPT_OK
+    with service.pool.connection() as conn:
+        conn.execute("UPDATE Orders SET CreatedAt = '2000-01-01 10:00:00' WHERE Orders_id = ?", (order['order_id'],))
+        conn.commit()
+        duber.archive_history(conn, pause=0)
+        assert conn.execute("SELECT 1 FROM ArchivedOrders WHERE Orders_id = ?", (order['order_id'],)).fetchone()
+    return order['order_id']
+
+
+def test_archived_order_can_be_rated_and_deleted(duber, service, passenger, driver):
+    order_id = archived_order(duber, service, passenger, driver)
+
+    listed, _ = service.deletable_orders(passenger)
+    assert order_id in [order['order_id'] for order in listed]
+    assert service.order_for_deletion(passenger, order_id)['archived']
+
+    assert service.rate_order(passenger, order_id, 5)['ratee_id'] == driver['id']
+
+    deleted = service.delete_order(passenger, order_id)
+    assert deleted['archived'] and deleted['about_deleted']
+    with service.pool.connection() as conn:
+        assert not conn.execute("SELECT 1 FROM AllOrders WHERE Orders_id = ?", (order_id,)).fetchone()
+        assert not conn.execute("SELECT 1 FROM AllAbout_orders WHERE About_orders_id = ?",
+                                (deleted['about_order_id'],)).fetchone()
+
+        incremental = summaries(conn)
+        duber.refresh_analytics(conn)
+        duber.refresh_addresses(conn)
+        assert summaries(conn) == incremental
+
+
+def test_archived_order_of_another_user_is_not_deletable(duber, service, passenger, driver):
+    order_id = archived_order(duber, service, passenger, driver)
+    stranger = dict(passenger, id=passenger['id'] + 1)
+
+    assert service.order_for_deletion(stranger, order_id) is None
+    try:
+        service.delete_order(stranger, order_id)
+    except LookupError:
+        pass
+    else:
+        raise AssertionError("чужой архивный заказ удалён")
@@ -0,0 +1,13 @@
+def test_generated_ids_skip_deleted_autoincrement_ids(duber, conn):
+    newest = conn.execute("SELECT MAX(Orders_id) FROM Orders").fetchone()[0]
+    about_id = conn.execute("SELECT MAX(About_orders_id) FROM About_orders").fetchone()[0]
+    conn.execute("DELETE FROM Orders WHERE Orders_id = ?1 OR About_orders_id = ?2", (newest, about_id))
+    conn.execute("DELETE FROM About_orders WHERE About_orders_id = ?", (about_id,))
+    conn.commit()
+
+    assert duber.next_id(conn, "Orders", "Orders_id") == newest + 1
+    assert duber.next_id(conn, "About_orders", "About_orders_id") == about_id + 1
+
+    duber.generate_dataset(conn, orders=20, drivers=2, passengers=2, notifications=0, seed=1)
+    assert not conn.execute("SELECT 1 FROM Orders WHERE Orders_id = ?", (newest,)).fetchone()
+    assert not conn.execute("SELECT 1 FROM About_orders WHERE About_orders_id = ?", (about_id,)).fetchone()
@@ -0,0 +1,42 @@
+import sqlite3
+
+import pytest
+
+
+def schema(conn):
+    return sorted(conn.execute("SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger')"))
+
+
+def test_failed_load_rolls_back_and_restores_schema(duber, conn):
+    before = schema(conn)
+    orders = conn.execute("SELECT COUNT(*) FROM Orders").fetchone()[0]
+
+    with pytest.raises(RuntimeError, match="обрыв загрузки"):
+        with duber.bulk_load_mode(conn):
+            assert schema(conn) != before
+            conn.execute("INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id) VALUES (NULL, 1, 1)")
+            raise RuntimeError("обрыв загрузки")
+
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM Orders").fetchone()[0] == orders
+    assert schema(conn) == before
+
+
+def test_interrupted_load_is_repaired_on_startup(duber, conn, tmp_path):
+    before = schema(conn)
+    stats = conn.execute("SELECT * FROM DriverStats ORDER BY Driver_id").fetchall()
+
+    crashed = sqlite3.connect(str(tmp_path / "duber.db"))
+    assert duber.defer_schema(crashed) > 0
+    crashed.execute("DELETE FROM DriverStats")
+    crashed.commit()
+    crashed.close()
+
+    restarted = sqlite3.connect(str(tmp_path / "duber.db"))
+    try:
+        assert duber.migrate(restarted) == []
+        assert schema(restarted) == before
+        assert restarted.execute("SELECT COUNT(*) FROM DeferredSchema").fetchone()[0] == 0
+        assert restarted.execute("SELECT * FROM DriverStats ORDER BY Driver_id").fetchall() == stats
+    finally:
+        restarted.close()
@@ -0,0 +1,20 @@
+def test_dispatch_notification_ids_are_never_reused(duber, service, passenger, driver):
+    order = service.create_order(passenger, "Ул. Диспетчерская, д. 1", "Ул. Диспетчерская, д. 2", "10:00",
+                                 300, 5.0, 56.3, 43.9)
+    service.update_location(driver, 56.301, 43.901)
+
+    with service.pool.connection() as conn:
+        newest = conn.execute("SELECT MAX(notification_id) FROM Notification").fetchone()[0]
+        conn.execute("DELETE FROM Notification WHERE notification_id = ?", (newest,))
+        conn.commit()
+
+        service.bus.subscribe(passenger['id'])
+        assignments, _, _, _ = duber.batch_dispatch(conn, bus=service.bus)
+        published = service.bus.take(passenger['id'])
+
+        assert (order['order_id'], driver['id']) in assignments
+        assert published and all(notification['id'] > newest for notification in published)
+        for notification in published:
+            stored = conn.execute("SELECT Passenger_id, message FROM Notification WHERE notification_id = ?",
+                                  (notification['id'],)).fetchone()
+            assert stored == (notification['passenger_id'], notification['message'])
@@ -0,0 +1,26 @@
+import json
+
+
+def test_full_export_records_high_water_mark(duber, conn, tmp_path):
+    out_dir = str(tmp_path / "out")
+    total = duber.export_data(conn, ["json", "csv"], out_dir, parallel=False)
+    assert total > 0
+    assert not conn.in_transaction
+
+    with open(tmp_path / "out" / duber.EXPORT_STATE_FILE, encoding="utf-8") as f:
+        state = json.load(f)
+    newest = conn.execute("SELECT MAX(Orders_id) FROM Orders").fetchone()[0]
+    assert state["json"]["last_order_id"] == state["csv"]["last_order_id"] == newest
+
+    assert duber.export_data(conn, ["json", "csv"], out_dir, parallel=False, incremental=True) == 0
+
+    about_id = conn.execute("""
+        INSERT INTO About_orders (Delivery_address, Time_order, Price, Final_address, Distance_km)
+        VALUES ('Ул. Выгрузки, д. 1', '10:00', 300, 'Ул. Выгрузки, д. 2', 5.0)
+    """).lastrowid
+    conn.execute("INSERT INTO Orders (Driver_id, Passenger_id, About_orders_id) VALUES (1, 1, ?)", (about_id,))
+    conn.commit()
+
+    assert duber.export_data(conn, ["json"], out_dir, parallel=False, incremental=True) == 1
+    assert duber.export_data(conn, ["json", "csv"], out_dir, parallel=False, incremental=True) == 1
+    assert duber.export_data(conn, ["json", "csv"], out_dir, parallel=False, incremental=True) == 0
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+CENTER = (55.75, 37.6)
+
+
+def brute_force(duber, points, lat, lon, k, radius_km):
+    found = [(duber.haversine_km(lat, lon, *point), item_id) for item_id, point in points.items()]
+    return sorted(item for item in found if item[0] <= radius_km)[:k]
+
+
+@pytest.fixture
+def points():
+    rng = random.Random(7)
+    return {item_id: (CENTER[0] + rng.uniform(-0.2, 0.2), CENTER[1] + rng.uniform(-0.3, 0.3))
+            for item_id in range(1, 2001)}
+
+
+@pytest.fixture
+def grid(duber, points):
+    grid = duber.GeoGrid()
+    for item_id, point in points.items():
+        grid.add(item_id, *point)
+    return grid
+
+
+@pytest.mark.parametrize("k, radius_km", [(1, 0.5), (5, 1.0), (20, 3.0), (50, 40.0), (3000, 100.0)])
+def test_nearest_matches_brute_force(duber, grid, points, k, radius_km):
+    assert grid.nearest(*CENTER, k, radius_km) == brute_force(duber, points, *CENTER, k, radius_km)
+
+
+def test_nearest_after_remove(duber, grid, points):
+    nearest_id = grid.nearest(*CENTER, 1, 5.0)[0][1]
+    assert grid.remove(nearest_id)
+    del points[nearest_id]
+    assert grid.nearest(*CENTER, 5, 5.0) == brute_force(duber, points, *CENTER, 5, 5.0)
+
+
+@pytest.mark.parametrize("k, radius_km", [(0, 1.0), (-3, 1.0), (5, 0.0), (5, -1.0)])
+def test_nearest_with_empty_request(grid, k, radius_km):
+    assert grid.nearest(*CENTER, k, radius_km) == []
+
+
+@pytest.mark.parametrize("query", ["k=0", "k=-1", "radius=0", "radius=-2", "radius=nan"])
+def test_nearest_orders_rejects_bad_limits(duber, service, driver, query):
+    with service.pool.connection() as conn:
+        before = conn.execute("SELECT Current_lat FROM Drivers WHERE Driver_id = ?", (driver['id'],)).fetchone()
+
+    token = service.open_session(driver)
+    status, _ = duber.handle_api_request(service, "GET", f"/orders/nearest?lat=55.75&lon=37.6&{query}",
+                                         {"authorization": f"Bearer {token}"}, b"")
+    assert status == 400
+
+    with service.pool.connection() as conn:
+        after = conn.execute("SELECT Current_lat FROM Drivers WHERE Driver_id = ?", (driver['id'],)).fetchone()
+    assert after == before
+
+    with pytest.raises(ValueError):
+        service.nearest_orders(55.75, 37.6, 0, 1.0)
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+
+def fetch_metrics(duber, service, peer, headers=b"", metrics_token=None):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"GET /metrics?format=json HTTP/1.1\r\nConnection: close\r\n" + headers + b"\r\n")
+        reader.feed_eof()
+        writer = RecordingWriter(peer)
+        await duber.handle_http_connection(service, None, reader, writer, metrics_token)
+        return writer.data.split(b" ", 2)[1]
+
+    return int(asyncio.run(run()))
+
+
+class RecordingWriter:
+    def __init__(self, peer):
+        self.peer = peer
+        self.data = b""
+
+    def get_extra_info(self, name):
+        return self.peer if name == "peername" else None
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize("peer, status", [(("127.0.0.1", 5000), 200), (("::1", 5000, 0, 0), 200),
+                                          (("10.0.0.7", 5000), 403)])
+def test_metrics_without_token_only_for_local_clients(duber, service, peer, status):
+    assert fetch_metrics(duber, service, peer) == status
+
+
+@pytest.mark.parametrize("headers, status", [(b"", 401), (b"Authorization: Bearer wrong\r\n", 403),
+                                             (b"Authorization: Bearer secret\r\n", 200)])
+def test_metrics_with_token(duber, service, headers, status):
+    assert fetch_metrics(duber, service, ("127.0.0.1", 5000), headers, "secret") == status
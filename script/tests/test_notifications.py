@@ -0,0 +1,19 @@
+def test_reading_keeps_unlisted_buffered_notifications(service, passenger):
+    service.bus.subscribe(passenger['id'])
+    first = service.create_order(passenger, "Ул. Почтовая, д. 1", "Ул. Почтовая, д. 2", "10:00", 300, 5.0)
+    second = service.create_order(passenger, "Ул. Почтовая, д. 3", "Ул. Почтовая, д. 4", "11:00", 300, 5.0)
+
+    listed, _ = service.notifications(passenger, limit=1)
+    assert str(second['order_id']) in listed[0]['message']
+
+    buffered = service.bus.take(passenger['id'])
+    assert len(buffered) == 1
+    assert str(first['order_id']) in buffered[0]['message']
+
+
+def test_peek_does_not_touch_bus(service, passenger):
+    service.bus.subscribe(passenger['id'])
+    service.create_order(passenger, "Ул. Почтовая, д. 5", "Ул. Почтовая, д. 6", "12:00", 300, 5.0)
+
+    service.notifications(passenger, mark_read=False)
+    assert len(service.bus.take(passenger['id'])) == 1
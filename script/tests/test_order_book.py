@@ -0,0 +1,51 @@
+import pytest
+
+
+def book_row(about_order_id, time_order):
+    return (about_order_id, "user", "Откуда", "Куда", time_order, 300, 5.0, about_order_id, None, None)
+
+
+@pytest.fixture
+def book(duber):
+    book = duber.OpenOrderBook()
+    for about_order_id in range(1, 6):
+        book.add(book_row(about_order_id, f"10:0{about_order_id}"))
+    return book
+
+
+@pytest.mark.parametrize("limit", [0, -5])
+def test_page_clamps_small_limit(book, limit):
+    rows, after = book.page(limit=limit)
+    assert [row[0] for row in rows] == [1]
+    assert after == ("10:01", 1, 1)
+
+
+def test_page_clamps_large_limit(duber, book):
+    for about_order_id in range(6, duber.ORDER_BOOK_PAGE_SIZE_MAX + 10):
+        book.add(book_row(about_order_id, f"11:{about_order_id:04d}"))
+    rows, after = book.page(limit=10 ** 9)
+    assert len(rows) == duber.ORDER_BOOK_PAGE_SIZE_MAX
+    assert after is not None
+
+
+def test_page_continues_after_cursor(book):
+    rows, after = book.page(limit=2)
+    rows, after = book.page(list(after), 10)
+    assert [row[0] for row in rows] == [3, 4, 5]
+    assert after is None
+
+
+@pytest.mark.parametrize("query", ["limit=abc", 'after=[1]', 'after="x"', 'after=["10:01","x",1]'])
+def test_available_rejects_bad_page(duber, service, driver, query):
+    token = service.open_session(driver)
+    status, payload = duber.handle_api_request(service, "GET", f"/orders/available?{query}",
+                                               {"authorization": f"Bearer {token}"}, b"")
+    assert status == 400, payload
+
+
+def test_available_with_zero_limit(duber, service, driver):
+    token = service.open_session(driver)
+    status, payload = duber.handle_api_request(service, "GET", "/orders/available?limit=0",
+                                               {"authorization": f"Bearer {token}"}, b"")
+    assert status == 200
+    assert len(payload["orders"]) == 1
@@ -0,0 +1,26 @@
+def test_listing_is_the_same_from_cache_and_database(service, passenger, driver):
+    for _ in range(3):
+        order = service.create_order(passenger, "Ул. Страничная, д. 1", "Ул. Страничная, д. 2", "10:00", 300, 5.0)
+        service.accept_order(driver, order['order_id'])
+
+    for user in (passenger, driver):
+        service.profiles.clear()
+        cold = service.user_orders(user, limit=2)
+        warm = service.user_orders(user, limit=2)
+        assert cold == warm
+        assert len(cold[0]) == 2 and cold[1] is not None
+        rest, after = service.user_orders(user, cold[1])
+        assert after is None
+        assert not {order['order_id'] for order in rest} & {order['order_id'] for order in cold[0]}
+
+
+def test_warm_listing_reads_only_keys(service, passenger):
+    service.user_orders(passenger)
+    statements = []
+    with service.pool.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            service.order_listing(conn, passenger)
+        finally:
+            conn.set_trace_callback(None)
+    assert len(statements) == 1
@@ -0,0 +1,49 @@
+import sqlite3
+
+import pytest
+
+
+def aggregates(conn):
+    return {row[:2]: row[2:4] + (round(row[4] / row[5], 6),) for row in conn.execute("SELECT * FROM RatingAggregates")}
+
+
+def stored_rating(conn, driver):
+    return conn.execute("SELECT Rating FROM Drivers WHERE Driver_id = ?", (driver['id'],)).fetchone()[0]
+
+
+def test_migration_seeds_aggregates_from_static_ratings(duber, tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "old.db"))
+    try:
+        for version, script in duber.MIGRATIONS:
+            if version < 8:
+                conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;")
+        driver_id = conn.execute("INSERT INTO Drivers (Username, Rating) VALUES ('Старожил', 4.0)").lastrowid
+        conn.commit()
+
+        assert 8 in duber.migrate(conn)
+        count, total, decayed_sum, decayed_weight, _ = conn.execute("""
+            SELECT RatingCount, RatingSum, DecayedSum, DecayedWeight, DecayedAt
+            FROM RatingAggregates
+            WHERE User_type = 'driver' AND User_id = ?
+        """, (driver_id,)).fetchone()
+        assert (count, total) == (0, 0)
+        assert decayed_sum / decayed_weight == 4.0
+    finally:
+        conn.close()
+
+
+def test_first_rating_is_blended_with_static_rating(duber, service, passenger, driver):
+    with service.pool.connection() as conn:
+        conn.execute("UPDATE Drivers SET Rating = 5.0 WHERE Driver_id = ?", (driver['id'],))
+        conn.commit()
+
+    order = service.create_order(passenger, "Ул. Оценочная, д. 1", "Ул. Оценочная, д. 2", "10:00", 300, 5.0)
+    service.accept_order(driver, order['order_id'])
+    rated = service.rate_order(passenger, order['order_id'], 1)
+    assert rated['rating'] == pytest.approx(3.0, abs=0.01)
+
+    with service.pool.connection() as conn:
+        incremental = aggregates(conn)
+        duber.recompute_ratings(conn)
+        assert aggregates(conn) == incremental
+        assert stored_rating(conn, driver) == rated['rating']
@@ -0,0 +1,44 @@
+ROUTE = ("Ул. Красная Поляна, д. 2, подъезд 1", "Ул. Минина, д. 24")
+
+
+def stored_route(duber, conn):
+    return conn.execute("SELECT Trips FROM RouteEstimates WHERE Delivery_key = ? AND Final_key = ?",
+                        tuple(map(duber.route_address, ROUTE))).fetchone()
+
+
+def test_computed_route_is_stored_through_write_batcher(duber, service):
+    with service.pool.connection() as conn:
+        changes = conn.total_changes
+        [estimate] = service.routes.estimate_many(conn, [ROUTE])
+        assert estimate["distance_km"] > 0
+        assert conn.total_changes == changes
+        assert not conn.in_transaction
+
+    service.writes.call(lambda conn: None)
+    with service.pool.connection() as conn:
+        assert stored_route(duber, conn) == (0,)
+
+
+def test_estimator_without_batcher_does_not_write(duber, service):
+    estimator = duber.RouteEstimator()
+    with service.pool.connection() as conn:
+        changes = conn.total_changes
+        [estimate] = estimator.estimate_many(conn, [ROUTE])
+        assert estimate["distance_km"] > 0
+        assert conn.total_changes == changes
+        assert stored_route(duber, conn) is None
+
+
+def test_failed_route_store_is_counted(duber, service, monkeypatch, capsys):
+    def broken_store(conn, rows):
+        raise duber.sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(duber, "store_routes", broken_store)
+    with service.pool.connection() as conn:
+        service.routes.estimate_many(conn, [ROUTE])
+    service.writes.call(lambda conn: None)
+
+    assert service.routes.stats()["store_failed"] == 1
+    assert "database is locked" in capsys.readouterr().out
+    with service.pool.connection() as conn:
+        assert stored_route(duber, conn) is None
@@ -0,0 +1,51 @@
+import pytest
+
+
+@pytest.fixture
+def persistent(duber, service):
+    persistent = duber.DuberService(service.pool, persist_sessions=True)
+    yield persistent
+    persistent.close()
+
+
+def test_password_change_revokes_all_sessions(duber, persistent, passenger):
+    tokens = [persistent.open_session(passenger) for _ in range(2)]
+    assert all(persistent.session(token) for token in tokens)
+
+    assert persistent.change_password(passenger, "pass123", "новый-пароль") == 2
+
+    restarted = duber.SessionStore(persistent.pool)
+    for token in tokens:
+        assert persistent.session(token) is None
+        assert restarted.get(token) is None
+    with persistent.pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM Sessions WHERE User_id = ?", (passenger['id'],)).fetchone()[0] == 0
+
+
+def test_revocation_during_load_is_not_cached(duber, persistent, passenger):
+    token = persistent.open_session(passenger)
+    store = duber.SessionStore(persistent.pool)
+    remember = store.remember
+
+    def revoke_then_remember(*args, **kwargs):
+        store.invalidate_user(passenger['type'], passenger['id'])
+        remember(*args, **kwargs)
+
+    store.remember = revoke_then_remember
+    assert store.get(token) is None
+    assert store.get(token, load=False) is None
+    assert not store.by_user
+
+
+def test_unrelated_revocation_keeps_loaded_session(duber, persistent, passenger, driver):
+    token = persistent.open_session(passenger)
+    store = duber.SessionStore(persistent.pool)
+    remember = store.remember
+
+    def revoke_other_then_remember(*args, **kwargs):
+        store.invalidate_user(driver['type'], driver['id'])
+        remember(*args, **kwargs)
+
+    store.remember = revoke_other_then_remember
+    assert store.get(token)['id'] == passenger['id']
+    assert store.get(token, load=False)['id'] == passenger['id']
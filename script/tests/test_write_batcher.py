@@ -0,0 +1,119 @@
+import threading
+
+import pytest
+
+from storage import ConnectionPool, WriteBatcher
+
+
+@pytest.fixture
+def batcher(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "writes.db"))
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE Items (Name TEXT PRIMARY KEY)")
+        conn.commit()
+    batcher = WriteBatcher(pool, delay=0)
+    yield batcher
+    batcher.close()
+    pool.close()
+
+
+def submit_together(batcher, operations):
+    started, release = threading.Event(), threading.Event()
+
+    def hold(conn):
+        started.set()
+        release.wait(5)
+
+    batcher.submit(hold)
+    started.wait(5)
+    futures = [batcher.submit(*operation) for operation in operations]
+    release.set()
+    for future in futures:
+        future.exception(5)
+    batcher.call(lambda conn: None)
+    return futures
+
+
+def test_failed_operation_rolls_back_alone(batcher):
+    committed = []
+
+    def insert(conn, name, fail=False):
+        conn.execute("INSERT INTO Items (Name) VALUES (?)", (name,))
+        batcher.after_commit(committed.append, name)
+        if fail:
+            raise ValueError(name)
+        return name
+
+    first, broken, last = submit_together(batcher, [(insert, "first"), (insert, "broken", True), (insert, "last")])
+
+    assert first.result() == "first" and last.result() == "last"
+    assert isinstance(broken.exception(), ValueError)
+    assert committed == ["first", "last"]
+    with batcher.pool.connection() as conn:
+        assert sorted(row[0] for row in conn.execute("SELECT Name FROM Items")) == ["first", "last"]
+
+    stats = batcher.stats()
+    assert stats["largest_batch"] == 3
+    assert stats["failed"] == 1
+
+
+def test_hooks_dropped_when_commit_fails(batcher):
+    committed = []
+
+    def insert(conn, name):
+        conn.execute("INSERT INTO Items (Name) VALUES (?)", (name,))
+        batcher.after_commit(committed.append, name)
+
+    def break_transaction(conn):
+        conn.execute("ROLLBACK")
+        raise RuntimeError("транзакция потеряна")
+
+    futures = submit_together(batcher, [(insert, "lost"), (break_transaction,)])
+
+    assert all(future.exception() is not None for future in futures)
+    assert committed == []
+
+
+def test_after_commit_outside_batch(batcher):
+    with pytest.raises(RuntimeError):
+        batcher.after_commit(print)
+
+
+def test_profile_cache_not_filled_by_rolled_back_operation(service, passenger):
+    order = service.create_order(passenger, "Ул. Кэшевая, д. 1", "Ул. Кэшевая, д. 2", "10:00", 300, 5.0)
+    about_order_id = service.order_for_deletion(passenger, order['order_id'])['about_order_id']
+    service.profiles.clear()
+
+    def remove_then_fail(conn):
+        service.remove_order(conn, passenger, order['order_id'])
+        raise ValueError("отмена")
+
+    with pytest.raises(ValueError):
+        service.writes.call(remove_then_fail)
+    assert service.profiles.cached('about', {about_order_id}) == {}
+    assert service.order_for_deletion(passenger, order['order_id']) is not None
+
+    service.delete_order(passenger, order['order_id'])
+    assert service.profiles.cached('about', {about_order_id}) == {}
+    assert service.order_for_deletion(passenger, order['order_id']) is None
+
+
+def test_failing_hook_does_not_fail_committed_write(batcher, capsys):
+    committed = []
+
+    def broken_hook():
+        raise RuntimeError("кэш недоступен")
+
+    def insert(conn, name):
+        conn.execute("INSERT INTO Items (Name) VALUES (?)", (name,))
+        batcher.after_commit(broken_hook)
+        batcher.after_commit(committed.append, name)
+        return name
+
+    assert batcher.call(insert, "kept") == "kept"
+    batcher.call(lambda conn: None)
+    assert committed == ["kept"]
+    assert batcher.stats()["hook_errors"] == 1
+    assert "кэш недоступен" in capsys.readouterr().out
+    with batcher.pool.connection() as conn:
+        assert conn.execute("SELECT Name FROM Items").fetchall() == [("kept",)]